@@ -1,11 +1,16 @@
 from app.ai.llm_client import LLMClient
 from app.ai.prompt import build_summary_prompt
-from app.config import settings
+from app.models.finance import FinancialReport
 
 class AIAnalyst:
-    def __init__(self):
-        self.client = LLMClient(model=settings.MODEL)
+    def __init__(self, client: LLMClient):
+        # The app-wide client, see app.ai.llm_client.get_llm_client
+        self.client = client
 
-    async def generate_financial_insight(self, data: dict) -> str:
-        prompt = build_summary_prompt(data)
-        return await self.client.generate(prompt)
\ No newline at end of file
+    async def generate_financial_insight(self, report: FinancialReport) -> str:
+        messages = build_summary_prompt(report)
+        return await self.client.generate(messages)
+
+    def stream_financial_insight(self, report: FinancialReport):
+        messages = build_summary_prompt(report)
+        return self.client.generate_stream(messages)
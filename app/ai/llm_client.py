@@ -1,18 +1,171 @@
-from ollama import Client
+import asyncio
+import httpx
+import logging
+import time
+from collections import deque
+from fastapi import Depends, Request
+from ollama import AsyncClient, ResponseError
+from typing import Annotated
 from app.config import settings
+from app.ai.prompt import estimate_tokens
+from app.utils.metrics import LLM_CALL_SECONDS, LLM_TOKENS
+
+logger = logging.getLogger(__name__)
+
+
+class LLMUnavailableError(Exception):
+    """
+    The model server is saturated or keeps failing
+    """
+
+
 class LLMClient:
+    """
+    One async Ollama client per app (see the lifespan in app/main.py), so LLM calls never
+    block the event loop and share one connection pool and one concurrency limit
+    """
+
     def __init__(self, model: str):
         self.model = model
-        self.client = Client(host=settings.OLLAMA_HOST)
-    async def generate(self, prompt: str):
-        response = self.client.chat(
-            model=self.model,
-            messages=[
-                {
-                    "role": "system",
-                    "content": prompt,
-                },
-            ],
-        )
+        self.client = AsyncClient(host=settings.OLLAMA_HOST, timeout=settings.LLM_TIMEOUT)
+        # Bounds the generations running at once on the model host
+        self.semaphore = asyncio.Semaphore(settings.LLM_MAX_CONCURRENCY)
 
+        # Token counts of the latest calls and since the app started
+        self.calls = deque(maxlen=100)
+        self.total_calls = 0
+        self.total_prompt_tokens = 0
+        self.total_completion_tokens = 0
+
+    async def generate(self, messages: list[dict]):
+        """
+        Get a chat completion
+        :param messages: The chat messages to send, see app.ai.prompt.build_summary_prompt
+        :return the text of the completion
+        """
+        estimated = self._estimate(messages)
+        await self._acquire()
+        try:
+            started = time.perf_counter()
+            try:
+                response = await self._with_retries(
+                    lambda: self.client.chat(model=self.model, messages=messages)
+                )
+            except Exception:
+                LLM_CALL_SECONDS.labels(call="generate", outcome="error").observe(
+                    time.perf_counter() - started
+                )
+                raise
+        finally:
+            self.semaphore.release()
+
+        self._record("generate", estimated, response, started)
         return response['message']['content']
+
+    async def generate_stream(self, messages: list[dict]):
+        """
+        Stream the chunks of a chat completion as the model produces them
+        :param messages: The chat messages to send, see app.ai.prompt.build_summary_prompt
+        :return an async generator of ollama ChatResponse chunks, the last one has done=True and the token counts
+        """
+        estimated = self._estimate(messages)
+        await self._acquire()
+        try:
+            started = time.perf_counter()
+
+            async def open_stream():
+                # The request is only sent when the first chunk is awaited
+                stream = await self.client.chat(
+                    model=self.model, messages=messages, stream=True
+                )
+                return stream, await anext(stream)
+
+            try:
+                # Only opening the stream is retried, a stream that broke halfway can't be resumed
+                stream, first = await self._with_retries(open_stream)
+                last = first
+                yield first
+                async for part in stream:
+                    last = part
+                    yield part
+            except Exception:
+                LLM_CALL_SECONDS.labels(call="stream", outcome="error").observe(
+                    time.perf_counter() - started
+                )
+                raise
+            self._record("stream", estimated, last, started)
+        finally:
+            self.semaphore.release()
+
+    def _estimate(self, messages: list[dict]):
+        return sum(estimate_tokens(message["content"]) for message in messages)
+
+    def _record(self, call: str, estimated: int, response, started: float):
+        # The final response of a generation carries the token counts measured by the model server
+        elapsed = time.perf_counter() - started
+        prompt_tokens = response.get("prompt_eval_count") or 0
+        completion_tokens = response.get("eval_count") or 0
+        self.total_calls += 1
+        self.total_prompt_tokens += prompt_tokens
+        self.total_completion_tokens += completion_tokens
+        usage = {
+            "estimated_prompt_tokens": estimated,
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "elapsed_ms": round(elapsed * 1000, 1),
+        }
+        self.calls.append(usage)
+
+        LLM_CALL_SECONDS.labels(call=call, outcome="ok").observe(elapsed)
+        LLM_TOKENS.labels(kind="prompt").inc(prompt_tokens)
+        LLM_TOKENS.labels(kind="completion").inc(completion_tokens)
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("LLM call", extra={"call": call, "model": self.model, **usage})
+
+    def stats(self):
+        return {
+            "model": self.model,
+            "calls": self.total_calls,
+            "prompt_tokens": self.total_prompt_tokens,
+            "completion_tokens": self.total_completion_tokens,
+            "recent_calls": list(self.calls),
+        }
+
+    async def _acquire(self):
+        try:
+            await asyncio.wait_for(
+                self.semaphore.acquire(), timeout=settings.LLM_QUEUE_TIMEOUT
+            )
+        except asyncio.TimeoutError:
+            raise LLMUnavailableError("Too many AI requests in progress, try again later")
+
+    async def _with_retries(self, call):
+        # Transport errors, timeouts and overloaded/failing servers are retried with exponential backoff
+        for attempt in range(settings.LLM_MAX_RETRIES + 1):
+            try:
+                return await call()
+            # ollama reports connection failures as a builtin ConnectionError
+            except (httpx.TransportError, ConnectionError, ResponseError) as e:
+                retryable = not isinstance(e, ResponseError) or e.status_code in (
+                    429,
+                    500,
+                    502,
+                    503,
+                    504,
+                )
+                if not retryable:
+                    raise
+                if attempt == settings.LLM_MAX_RETRIES:
+                    raise LLMUnavailableError(f"The AI model is unavailable: {e}")
+                await asyncio.sleep(settings.LLM_RETRY_BACKOFF * 2**attempt)
+
+    async def aclose(self):
+        await self.client.close()
+
+
+def get_llm_client(request: Request) -> LLMClient:
+    # Created once in the lifespan of the app
+    return request.app.state.llm_client
+
+
+LLMClientDep = Annotated[LLMClient, Depends(get_llm_client)]
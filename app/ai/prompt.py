@@ -1,23 +1,107 @@
-import json
+from app.config import settings
+from app.models.finance import AnomalyReport, FinancialReport
+import math
 
-SYSTEM_RULES = """
-You are a financial explanation assistant.
+# Bump whenever the prompt changes, cached insights are keyed by it
+PROMPT_VERSION = "3"
+
+# Sent unchanged with every request, the model server can reuse its prefix cache
+SYSTEM_PROMPT = """You are a financial explanation assistant.
+The user message is a pre-calculated monthly financial summary.
+It may list unusual transactions and category totals compared with the user's own history, point them out.
+Explain the user's financial situation clearly and cautiously and analyze the financial health of the month.
 
 Rules:
 - Do NOT perform calculations
 - Do NOT create new numbers
 - Do NOT change provided values
 - Do NOT infer missing data
-- Only explain and suggest based on given information
-"""
+- Only explain and suggest based on given information"""
+
+# Rough characters per token of English text and numbers, used to size prompts before sending
+_CHARS_PER_TOKEN = 4
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Estimate the number of tokens of a text without a tokenizer
+    :param text: Prompt text
+    :return an estimated token count
+    """
+    return math.ceil(len(text) / _CHARS_PER_TOKEN)
+
+
+def render_report(report: FinancialReport, top_n: int) -> str:
+    """
+    Render a report as a compact table: the top_n spending categories, the rest folded into "other"
+    :param report: A monthly report
+    :param top_n: The number of categories listed one by one
+    :return the user content of the prompt
+    """
+    lines = [
+        f"Period: {report.period_start:%Y-%m-%d} to {report.period_end:%Y-%m-%d}",
+        f"Income: {report.total_income:.2f}",
+        f"Expenses: {report.total_expense:.2f}",
+        f"Net savings: {report.net_savings:.2f}",
+    ]
+
+    categories = report.top_spending_categories
+    if not categories:
+        lines.append("No spending this month")
+        return "\n".join(lines)
+
+    lines.append("Spending by category (category|total|transactions):")
+    lines.extend(
+        f"{category.category}|{category.total:.2f}|{category.count}"
+        for category in categories[:top_n]
+    )
+
+    rest = categories[top_n:]
+    if rest:
+        lines.append(
+            f"other ({len(rest)} categories)"
+            f"|{sum(category.total for category in rest):.2f}"
+            f"|{sum(category.count for category in rest)}"
+        )
+
+    if report.anomalies is not None:
+        lines.extend(render_anomalies(report.anomalies))
+
+    return "\n".join(lines)
 
 
-def build_summary_prompt(data: dict):
-    return f"""
-{SYSTEM_RULES}
+def render_anomalies(anomalies: AnomalyReport, top_n: int = settings.PROMPT_TOP_CATEGORIES):
+    """
+    Render the unusual spending of a report as compact tables, at most top_n rows each
+    :param anomalies: The anomalies of the report's period
+    :return a list of lines, empty when nothing was flagged
+    """
+    lines = []
+    if anomalies.transactions:
+        lines.append("Unusual transactions (date|category|amount|typical amount):")
+        lines.extend(
+            f"{item.occurred_at:%Y-%m-%d}|{item.category}|{item.amount:.2f}|{item.typical_amount:.2f}"
+            for item in anomalies.transactions[:top_n]
+        )
+    if anomalies.category_months:
+        lines.append("Unusual category totals (category|total|typical monthly total):")
+        lines.extend(
+            f"{item.category}|{item.total:.2f}|{item.typical_total:.2f}"
+            for item in anomalies.category_months[:top_n]
+        )
+    return lines
 
-Here is a pre-calculated financial summary (JSON):
-{json.dumps(data, indent=2)}
 
-Explain the user's financial situation clearly and cautiously. Analyze the financial health of this month based on the data provided.
-"""
+def build_summary_prompt(
+    report: FinancialReport, top_n: int = settings.PROMPT_TOP_CATEGORIES
+):
+    """
+    Build the chat messages asking for the insight of a report
+    :param report: A monthly report
+    :param top_n: The number of categories listed one by one
+    :return a list of chat messages, the fixed system prompt first
+    """
+    return [
+        {"role": "system", "content": SYSTEM_PROMPT},
+        {"role": "user", "content": render_report(report, top_n)},
+    ]
@@ -0,0 +1,72 @@
+"""
+Maintenance commands, e.g.
+    python -m app.cli rollups rebuild [--user-id ID]
+    python -m app.cli rollups verify [--user-id ID]
+    python -m app.cli users deactivate|activate USER_ID
+"""
+import argparse
+import asyncio
+import json
+import sys
+from uuid import UUID
+from app.db.db import init_db
+from app.db.session import session_scope
+from app.services.rollup_service import rebuild_rollups, verify_rollups
+from app.services.user_service import set_user_active
+
+
+async def rollups(action: str, user_id: str | None):
+    await init_db()
+    async with session_scope() as session:
+        if action == "rebuild":
+            await rebuild_rollups(session=session, user_id=user_id)
+            print("Rollups rebuilt")
+            return 0
+
+        mismatches = await verify_rollups(session=session, user_id=user_id)
+        print(json.dumps(mismatches, indent=2))
+        print(f"{len(mismatches)} mismatched rollup rows", file=sys.stderr)
+        return 1 if mismatches else 0
+
+
+async def users(action: str, user_id: str):
+    await init_db()
+    async with session_scope() as session:
+        found = await set_user_active(
+            user_id=user_id, is_active=action == "activate", session=session
+        )
+    if not found:
+        print(f"User {user_id} not found", file=sys.stderr)
+        return 1
+    # Running apps pick the change up within REVOCATION_REFRESH_INTERVAL seconds
+    print(f"User {user_id} {action}d")
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m app.cli")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    rollups_parser = commands.add_parser(
+        "rollups", help="Backfill or reconcile monthly_category_rollups"
+    )
+    rollups_parser.add_argument("action", choices=["rebuild", "verify"])
+    rollups_parser.add_argument("--user-id", help="Only this user (default: all users)")
+
+    users_parser = commands.add_parser(
+        "users", help="Deactivate a user (their tokens are rejected) or activate them again"
+    )
+    users_parser.add_argument("action", choices=["deactivate", "activate"])
+    users_parser.add_argument("user_id")
+
+    args = parser.parse_args()
+    # IDs are bound as UUIDs (SQLite has no native UUID type)
+    user_id = UUID(args.user_id) if args.user_id else None
+    if args.command == "rollups":
+        return asyncio.run(rollups(args.action, user_id))
+    if args.command == "users":
+        return asyncio.run(users(args.action, user_id))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
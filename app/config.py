@@ -5,13 +5,98 @@ class Settings(BaseSettings):
     # Postgres Connection URL
     POSTGRES_URL: str
 
+    # Connection pool of the async engine
+    DB_POOL_SIZE: int = 10
+    DB_MAX_OVERFLOW: int = 20
+
+    # Comma-separated URLs of read replicas, read-only routes use them in turn (empty: primary only)
+    POSTGRES_REPLICA_URLS: str = ""
+    # Seconds between replica health checks, and how long one may take
+    REPLICA_HEALTH_INTERVAL: float = 5.0
+    REPLICA_HEALTH_TIMEOUT: float = 2.0
+    # Reads of a user stay on the primary this many seconds after their own write (must exceed replica lag)
+    READ_YOUR_WRITES_WINDOW: float = 5.0
+
     APP_ENV: str = "development"
 
+    # Leveled logging, LOG_FORMAT is json (one object per line) or text
+    LOG_LEVEL: str = "INFO"
+    LOG_FORMAT: str = "json"
+    # INFO logs every SQL statement, DEBUG also the result rows
+    SQL_LOG_LEVEL: str = "WARNING"
+
     SECRET_KEY: str
 
+    # bcrypt cost factor (log2 of the rounds), hashes with another cost are rehashed at login
+    PASSWORD_HASH_ROUNDS: int = 12
+    # Threads hashing and verifying passwords, off the event loop
+    PASSWORD_HASH_WORKERS: int = 4
+
+    # Validated tokens kept until they expire, user records kept for /profile
+    TOKEN_CACHE_SIZE: int = 10000
+    USER_CACHE_SIZE: int = 10000
+    USER_CACHE_TTL: float = 300.0
+    # Seconds between reloads of the deactivated users, changes made by other processes apply within it
+    REVOCATION_REFRESH_INTERVAL: float = 30.0
+
     MODEL: str
 
+    # Number of (user, category name, category type) -> category ID entries kept in memory
+    CATEGORY_CACHE_SIZE: int = 10000
+
+    # Maximum number of transactions accepted by one bulk request
+    BULK_MAX_ITEMS: int = 10000
+
+    # Number of statement lines parsed and loaded into the staging table at a time
+    IMPORT_CHUNK_SIZE: int = 5000
+
+    # Exports: rows fetched from the cursor and encoded at a time, gzip level of CSV exports
+    # (a fast level keeps compression from being the bottleneck)
+    EXPORT_BATCH_SIZE: int = 10000
+    EXPORT_GZIP_LEVEL: int = 1
+
+    # Monthly reports cached in memory, writes invalidate them, the TTL bounds any staleness
+    REPORT_CACHE_SIZE: int = 10000
+    REPORT_CACHE_TTL: float = 300.0
+
+    # Most buckets (days, weeks or months) a range report may have
+    REPORT_RANGE_MAX_BUCKETS: int = 1000
+
+    # Spending anomalies: robust z-score above which an amount is flagged, transactions (or months with
+    # spending) a category needs before it has a baseline, most items flagged per request
+    ANOMALY_THRESHOLD: float = 3.5
+    ANOMALY_MIN_SAMPLES: int = 6
+    ANOMALY_MAX_RESULTS: int = 50
+
+    # Recurring payments: users whose grouped history is kept in memory and refreshed with new
+    # transactions only, seconds before it is rebuilt (picks up changes made through other processes)
+    RECURRING_CACHE_SIZE: int = 100
+    RECURRING_CACHE_TTL: float = 3600.0
+
+    # AI insights cached by content, optionally persisted in the ai_insights table
+    INSIGHT_CACHE_SIZE: int = 1000
+    INSIGHT_CACHE_PERSIST: bool = False
+
     OLLAMA_HOST: str
+
+    # Shared LLM client: seconds per call, generations in flight, seconds to wait for a slot
+    LLM_TIMEOUT: float = 120.0
+    LLM_MAX_CONCURRENCY: int = 2
+    LLM_QUEUE_TIMEOUT: float = 30.0
+    # Retries of failed calls, waiting LLM_RETRY_BACKOFF * 2^attempt seconds in between
+    LLM_MAX_RETRIES: int = 2
+    LLM_RETRY_BACKOFF: float = 0.5
+
+    # Spending categories listed one by one in the AI prompt, the rest are summed as "other"
+    PROMPT_TOP_CATEGORIES: int = 8
+
+    # Background insight jobs: worker tasks, queued jobs accepted, seconds a finished job stays pollable
+    INSIGHT_JOB_WORKERS: int = 2
+    INSIGHT_JOB_QUEUE_SIZE: int = 100
+    INSIGHT_JOB_RETENTION: float = 3600.0
+    # Longest long-poll of a job, in seconds
+    INSIGHT_JOB_MAX_WAIT: float = 30.0
+
     class Config:
         # Path to the .env file
         env_file = ".env.development"
@@ -3,7 +3,10 @@ from app.db.engine import engine
 
 # Force db models to be imported
 import app.models.db.models
+from app.models.db.transaction_db import create_search_indexes
 
 
 async def init_db():
-    SQLModel.metadata.create_all(engine)
+    async with engine.begin() as conn:
+        await conn.run_sync(SQLModel.metadata.create_all)
+        await conn.run_sync(create_search_indexes)
@@ -1,5 +1,68 @@
-from sqlmodel import create_engine
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 from app.config import settings
+from app.utils.metrics import instrument_engine
+
+
+def _async_url(url: str):
+    """
+    Make sure the connection URL uses an async driver
+    :param url: A database URL (postgresql://... is mapped to postgresql+asyncpg://...)
+    :return a URL that can be used by an async engine
+    """
+    parsed = make_url(url)
+    if parsed.drivername in ("postgres", "postgresql", "postgresql+psycopg2"):
+        parsed = parsed.set(drivername="postgresql+asyncpg")
+    return parsed
+
+
+def _create_engine(url: str):
+    # Statements are logged through the sqlalchemy.engine logger, see SQL_LOG_LEVEL
+    return create_async_engine(
+        _async_url(url),
+        pool_size=settings.DB_POOL_SIZE,
+        max_overflow=settings.DB_MAX_OVERFLOW,
+        pool_pre_ping=True,
+    )
+
 
 # Create an Engine to hold the connection to the database
-engine = create_engine(settings.POSTGRES_URL, echo=True)
+engine = _create_engine(settings.POSTGRES_URL)
+instrument_engine(engine, name="primary")
+
+# Read-only copies of the primary, sessions are routed to them by app.db.replicas
+replica_engines = [
+    _create_engine(url.strip())
+    for url in settings.POSTGRES_REPLICA_URLS.split(",")
+    if url.strip()
+]
+for index, replica in enumerate(replica_engines):
+    instrument_engine(replica, name=f"replica{index}")
+
+
+# Rows per multi-row INSERT ... VALUES, a statement takes at most 32767 bind parameters (asyncpg)
+INSERT_CHUNK_ROWS = 1000
+
+
+def row_chunks(rows: list, size: int = INSERT_CHUNK_ROWS):
+    """
+    Split the rows of a multi-row insert so that each statement stays under the parameter limit
+    :param rows: A list of rows
+    :param size: The number of rows per chunk
+    :return a generator of lists of rows
+    """
+    for start in range(0, len(rows), size):
+        yield rows[start : start + size]
+
+
+def dialect_insert(table):
+    """
+    Build an INSERT for the engine's dialect, which supports ON CONFLICT clauses
+    :param table: A table model
+    :return an INSERT construct
+    """
+    if engine.dialect.name == "sqlite":
+        return sqlite_insert(table)
+    return postgresql_insert(table)
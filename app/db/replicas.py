@@ -0,0 +1,115 @@
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncEngine
+from sqlmodel.ext.asyncio.session import AsyncSession
+from fastapi import Depends
+from typing import Annotated
+from app.config import settings
+from app.db.engine import engine, replica_engines
+from app.db.session import session_scope
+from app.utils.jwt_handler import jwt_required
+from app.utils.lru_cache import LRUCache
+from app.utils.metrics import DB_READ_SESSIONS, DB_REPLICA_HEALTHY
+import asyncio
+import itertools
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class ReplicaRouter:
+    """
+    Picks the engine of read-only sessions: the healthy replicas in turn, or the primary
+    when no replica is healthy or the user wrote within the read-your-writes window
+    """
+
+    def __init__(self, primary: AsyncEngine, replicas: list[AsyncEngine], sticky_window: float):
+        self.primary = primary
+        self.replicas = replicas
+        # Replicas are assumed healthy until a check fails
+        self.healthy = [True] * len(replicas)
+        self._turn = itertools.count()
+        # user_id -> True, for sticky_window seconds after a committed write of the user
+        self._recent_writers = LRUCache(maxsize=100000, ttl=sticky_window)
+
+        for index in range(len(replicas)):
+            DB_REPLICA_HEALTHY.labels(replica=f"replica{index}").set(1)
+
+    def mark_write(self, user_id):
+        """
+        Keep the reads of a user on the primary until the replicas have their write
+        :param user_id: The user who just committed a write
+        """
+        if self.replicas:
+            self._recent_writers.set(str(user_id), True)
+
+    def engine_for(self, user_id=None) -> AsyncEngine:
+        """
+        :param user_id: The user the read is for, if any
+        :return the engine a read-only session should use
+        """
+        if not self.replicas:
+            return self.primary
+
+        if user_id is not None and str(user_id) in self._recent_writers:
+            DB_READ_SESSIONS.labels(target="sticky_primary").inc()
+            return self.primary
+
+        healthy = [
+            replica for replica, ok in zip(self.replicas, self.healthy) if ok
+        ]
+        if not healthy:
+            DB_READ_SESSIONS.labels(target="primary").inc()
+            return self.primary
+
+        DB_READ_SESSIONS.labels(target="replica").inc()
+        return healthy[next(self._turn) % len(healthy)]
+
+    async def _ping(self, replica: AsyncEngine):
+        async with replica.connect() as connection:
+            await connection.execute(text("SELECT 1"))
+
+    async def check_health(self):
+        """
+        Ping every replica, a replica that fails or is too slow gets no reads until it recovers
+        """
+        for index, replica in enumerate(self.replicas):
+            try:
+                await asyncio.wait_for(
+                    self._ping(replica), timeout=settings.REPLICA_HEALTH_TIMEOUT
+                )
+                ok = True
+            except Exception as e:
+                ok = False
+                if self.healthy[index]:
+                    logger.warning(
+                        "Read replica is unhealthy", extra={"replica": index, "error": str(e)}
+                    )
+
+            if ok and not self.healthy[index]:
+                logger.info("Read replica recovered", extra={"replica": index})
+            self.healthy[index] = ok
+            DB_REPLICA_HEALTHY.labels(replica=f"replica{index}").set(int(ok))
+
+    async def watch(self, interval: float):
+        """
+        Check the replicas every interval seconds, until cancelled
+        :param interval: Seconds between checks
+        """
+        while True:
+            await self.check_health()
+            await asyncio.sleep(interval)
+
+
+# Shared by the read-only routes and the services that write
+replica_router = ReplicaRouter(
+    engine, replica_engines, sticky_window=settings.READ_YOUR_WRITES_WINDOW
+)
+
+
+async def get_read_session(payload: dict = Depends(jwt_required)):
+    # A session for read-only routes, on a replica unless the user has just written
+    async with session_scope(bind=replica_router.engine_for(payload.get("sub"))) as session:
+        yield session
+
+
+ReadSessionDep = Annotated[AsyncSession, Depends(get_read_session)]
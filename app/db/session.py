@@ -1,14 +1,48 @@
-from sqlmodel import Session
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncEngine
+from sqlmodel.ext.asyncio.session import AsyncSession
 from app.db.engine import engine
 from fastapi import Depends
-from typing import Annotated
+from typing import Annotated, Callable
+from contextlib import asynccontextmanager
 """
 A session is what stores the objs in memory and keeps track of any changes needed in the data, then it uses the engine to
 communicate with the database
 """
-def get_session():
+@asynccontextmanager
+async def session_scope(bind: AsyncEngine | None = None):
+    # A session that isn't tied to a request (e.g. a streaming response body that outlives the dependency)
+    # expire_on_commit=False keeps loaded objs usable after commit without another round trip
+    # bind is the primary engine unless a read replica is given (see app.db.replicas)
+    async with AsyncSession(bind or engine, expire_on_commit=False) as session:
+        yield session
+
+
+async def get_session():
     # Make this generator acted as a FastAPI dependency
-    with Session(engine) as session:
+    async with session_scope() as session:
         yield session # yield allows cleanup after request finishes
 
-SessionDep = Annotated[Session, Depends(get_session)]
\ No newline at end of file
+SessionDep = Annotated[AsyncSession, Depends(get_session)]
+
+
+def on_commit(session: AsyncSession, callback: Callable[[], None]):
+    """
+    Run a callback once the current DB transaction of the session is committed
+    (in-process caches must not see rows that could still be rolled back)
+    :param session: A workspace for interacting with db
+    :param callback: A function without arguments
+    """
+    session.sync_session.info.setdefault("on_commit", []).append(callback)
+
+
+@event.listens_for(Session, "after_commit")
+def _run_on_commit_callbacks(session: Session):
+    for callback in session.info.pop("on_commit", []):
+        callback()
+
+
+@event.listens_for(Session, "after_rollback")
+def _drop_on_commit_callbacks(session: Session):
+    session.info.pop("on_commit", None)
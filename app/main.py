@@ -1,20 +1,57 @@
-from fastapi import FastAPI
+from fastapi import FastAPI, Response
 from fastapi.middleware.cors import CORSMiddleware
 from contextlib import asynccontextmanager
+from prometheus_client import generate_latest, CONTENT_TYPE_LATEST
+import asyncio
+import logging
 from app.db.db import init_db
 from app.config import settings
+from app.ai.llm_client import LLMClient
+from app.services.insight_jobs import InsightJobQueue
+from app.services.user_service import watch_revoked_users
+from app.db.replicas import replica_router
 from app.routes import auth, transaction, finance
+from app.utils.log import configure_logging
+from app.utils.metrics import MetricsMiddleware
+
+configure_logging()
+logger = logging.getLogger(__name__)
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    print(f"Starting application in {settings.APP_ENV} environment...")
+    logger.info("Starting application", extra={"app_env": settings.APP_ENV})
     try:
         await init_db()
-        print("Database connection initialized successfully.")
-    except Exception as e:
-        print(f"An error occurred while initializing the database: {e}")
+        logger.info("Database connection initialized successfully")
+    except Exception:
+        logger.exception("An error occurred while initializing the database")
+
+    # One LLM client (and connection pool) for the lifetime of the app
+    app.state.llm_client = LLMClient(model=settings.MODEL)
+
+    # Insight jobs run on background workers, not on the requests that submit them
+    app.state.insight_jobs = InsightJobQueue(
+        workers=settings.INSIGHT_JOB_WORKERS,
+        maxsize=settings.INSIGHT_JOB_QUEUE_SIZE,
+        retention=settings.INSIGHT_JOB_RETENTION,
+    )
+    await app.state.insight_jobs.start(app.state.llm_client)
+
+    # Deactivated users are checked in memory on every request, reloaded in the background
+    revocations = asyncio.create_task(
+        watch_revoked_users(settings.REVOCATION_REFRESH_INTERVAL)
+    )
+
+    # Read replicas that fail their health check get no reads until they recover
+    replica_health = asyncio.create_task(
+        replica_router.watch(settings.REPLICA_HEALTH_INTERVAL)
+    )
     yield
+    replica_health.cancel()
+    revocations.cancel()
+    await app.state.insight_jobs.stop()
+    await app.state.llm_client.aclose()
 
 
 app = FastAPI(
@@ -33,6 +70,9 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Latency of every request, served with the other metrics at /metrics
+app.add_middleware(MetricsMiddleware)
+
 # Register API route
 app.include_router(auth.router, prefix="/api/v1/auth", tags=["Authentication"])
 app.include_router(transaction.router, prefix="/api/v1", tags=["Transaction"])
@@ -41,4 +81,10 @@ app.include_router(finance.router, prefix="/api/v1/finance", tags=["Finance"])
 # Root endpoint for health checks or basic info
 @app.get("/")
 async def root():
-    return {"message": "Welcome to A conversation with Your Money!"}
\ No newline at end of file
+    return {"message": "Welcome to A conversation with Your Money!"}
+
+
+# Prometheus scrape endpoint
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
@@ -0,0 +1,7 @@
+from sqlmodel import SQLModel, Field
+
+class InsightJobCreate(SQLModel):
+    year: int
+    month: int = Field(ge=1, le=12)
+    # Regenerate the insight even if the month's numbers haven't changed
+    refresh: bool = False
@@ -1,7 +1,7 @@
 from sqlmodel import SQLModel, Field
 from datetime import datetime
 from uuid import UUID
-from typing import Optional, Literal
+from typing import Optional, Literal, List
 
 class TransactionBase(SQLModel):
     occurred_at: datetime = Field(index=True) 
@@ -20,6 +20,7 @@ class TransactionRead(TransactionBase):
     direction: str
     description: Optional[str]
     occurred_at: datetime
+    created_at: datetime
     category_name: str
     category_type: str
 
@@ -28,6 +29,21 @@ class TransactionResponse(SQLModel):
     transaction: TransactionRead
 
 
+class TransactionBulkItemResult(SQLModel):
+    # Position of the item in the request body
+    index: int
+    status: Literal["created", "error"]
+    transaction: Optional[TransactionRead] = None
+    detail: Optional[str] = None
+
+
+class TransactionBulkResponse(SQLModel):
+    status: str
+    created: int
+    failed: int
+    results: List[TransactionBulkItemResult]
+
+
 class TransactionUpdate(SQLModel):
     amount: Optional[float] = None
     description: Optional[str] = None
@@ -0,0 +1,20 @@
+from sqlmodel import SQLModel, Field
+from uuid import UUID
+
+
+class CategoryAmountHistogram(SQLModel, table=True):
+    """
+    Number of a user's transactions per category, direction and log-scale amount bucket,
+    the baseline of the spending anomalies (see rollup_service.amount_bucket).
+    Maintained in the same DB transaction as every write to transactions.
+    """
+    __tablename__ = "category_amount_histograms"
+
+    # Primary Key
+    user_id: UUID = Field(foreign_key="users.user_id", primary_key=True)
+    category_id: UUID = Field(foreign_key="categories.category_id", primary_key=True)
+    # Income is "in", expense is "out"
+    direction: str = Field(primary_key=True)
+    bucket: int = Field(primary_key=True)
+
+    count: int = 0
@@ -1,10 +1,14 @@
 from app.models.api.category import CategoryBase
-from sqlmodel import Field
+from sqlmodel import Field, DateTime, UniqueConstraint
 from uuid import UUID, uuid4
 from datetime import datetime, timezone
 
 class Category(CategoryBase, table=True):
     __tablename__ = "categories"
+    __table_args__ = (
+        # A user has one category per name and type, this is the get-or-create conflict target
+        UniqueConstraint("user_id", "name", "type", name="uq_categories_user_id_name_type"),
+    )
     # Primary Key
     category_id: UUID = Field(default_factory=uuid4, primary_key=True)
     user_id : UUID = Field(foreign_key="users.user_id", index=True)
@@ -13,4 +17,7 @@ class Category(CategoryBase, table=True):
     name: str = Field(index=True)
     type: str = Field(index=True)
 
-    created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
\ No newline at end of file
+    created_at: datetime = Field(
+        default_factory=lambda: datetime.now(timezone.utc),
+        sa_type=DateTime(timezone=True),
+    )
\ No newline at end of file
@@ -0,0 +1,20 @@
+from sqlmodel import SQLModel, Field, DateTime
+from datetime import datetime, timezone
+
+
+class AIInsight(SQLModel, table=True):
+    """
+    AI insights persisted under the hash of (report, prompt version, model)
+    """
+    __tablename__ = "ai_insights"
+
+    # Primary Key
+    insight_key: str = Field(primary_key=True)
+    model: str
+    prompt_version: str
+    insight: str
+
+    created_at: datetime = Field(
+        default_factory=lambda: datetime.now(timezone.utc),
+        sa_type=DateTime(timezone=True),
+    )
@@ -3,4 +3,7 @@ Ensure that SQLModel knows all tables
 """
 from app.models.db.user_db import User
 from app.models.db.category_db import Category
-from app.models.db.transaction_db import Transaction
\ No newline at end of file
+from app.models.db.transaction_db import Transaction
+from app.models.db.rollup_db import MonthlyCategoryRollup
+from app.models.db.insight_db import AIInsight
+from app.models.db.amount_histogram_db import CategoryAmountHistogram
\ No newline at end of file
@@ -0,0 +1,21 @@
+from sqlmodel import SQLModel, Field
+from uuid import UUID
+
+
+class MonthlyCategoryRollup(SQLModel, table=True):
+    """
+    Sum and count of a user's transactions per month, category and direction.
+    Maintained in the same DB transaction as every write to transactions.
+    """
+    __tablename__ = "monthly_category_rollups"
+
+    # Primary Key
+    user_id: UUID = Field(foreign_key="users.user_id", primary_key=True)
+    year: int = Field(primary_key=True)
+    month: int = Field(primary_key=True)
+    category_id: UUID = Field(foreign_key="categories.category_id", primary_key=True)
+    # Income is "in", expense is "out"
+    direction: str = Field(primary_key=True)
+
+    total: float = 0.0
+    count: int = 0
@@ -1,11 +1,21 @@
 from app.models.api.transaction import TransactionBase
-from sqlmodel import Field
+from sqlmodel import Field, DateTime, Index, func
+from sqlalchemy import literal_column
+from sqlalchemy.schema import CreateIndex
 from uuid import UUID, uuid4
 from datetime import datetime, timezone
 from typing import Optional, Literal
 
 class Transaction(TransactionBase, table=True):
     __tablename__ = "transactions"
+    __table_args__ = (
+        # Serves the per-user date range scans of reports and listings
+        Index("ix_transactions_user_id_occurred_at", "user_id", "occurred_at"),
+        # Re-importing a statement must not create the same transactions twice
+        Index(
+            "uq_transactions_user_id_import_hash", "user_id", "import_hash", unique=True
+        ),
+    )
 
     # Primary Key
     transaction_id: UUID = Field(default_factory=uuid4, primary_key=True)
@@ -17,7 +27,78 @@ class Transaction(TransactionBase, table=True):
     direction   : str = Field(index=True) 
 
     description: Optional[str]
-    occurred_at: datetime
+    # Timezone-aware column, asyncpg rejects aware datetimes for plain TIMESTAMP
+    occurred_at: datetime = Field(sa_type=DateTime(timezone=True), index=True)
 
-    created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
+    created_at: datetime = Field(
+        default_factory=lambda: datetime.now(timezone.utc),
+        sa_type=DateTime(timezone=True),
+    )
 
+    # Content hash of an imported statement line (NONE for transactions recorded through the API)
+    import_hash: Optional[str] = Field(default=None)
+
+
+def search_document(description):
+    """
+    Text search document of a description (Postgres), words as they are without stemming since
+    descriptions are mostly merchant names. A search must use this same expression to hit the index.
+    :param description: The description column
+    :return a tsvector expression
+    """
+    return func.to_tsvector(
+        literal_column("'simple'::regconfig"),
+        func.coalesce(description, literal_column("''")),
+    )
+
+
+# Postgres: a GIN index over the search documents. Attached explicitly, the table is not found
+# from a column nested in functions
+search_index = Index(
+    "ix_transactions_description_search",
+    search_document(Transaction.description),
+    postgresql_using="gin",
+).ddl_if(dialect="postgresql")
+Transaction.__table__.append_constraint(search_index)
+
+# SQLite: an FTS5 table kept in sync by triggers. The user ID is indexed with the description so
+# that a search only reads the postings of one user, the transaction ID so that a row is found to
+# be removed (the implicit rowid of transactions is not stable across a VACUUM)
+_SQLITE_SEARCH_TRIGGERS = (
+    """CREATE TRIGGER IF NOT EXISTS transactions_fts_insert AFTER INSERT ON transactions BEGIN
+    INSERT INTO transactions_fts (transaction_id, user_id, description)
+    VALUES (new.transaction_id, new.user_id, new.description);
+END""",
+    """CREATE TRIGGER IF NOT EXISTS transactions_fts_delete AFTER DELETE ON transactions BEGIN
+    DELETE FROM transactions_fts WHERE transactions_fts MATCH 'transaction_id:' || old.transaction_id;
+END""",
+    """CREATE TRIGGER IF NOT EXISTS transactions_fts_update AFTER UPDATE OF description ON transactions BEGIN
+    UPDATE transactions_fts SET description = new.description
+    WHERE transactions_fts MATCH 'transaction_id:' || new.transaction_id;
+END""",
+)
+
+
+def create_search_indexes(connection):
+    """
+    Create the search index of the transactions if it is missing, so that a database created
+    before search existed gets it at startup. A new FTS5 table is filled from the existing rows
+    before its triggers are created, in the same transaction.
+    :param connection: A sync connection (run through run_sync)
+    """
+    if connection.dialect.name == "postgresql":
+        connection.execute(CreateIndex(search_index, if_not_exists=True))
+    elif connection.dialect.name == "sqlite":
+        exists = connection.exec_driver_sql(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'transactions_fts'"
+        ).first()
+        if exists is None:
+            connection.exec_driver_sql(
+                "CREATE VIRTUAL TABLE transactions_fts USING fts5(transaction_id, user_id, description)"
+            )
+            connection.exec_driver_sql(
+                "INSERT INTO transactions_fts (transaction_id, user_id, description) "
+                "SELECT transaction_id, user_id, description FROM transactions"
+            )
+        for statement in _SQLITE_SEARCH_TRIGGERS:
+            connection.exec_driver_sql(statement)
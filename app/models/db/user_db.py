@@ -1,13 +1,21 @@
 from app.models.api.user import UserBase
-from sqlmodel import Field
+from sqlmodel import Field, DateTime, UniqueConstraint
 from uuid import UUID, uuid4
 from datetime import datetime, timezone
 
 
 class User(UserBase, table=True):
     __tablename__ = "users"
+    __table_args__ = (
+        # Registration relies on these to reject taken usernames and emails in one insert
+        UniqueConstraint("username", name="uq_users_username"),
+        UniqueConstraint("user_email", name="uq_users_user_email"),
+    )
     # Primary Key
     user_id: UUID = Field(default_factory=uuid4, primary_key=True)
     hashed_password: str
     is_active: bool = Field(default=True)
-    created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
+    created_at: datetime = Field(
+        default_factory=lambda: datetime.now(timezone.utc),
+        sa_type=DateTime(timezone=True),
+    )
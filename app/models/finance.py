@@ -1,6 +1,7 @@
 from pydantic import BaseModel, ConfigDict
-from datetime import datetime
-from typing import List, Dict
+from datetime import date, datetime
+from typing import List, Literal, Optional
+from uuid import UUID
 
 
 class CategorySummary(BaseModel):
@@ -11,6 +12,34 @@ class CategorySummary(BaseModel):
     count: int
 
 
+class TransactionAnomaly(BaseModel):
+    transaction_id: UUID
+    category: str
+    amount: float
+    occurred_at: datetime
+    description: Optional[str] = None
+    # Median amount of the category's transactions
+    typical_amount: float
+    # Robust z-score of the amount against the category's median and MAD
+    score: float
+
+
+class CategoryMonthAnomaly(BaseModel):
+    category: str
+    # YYYY-MM
+    month: str
+    total: float
+    # Median of the category's monthly totals
+    typical_total: float
+    score: float
+
+
+class AnomalyReport(BaseModel):
+    # Highest score first
+    transactions: List[TransactionAnomaly]
+    category_months: List[CategoryMonthAnomaly]
+
+
 class FinancialReport(BaseModel):
     period_start: datetime
     period_end: datetime
@@ -18,7 +47,57 @@ class FinancialReport(BaseModel):
     total_expense: float
     net_savings: float
     top_spending_categories: List[CategorySummary]
+    # Unusual spending of the period, only attached for the AI insight
+    anomalies: Optional[AnomalyReport] = None
     
     # This ensures the LLM gets a string representation of decimals 
     # to avoid JSON float parsing errors later
-    model_config = ConfigDict(json_encoders={float: str})
\ No newline at end of file
+    model_config = ConfigDict(json_encoders={float: str})
+
+
+class CategoryTrend(BaseModel):
+    category: str
+    # Spending per month, aligned with TrendReport.months
+    totals: List[float]
+    # Change from the previous month, and relative to it (NONE when the previous month is 0)
+    month_over_month: List[float]
+    month_over_month_pct: List[Optional[float]]
+    # Average of the last 3 and 12 months, including months before the report
+    rolling_3_month_avg: List[float]
+    rolling_12_month_avg: List[float]
+    # Share of the month's spending, and of the whole period's
+    share: List[float]
+    period_share: float
+
+
+class TrendReport(BaseModel):
+    # Months of the report as YYYY-MM, oldest first
+    months: List[str]
+    total_expense: List[float]
+    # Largest spending over the period first
+    categories: List[CategoryTrend]
+
+
+class RecurringSeries(BaseModel):
+    # Description of the latest occurrence
+    description: Optional[str] = None
+    category: str
+    direction: str
+    cadence: Literal["weekly", "biweekly", "monthly", "yearly"]
+    # Median of the latest occurrences
+    amount: float
+    occurrences: int
+    first_date: date
+    last_date: date
+    next_expected: date
+    # The amount spread over a month (weekly is 52/12 times the amount)
+    monthly_cost: float
+    # FALSE once the next expected occurrence is overdue
+    active: bool
+
+
+class RecurringReport(BaseModel):
+    # Highest monthly cost first
+    series: List[RecurringSeries]
+    # Monthly cost of the active expenses
+    total_monthly_cost: float
@@ -1,7 +1,7 @@
 from fastapi import APIRouter, HTTPException, Depends
 from app.utils.jwt_handler import (
-    get_password_hash,
-    verify_password,
+    hash_password,
+    verify_and_update_password,
     create_backend_token,
     jwt_required,
 )
@@ -10,8 +10,8 @@ from app.db.session import SessionDep
 from app.services.user_service import (
     get_user_by_email_from_db,
     create_user_in_db,
-    get_user_by_username_from_db,
-    get_user_by_user_id_from_db)
+    get_cached_user,
+    update_user_password_hash)
 
 # Define router
 router = APIRouter()
@@ -26,29 +26,15 @@ async def register(user_data: UserCreate, session: SessionDep):
     :return 201: A successful message indicates that the user's information is saved in the db
     """
 
-    # Check if their username is already registered
-    existing_username = await get_user_by_username_from_db(user_data.username, session)
-    if existing_username:
-        raise HTTPException(
-            status_code=400, detail=f"{existing_username.username} already registered"
-        )
-
-    # Check if they already registered by using the email
-    existing_email = await get_user_by_email_from_db(user_data.user_email, session)
-    if existing_email:
-        raise HTTPException(
-            status_code=400, detail=f"{existing_email.user_email} already registered"
-        )
-
     # Hash the input password
     try:
-        hashed_password = get_password_hash(user_data.password)
+        hashed_password = await hash_password(user_data.password)
     except Exception as e:
         raise HTTPException(
             status_code=400, detail=f"An error occurred while hashing the password: {e}"
         )
 
-    # Create new user into a db
+    # Create new user into a db, a taken username or email is rejected by the insert
     user = await create_user_in_db(
         user_data.username, user_data.user_email, hashed_password, session
     )
@@ -68,11 +54,20 @@ async def login(credentials: UserLogin, session: SessionDep):
     user = await get_user_by_email_from_db(credentials.email, session)
 
     # Compare the input password with the hashed password stored in db
-    if not user or not verify_password(credentials.password, user.hashed_password):
+    verified, new_hash = (
+        await verify_and_update_password(credentials.password, user.hashed_password)
+        if user
+        else (False, None)
+    )
+    if not verified:
         raise HTTPException(
             status_code=401, detail=f"Invalid Email or Password! Please try again!"
         )
 
+    # The cost factor changed since the password was hashed
+    if new_hash:
+        await update_user_password_hash(user, new_hash, session)
+
     # Generate backend token
     backend_token = create_backend_token(id=str(user.user_id))
 
@@ -96,8 +91,8 @@ async def get_profile(session: SessionDep, payload: dict = Depends(jwt_required)
     # Get user id from the payload
     user_id = payload.get("sub")
 
-    # Retrieve user information from db using user_id
-    user = await get_user_by_user_id_from_db(user_id, session)
+    # Retrieve user information from the user cache, or db using user_id
+    user = await get_cached_user(user_id, session)
 
     if not user:
         raise HTTPException(status_code=404, detail="User not found!")
@@ -1,16 +1,178 @@
-from fastapi import APIRouter, HTTPException, Depends
+from fastapi import APIRouter, HTTPException, Depends, Request, Query
+from fastapi.responses import StreamingResponse
 from app.db.session import SessionDep
+from app.db.replicas import ReadSessionDep
 from app.utils.jwt_handler import jwt_required
-from app.services.finance import FinanceEngine
-from app.ai.ai_analyst import AIAnalyst
+from app.services.finance import FinanceEngine, bucket_count
+from app.services.anomaly_service import detect_anomalies
+from app.services.recurring_service import detect_recurring
+from app.services.insight_service import (
+    get_financial_insight,
+    stream_financial_insight,
+)
+from app.ai.llm_client import LLMClientDep, LLMUnavailableError
+from app.utils.disconnect import run_until_disconnected
+from app.utils.sse import sse_event
+from app.services.report_cache import report_cache
+from app.services.insight_jobs import InsightJobsDep, InsightQueueFullError
+from app.models.api.insight_job import InsightJobCreate
+from app.config import settings
+from datetime import date
+from typing import Literal
 
 # Define router
 router = APIRouter()
 
 
+@router.get("/report", status_code=200, response_model=dict)
+async def get_range_report(
+    session: ReadSessionDep,
+    payload: dict = Depends(jwt_required),
+    start: date = Query(alias="from"),
+    end: date = Query(alias="to"),
+    granularity: Literal["day", "week", "month"] = "month",
+):
+    """
+    Allow user to get how much they earned and spent per day, week or month of a date range in one call
+    :param session: A workspace for interacting with db
+    :param payload: Decoded JWT containing user claims (validated via jwt_required)
+    :param start: First day of the range (from)
+    :param end: Last day of the range, inclusive (to)
+    :param granularity: day, week or month
+    :return a successfull msg including a report per bucket, oldest first
+    """
+    if end < start:
+        raise HTTPException(status_code=400, detail="from must not be after to")
+
+    # Counted before any bucket is built, a range of centuries is rejected at once
+    if bucket_count(start, end, granularity) > settings.REPORT_RANGE_MAX_BUCKETS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"At most {settings.REPORT_RANGE_MAX_BUCKETS} {granularity}s can be reported at once!",
+        )
+
+    # Get user id from the payload
+    user_id = payload.get("sub")
+
+    engine = FinanceEngine(db=session)
+
+    try:
+        reports = await engine.generate_range_report(
+            user_id=user_id, start=start, end=end, granularity=granularity
+        )
+    except Exception as e:
+        raise HTTPException(
+            status_code=400, detail=f"An error occurred while getting the report: {e}"
+        )
+
+    return {"status": "success", "granularity": granularity, "reports": reports}
+
+
+@router.get("/trends", status_code=200, response_model=dict)
+async def get_trend_report(
+    session: ReadSessionDep,
+    payload: dict = Depends(jwt_required),
+    months: int = Query(12, ge=1, le=120),
+    year: int | None = None,
+    month: int | None = Query(None, ge=1, le=12),
+):
+    """
+    Allow user to see how the spending of each category moves month over month
+    :param session: A workspace for interacting with db
+    :param payload: Decoded JWT containing user claims (validated via jwt_required)
+    :param months: Number of months up to the last one
+    :param year: Year of the last month (default: the current month)
+    :param month: The last month (default: the current month)
+    :return a successfull msg including the trend report
+    """
+    # Get user id from the payload
+    user_id = payload.get("sub")
+
+    engine = FinanceEngine(db=session)
+
+    try:
+        trends = await engine.generate_trend_report(
+            user_id=user_id, months=months, year=year, month=month
+        )
+    except Exception as e:
+        raise HTTPException(
+            status_code=400, detail=f"An error occurred while getting the trends: {e}"
+        )
+
+    return {"status": "success", "trends": trends}
+
+
+@router.get("/anomalies", status_code=200, response_model=dict)
+async def get_anomalies(
+    session: ReadSessionDep,
+    payload: dict = Depends(jwt_required),
+    start: date | None = Query(None, alias="from"),
+    end: date | None = Query(None, alias="to"),
+    threshold: float = Query(settings.ANOMALY_THRESHOLD, gt=0),
+    limit: int = Query(settings.ANOMALY_MAX_RESULTS, ge=1, le=1000),
+):
+    """
+    Allow user to see which expenses and which months of a category are unusually high
+    compared with their own history
+    :param session: A workspace for interacting with db
+    :param payload: Decoded JWT containing user claims (validated via jwt_required)
+    :param start: First day of the range, from (default: the whole history)
+    :param end: Last day of the range, inclusive, to (default: the latest transaction)
+    :param threshold: Robust z-score (median/MAD) above which an amount is flagged
+    :param limit: Most transactions and category-months returned
+    :return a successfull msg including the flagged transactions and category-months
+    """
+    if start is not None and end is not None and end < start:
+        raise HTTPException(status_code=400, detail="from must not be after to")
+
+    # Get user id from the payload
+    user_id = payload.get("sub")
+
+    try:
+        anomalies = await detect_anomalies(
+            user_id, session, start=start, end=end, threshold=threshold, limit=limit
+        )
+    except Exception as e:
+        raise HTTPException(
+            status_code=400, detail=f"An error occurred while detecting the anomalies: {e}"
+        )
+
+    return {"status": "success", "anomalies": anomalies}
+
+
+@router.get("/recurring", status_code=200, response_model=dict)
+async def get_recurring(
+    session: SessionDep,
+    payload: dict = Depends(jwt_required),
+    include_inactive: bool = False,
+):
+    """
+    Allow user to see what they pay every week, month or year
+    :param session: A workspace for interacting with db (the primary, transactions are read
+        incrementally by creation time and a lagging replica could skip some)
+    :param payload: Decoded JWT containing user claims (validated via jwt_required)
+    :param include_inactive: Also list the series whose next payment is overdue
+    :return a successfull msg including the recurring series and their monthly cost
+    """
+    # Get user id from the payload
+    user_id = payload.get("sub")
+
+    try:
+        recurring = await detect_recurring(
+            user_id, session, include_inactive=include_inactive
+        )
+    except Exception as e:
+        raise HTTPException(
+            status_code=400,
+            detail=f"An error occurred while detecting the recurring payments: {e}",
+        )
+
+    return {"status": "success", "recurring": recurring}
+
+
 @router.get("/report/{year}/{month}", status_code=200, response_model=dict)
 async def get_report(
-    year: int, month: int, session: SessionDep, payload: dict = Depends(jwt_required)
+    year: int, month: int, session: ReadSessionDep, payload: dict = Depends(jwt_required)
 ):
     """
     Allow user to get the report of how much they earned and spent
@@ -26,7 +188,9 @@ async def get_report(
     engine = FinanceEngine(db=session)
 
     try:
-        report = engine.generate_monthly_report(user_id=user_id, month=month, year=year)
+        report = await engine.get_monthly_report(
+            user_id=user_id, month=month, year=year
+        )
     except Exception as e:
         raise HTTPException(
             status_code=400, detail=f"An error occurred while getting the report: {e}"
@@ -37,14 +201,23 @@ async def get_report(
 
 @router.get("/insights/summary/{year}/{month}", status_code=200, response_model=dict)
 async def get_ai_summary(
-    year: int, month: int, session: SessionDep, payload: dict = Depends(jwt_required)
+    year: int,
+    month: int,
+    request: Request,
+    session: SessionDep,
+    llm_client: LLMClientDep,
+    payload: dict = Depends(jwt_required),
+    refresh: bool = False,
 ):
     """
     Allow user to get the AI insight about their monthly spending
     :param year: The year of all transactions
     :param month: The month of transactions
+    :param request: The incoming request, the generation is cancelled if its client disconnects
     :param session: A workspace for interacting with db
+    :param llm_client: The app-wide LLM client
     :param payload: Decoded JWT containing user claims (validated via jwt_required)
+    :param refresh: Regenerate the insight even if the month's numbers haven't changed
     :return a successfull msg including the AI report
     """
 
@@ -53,10 +226,177 @@ async def get_ai_summary(
 
     engine = FinanceEngine(db=session)
 
-    report = engine.generate_monthly_report(user_id=user_id, month=month, year=year)
+    report = await engine.get_monthly_report(
+        user_id=user_id, month=month, year=year
+    )
+
+    try:
+        insight, cached = await run_until_disconnected(
+            request,
+            get_financial_insight(
+                report=report,
+                session=session,
+                llm_client=llm_client,
+                refresh=refresh,
+                user_id=user_id,
+            ),
+        )
+    except LLMUnavailableError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+
+    return {
+        "status": "success",
+        "report": report,
+        "ai_insight": insight,
+        "cached": cached,
+    }
+
+
+@router.get("/insights/summary/{year}/{month}/stream", status_code=200)
+async def stream_ai_summary(
+    year: int,
+    month: int,
+    session: SessionDep,
+    llm_client: LLMClientDep,
+    payload: dict = Depends(jwt_required),
+    refresh: bool = False,
+):
+    """
+    Allow user to get the AI insight about their monthly spending as server-sent events:
+    a "report" event right away, "token" events as the model writes, then a "done" event with timings and token counts
+    :param year: The year of all transactions
+    :param month: The month of transactions
+    :param session: A workspace for interacting with db
+    :param llm_client: The app-wide LLM client
+    :param payload: Decoded JWT containing user claims (validated via jwt_required)
+    :param refresh: Regenerate the insight even if the month's numbers haven't changed
+    :return a text/event-stream response
+    """
+
+    # Get user id from the payload
+    user_id = payload.get("sub")
+
+    engine = FinanceEngine(db=session)
+
+    report = await engine.get_monthly_report(user_id=user_id, month=month, year=year)
+
+    async def events():
+        try:
+            async for event, data in stream_financial_insight(
+                report=report, llm_client=llm_client, refresh=refresh, user_id=user_id
+            ):
+                yield sse_event(event, data)
+        except LLMUnavailableError as e:
+            yield sse_event("error", {"detail": str(e)})
+        except HTTPException as e:
+            yield sse_event("error", {"detail": e.detail})
+
+    # The generation is cancelled with the response if the client disconnects
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@router.post("/insights/jobs", status_code=202, response_model=dict)
+async def create_insight_job(
+    body: InsightJobCreate,
+    session: SessionDep,
+    insight_jobs: InsightJobsDep,
+    payload: dict = Depends(jwt_required),
+):
+    """
+    Allow user to request the AI insight about their monthly spending without waiting for the model.
+    Identical requests in flight share one job.
+    :param body: The year and month of the insight
+    :param session: A workspace for interacting with db
+    :param insight_jobs: The app-wide insight job queue
+    :param payload: Decoded JWT containing user claims (validated via jwt_required)
+    :return a successfull msg including the job to poll
+    """
+
+    # Get user id from the payload
+    user_id = payload.get("sub")
+
+    engine = FinanceEngine(db=session)
+
+    report = await engine.get_monthly_report(
+        user_id=user_id, month=body.month, year=body.year
+    )
+
+    try:
+        job = insight_jobs.submit(
+            user_id=user_id,
+            year=body.year,
+            month=body.month,
+            report=report,
+            refresh=body.refresh,
+        )
+    except InsightQueueFullError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+
+    return {"status": "success", "job": job.to_dict()}
+
+
+@router.get("/insights/jobs/stats", status_code=200, response_model=dict)
+async def get_insight_job_stats(
+    insight_jobs: InsightJobsDep, payload: dict = Depends(jwt_required)
+):
+    """
+    Queue depth and latency of the insight jobs
+    :param insight_jobs: The app-wide insight job queue
+    :param payload: Decoded JWT containing user claims (validated via jwt_required)
+    :return a successfull msg including the job statistics
+    """
+    return {"status": "success", "insight_jobs": insight_jobs.stats()}
+
+
+@router.get("/insights/jobs/{job_id}", status_code=200, response_model=dict)
+async def get_insight_job(
+    job_id: str,
+    insight_jobs: InsightJobsDep,
+    payload: dict = Depends(jwt_required),
+    wait: float = 0,
+):
+    """
+    Allow user to poll an insight job
+    :param job_id: The ID of the job
+    :param insight_jobs: The app-wide insight job queue
+    :param payload: Decoded JWT containing user claims (validated via jwt_required)
+    :param wait: Seconds to hold the request until the job finishes (long-poll), 0 returns right away
+    :return a successfull msg including the job, with the insight once it succeeded
+    """
+
+    # Get user id from the payload
+    user_id = payload.get("sub")
+
+    job = insight_jobs.get(job_id=job_id, user_id=user_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Insight job not found")
+
+    if wait > 0 and not job.done.is_set():
+        job = await insight_jobs.wait(job, timeout=min(wait, settings.INSIGHT_JOB_MAX_WAIT))
 
-    ai_analyst = AIAnalyst()
+    return {"status": "success", "job": job.to_dict()}
 
-    insight = await ai_analyst.generate_financial_insight(data=report.model_dump_json())
 
-    return {"status": "success", "report": report, "ai_insight": insight}
+@router.get("/insights/llm/stats", status_code=200, response_model=dict)
+async def get_llm_stats(llm_client: LLMClientDep, payload: dict = Depends(jwt_required)):
+    """
+    Prompt and completion token counts of the LLM calls
+    :param llm_client: The app-wide LLM client
+    :param payload: Decoded JWT containing user claims (validated via jwt_required)
+    :return a successfull msg including the token counts
+    """
+    return {"status": "success", "llm": llm_client.stats()}
+
+
+@router.get("/cache/stats", status_code=200, response_model=dict)
+async def get_report_cache_stats(payload: dict = Depends(jwt_required)):
+    """
+    Hit/miss counters of the monthly report cache
+    :param payload: Decoded JWT containing user claims (validated via jwt_required)
+    :return a successfull msg including the cache statistics
+    """
+    return {"status": "success", "report_cache": report_cache.stats()}
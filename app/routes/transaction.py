@@ -1,18 +1,31 @@
-from fastapi import APIRouter, HTTPException, Depends
+from fastapi import APIRouter, HTTPException, Depends, Query, UploadFile
+from fastapi.responses import StreamingResponse
 from app.models.api.transaction import (
     TransactionCreate,
     TransactionResponse,
     TransactionRead,
     TransactionUpdate,
+    TransactionBulkResponse,
 )
 from app.db.session import SessionDep
+from app.db.replicas import ReadSessionDep, replica_router
 from app.utils.jwt_handler import jwt_required
-from app.services.category_service import get_category, add_category, get_category_by_id
+from app.config import settings
+from app.services.import_service import parse_csv, parse_ofx, import_statement
+from app.services.export_service import EXPORT_FORMATS, export_transactions
+from typing import Literal
+from datetime import date
+from uuid import UUID
+from app.services.category_service import get_or_create_category_id
 from app.services.transaction_service import (
     add_transaction,
+    add_transactions_bulk,
     get_list_transactions,
     get_transaction_by_id,
+    get_transaction_read_by_id,
     remove_transaction,
+    search_transactions,
+    stream_transactions,
     update_transaction_in_db,
 )
 
@@ -42,24 +55,18 @@ async def create_transaction(
     # Get user id from the payload
     user_id = payload.get("sub")
 
-    # Find or create category
-    category = await get_category(
-        category_name=data.category_name,
+    # Find or create category, it is committed together with the transaction
+    category_id = await get_or_create_category_id(
         user_id=user_id,
+        category_name=data.category_name,
+        category_type=data.category_type,
         session=session,
     )
 
-    if not category:
-        category = await add_category(
-            user_id=user_id,
-            category_name=data.category_name,
-            category_type=data.category_type,
-            session=session,
-        )
     # Create transaction
     transaction = await add_transaction(
         user_id=user_id,
-        category_id=category.category_id,
+        category_id=category_id,
         amount=data.amount,
         direction=direction,
         occurred_at=data.occurred_at,
@@ -75,54 +82,255 @@ async def create_transaction(
         direction=transaction.direction,
         description=transaction.description,
         occurred_at=transaction.occurred_at,
-        category_name=category.name,
-        category_type=category.type,
+        created_at=transaction.created_at,
+        category_name=data.category_name,
+        category_type=data.category_type,
     )
 
     return {"status": "success", "transaction": transaction_read}
 
 
+@router.post(
+    "/transactions/bulk", status_code=201, response_model=TransactionBulkResponse
+)
+async def create_transactions_bulk(
+    data: list[TransactionCreate],
+    session: SessionDep,
+    payload: dict = Depends(jwt_required),
+):
+    """
+    Allow users to record many transactions at once (e.g. a bank sync or an offline queue)
+    :param payload: Decoded JWT containing user claims (validated via jwt_required)
+    :param data: Details of the transactions
+    :param session: A workspace for interacting with db
+    :return a result per transaction, in the same order as the request
+    """
+
+    if len(data) > settings.BULK_MAX_ITEMS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"At most {settings.BULK_MAX_ITEMS} transactions can be sent at once!",
+        )
+
+    # Get user id from the payload
+    user_id = payload.get("sub")
+
+    results = await add_transactions_bulk(user_id=user_id, items=data, session=session)
+    created = sum(1 for result in results if result.status == "created")
+
+    return {
+        "status": "success",
+        "created": created,
+        "failed": len(results) - created,
+        "results": results,
+    }
+
+
+@router.post("/transactions/import", status_code=201)
+async def import_transactions(
+    file: UploadFile,
+    session: SessionDep,
+    payload: dict = Depends(jwt_required),
+    format: Literal["csv", "ofx"] | None = None,
+    date_column: str = "date",
+    amount_column: str = "amount",
+    description_column: str = "description",
+    category_column: str = "category",
+    type_column: str = "type",
+    date_format: str | None = None,
+    default_category: str = "Uncategorized",
+):
+    """
+    Allow users to import a bank statement (CSV or OFX), lines imported before are skipped
+    :param file: The statement file (multipart upload)
+    :param payload: Decoded JWT containing user claims (validated via jwt_required)
+    :param session: A workspace for interacting with db
+    :param format: csv or ofx, guessed from the file name if not given
+    :param date_column: CSV column of the date (ISO 8601 unless date_format is given)
+    :param amount_column: CSV column of the amount (negative amounts are expenses when there is no type)
+    :param description_column: CSV column of the description
+    :param category_column: CSV column of the category name
+    :param type_column: CSV column of the category type (income/expense)
+    :param date_format: strptime format of the CSV dates
+    :param default_category: Category of lines without one (every OFX line)
+    :return a summary of the imported, duplicated and skipped lines
+    """
+
+    # Get user id from the payload
+    user_id = payload.get("sub")
+
+    if format is None:
+        is_ofx = (file.filename or "").lower().endswith((".ofx", ".qfx"))
+        format = "ofx" if is_ofx else "csv"
+
+    if format == "ofx":
+        lines = parse_ofx(file.file, default_category=default_category)
+    else:
+        lines = parse_csv(
+            file.file,
+            date_column=date_column,
+            amount_column=amount_column,
+            description_column=description_column,
+            category_column=category_column,
+            type_column=type_column,
+            date_format=date_format,
+            default_category=default_category,
+        )
+
+    summary = await import_statement(
+        user_id=user_id,
+        lines=lines,
+        session=session,
+        chunk_size=settings.IMPORT_CHUNK_SIZE,
+    )
+
+    return {"status": "success", **summary}
+
+
 @router.get("/transactions", status_code=200)
-async def list_transactions(session: SessionDep, payload: dict = Depends(jwt_required)):
+async def list_transactions(
+    session: ReadSessionDep,
+    payload: dict = Depends(jwt_required),
+    limit: int = Query(100, ge=1, le=1000),
+    cursor: str | None = None,
+    stream: bool = False,
+):
     """
-    Allow users to retrieve the list of transactions that they made
+    Allow users to retrieve the list of transactions that they made, newest first
     :param payload: Decoded JWT containing user claims (validated via jwt_required)
     :param session: A workspace for interacting with db
-    :return a successful message with the list of transactions stored in db
+    :param limit: The maximum number of transactions in a page
+    :param cursor: The next_cursor of the previous page
+    :param stream: Stream the whole history as NDJSON instead of returning a page
+    :return a successful message with a page of transactions stored in db
     """
     # Get user id from the payload
     user_id = payload.get("sub")
 
-    transactions = await get_list_transactions(user_id=user_id, session=session)
+    if stream:
+        return StreamingResponse(
+            stream_transactions(
+                user_id=user_id, bind=replica_router.engine_for(user_id)
+            ),
+            media_type="application/x-ndjson"
+        )
+
+    transactions, next_cursor = await get_list_transactions(
+        user_id=user_id, session=session, limit=limit, cursor=cursor
+    )
 
-    if not transactions:
+    if not transactions and not cursor:
         raise HTTPException(status_code=404, detail=f"List is empty!")
 
-    # Format transactions with category information
-    transactions_list = []
-    for transaction in transactions:
-        category = await get_category_by_id(
-            id=transaction.category_id, user_id=user_id, session=session
+    return {
+        "status": "success",
+        "transactions": transactions,
+        "next_cursor": next_cursor,
+    }
+
+
+@router.get("/transactions/export", status_code=200)
+async def export_user_transactions(
+    payload: dict = Depends(jwt_required),
+    format: Literal["csv", "parquet", "arrow"] = "csv",
+    start: date | None = Query(None, alias="from"),
+    end: date | None = Query(None, alias="to"),
+):
+    """
+    Allow users to download their transactions with the category name and type, oldest first
+    :param payload: Decoded JWT containing user claims (validated via jwt_required)
+    :param format: csv (gzip-compressed), parquet or arrow (IPC stream)
+    :param start: First day exported, from (default: the whole history)
+    :param end: Last day exported, inclusive, to (default: the latest transaction)
+    :return a file streamed as it is encoded
+    """
+    if start is not None and end is not None and end < start:
+        raise HTTPException(status_code=400, detail="from must not be after to")
+
+    # Get user id from the payload
+    user_id = payload.get("sub")
+
+    media_type, extension = EXPORT_FORMATS[format]
+    chunks = export_transactions(
+        user_id=user_id,
+        format=format,
+        start=start,
+        end=end,
+        bind=replica_router.engine_for(user_id),
+    )
+
+    return StreamingResponse(
+        chunks,
+        media_type=media_type,
+        headers={
+            "Content-Disposition": f'attachment; filename="transactions.{extension}"'
+        },
+    )
+
+
+@router.get("/transactions/search", status_code=200)
+async def search_user_transactions(
+    session: ReadSessionDep,
+    payload: dict = Depends(jwt_required),
+    q: str | None = None,
+    start: date | None = Query(None, alias="from"),
+    end: date | None = Query(None, alias="to"),
+    direction: Literal["in", "out"] | None = None,
+    category: str | None = None,
+    min_amount: float | None = Query(None, ge=0),
+    max_amount: float | None = Query(None, ge=0),
+    limit: int = Query(100, ge=1, le=1000),
+    cursor: str | None = None,
+):
+    """
+    Allow users to find transactions by description and filters, newest first
+    :param payload: Decoded JWT containing user claims (validated via jwt_required)
+    :param session: A workspace for interacting with db
+    :param q: Words the description must have, the last one may be unfinished ("netfl")
+    :param start: First day searched, from (default: the whole history)
+    :param end: Last day searched, inclusive, to (default: the latest transaction)
+    :param direction: in (income) or out (expense)
+    :param category: Category name
+    :param min_amount: Lowest amount, inclusive
+    :param max_amount: Highest amount, inclusive
+    :param limit: The maximum number of transactions in a page
+    :param cursor: The next_cursor of the previous page
+    :return a successful message with a page of matching transactions
+    """
+    if start is not None and end is not None and end < start:
+        raise HTTPException(status_code=400, detail="from must not be after to")
+    if min_amount is not None and max_amount is not None and max_amount < min_amount:
+        raise HTTPException(
+            status_code=400, detail="min_amount must not be above max_amount"
         )
-        transaction_dict = {
-            "transaction_id": str(transaction.transaction_id),
-            "category_id": str(transaction.category_id),
-            "amount": transaction.amount,
-            "direction": transaction.direction,
-            "description": transaction.description,
-            "occurred_at": transaction.occurred_at,
-            "created_at": transaction.created_at,
-            "category_name": category.name,
-            "category_type": category.type,
-        }
-        transactions_list.append(transaction_dict)
-
-    return {"status": "success", "transactions": transactions_list}
+
+    # Get user id from the payload
+    user_id = payload.get("sub")
+
+    transactions, next_cursor = await search_transactions(
+        user_id=user_id,
+        session=session,
+        query=q,
+        start=start,
+        end=end,
+        direction=direction,
+        category_name=category,
+        min_amount=min_amount,
+        max_amount=max_amount,
+        limit=limit,
+        cursor=cursor,
+    )
+
+    return {
+        "status": "success",
+        "transactions": transactions,
+        "next_cursor": next_cursor,
+    }
 
 
 @router.get("/transaction/{id}", status_code=200, response_model=TransactionResponse)
 async def get_transaction(
-    id: str, session: SessionDep, payload: dict = Depends(jwt_required)
+    id: UUID, session: ReadSessionDep, payload: dict = Depends(jwt_required)
 ):
     """
     Allow users to retrieve the transaction the given ID
@@ -134,40 +342,20 @@ async def get_transaction(
     # Get user id from the payload
     user_id = payload.get("sub")
 
-    transaction = await get_transaction_by_id(
-        transaction_id=str(id), user_id=user_id, session=session
+    # Retrieve the transaction along with its category details
+    transaction = await get_transaction_read_by_id(
+        transaction_id=id, user_id=user_id, session=session
     )
 
     if not transaction:
         raise HTTPException(status_code=404, detail=f"There is no {id} transaction")
 
-    # Retrieve category details
-    category = await get_category_by_id(
-        id=transaction.category_id, user_id=user_id, session=session
-    )
-
-    if not category:
-        raise HTTPException(status_code=404, detail=f"There is no available category")
-
-    return {
-        "status": "success",
-        "transaction": {
-            "transaction_id": str(transaction.transaction_id),
-            "category_id": str(transaction.category_id),
-            "amount": transaction.amount,
-            "direction": transaction.direction,
-            "description": transaction.description,
-            "occurred_at": transaction.occurred_at,
-            "created_at": transaction.created_at,
-            "category_name": category.name,
-            "category_type": category.type,
-        },
-    }
+    return {"status": "success", "transaction": transaction}
 
 
 @router.delete("/transaction/{id}", status_code=200)
 async def delete_transaction(
-    id: str, session: SessionDep, payload: dict = Depends(jwt_required)
+    id: UUID, session: SessionDep, payload: dict = Depends(jwt_required)
 ):
     """
     Allow users to remove a transaction
@@ -181,21 +369,23 @@ async def delete_transaction(
 
     # Retrieve a transaction
     transaction = await get_transaction_by_id(
-        transaction_id=str(id), user_id=user_id, session=session
+        transaction_id=id, user_id=user_id, session=session
     )
 
     if not transaction:
         raise HTTPException(status_code=404, detail=f"There is no {id} transaction")
 
-    # Remove a transaction
-    await remove_transaction(transaction_id=id, user_id=user_id, session=session)
+    # Remove a transaction, unless a concurrent request removed it first
+    removed = await remove_transaction(transaction_id=id, user_id=user_id, session=session)
+    if not removed:
+        raise HTTPException(status_code=404, detail=f"There is no {id} transaction")
 
     return {"status": "success", "msg": "The transaction is removed"}
 
 
 @router.patch("/transaction/{id}", status_code=200, response_model=TransactionResponse)
 async def update_transaction(
-    id: str,
+    id: UUID,
     data: TransactionUpdate,
     session: SessionDep,
     payload: dict = Depends(jwt_required),
@@ -211,26 +401,13 @@ async def update_transaction(
     # Get user id from the payload
     user_id = payload.get("sub")
 
-    transaction = await update_transaction_in_db(
+    await update_transaction_in_db(
         transaction_id=id, user_id=user_id, data=data, session=session
     )
 
-    # Retrieve category details
-    category = await get_category_by_id(
-        id=transaction.category_id, user_id=user_id, session=session
+    # Retrieve the updated transaction along with its category details
+    transaction = await get_transaction_read_by_id(
+        transaction_id=id, user_id=user_id, session=session
     )
 
-    return {
-        "status": "success",
-        "transaction": {
-            "transaction_id": str(transaction.transaction_id),
-            "category_id": str(transaction.category_id),
-            "amount": transaction.amount,
-            "direction": transaction.direction,
-            "description": transaction.description,
-            "occurred_at": transaction.occurred_at,
-            "created_at": transaction.created_at,
-            "category_name": category.name,
-            "category_type": category.type,
-        },
-    }
+    return {"status": "success", "transaction": transaction}
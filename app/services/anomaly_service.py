@@ -0,0 +1,309 @@
+from app.models.db.amount_histogram_db import CategoryAmountHistogram
+from app.models.db.rollup_db import MonthlyCategoryRollup
+from app.models.db.category_db import Category
+from app.models.db.transaction_db import Transaction
+from app.db.session import SessionDep
+from app.models.finance import (
+    AnomalyReport,
+    CategoryMonthAnomaly,
+    FinancialReport,
+    TransactionAnomaly,
+)
+from app.services.rollup_service import BUCKET_RATIO
+from app.config import settings
+from sqlmodel import select, case
+from fastapi import HTTPException
+from datetime import date, datetime, timedelta, timezone
+import calendar
+import numpy as np
+
+# Scales the MAD of a normal distribution to its standard deviation (Iglewicz and Hoaglin)
+_MAD_SCALE = 0.6745
+
+
+def _weighted_median(values: np.ndarray, weights: np.ndarray):
+    """
+    :param values: Values sorted in ascending order
+    :param weights: Weight of each value
+    :return the smallest value with at least half of the weight at or below it
+    """
+    cumulative = weights.cumsum()
+    return values[np.searchsorted(cumulative, cumulative[-1] / 2)]
+
+
+def _spread(median: np.ndarray, mad: np.ndarray):
+    """
+    The MAD, floored to the precision of the baselines for when it is 0 (all values alike)
+    """
+    return np.maximum(mad, np.maximum(median * (BUCKET_RATIO - 1), 0.01))
+
+
+def _robust_scores(values: np.ndarray, median: np.ndarray, mad: np.ndarray):
+    """
+    Robust z-scores of values against a median and MAD
+    """
+    return _MAD_SCALE * (values - median) / _spread(median, mad)
+
+
+async def get_amount_baselines(user_id, session: SessionDep):
+    """
+    Median and MAD of the expense amounts of each category, from the precomputed amount histograms
+    :param user_id: A unique identifier for a user
+    :param session: A workspace for interacting with db
+    :return a dict of category ID -> (median, MAD, number of transactions)
+    """
+    rows = (
+        await session.exec(
+            select(
+                CategoryAmountHistogram.category_id,
+                CategoryAmountHistogram.bucket,
+                CategoryAmountHistogram.count,
+            )
+            .where(CategoryAmountHistogram.user_id == user_id)
+            .where(CategoryAmountHistogram.direction == "out")
+            .where(CategoryAmountHistogram.count > 0)
+            .order_by(CategoryAmountHistogram.category_id, CategoryAmountHistogram.bucket)
+        )
+    ).all()
+
+    # category ID -> (buckets, counts), rows are sorted by bucket
+    histograms = {}
+    for category_id, bucket, count in rows:
+        buckets, counts = histograms.setdefault(category_id, ([], []))
+        buckets.append(bucket)
+        counts.append(count)
+
+    baselines = {}
+    for category_id, (buckets, counts) in histograms.items():
+        # Every amount of a bucket counts as the geometric middle of the bucket
+        values = BUCKET_RATIO ** (np.array(buckets) + 0.5)
+        weights = np.array(counts)
+        median = _weighted_median(values, weights)
+        deviations = np.abs(values - median)
+        order = np.argsort(deviations, kind="stable")
+        mad = _weighted_median(deviations[order], weights[order])
+        baselines[category_id] = (float(median), float(mad), int(weights.sum()))
+
+    return baselines
+
+
+async def find_transaction_anomalies(
+    user_id,
+    session: SessionDep,
+    start: date | None = None,
+    end: date | None = None,
+    threshold: float = settings.ANOMALY_THRESHOLD,
+    limit: int = settings.ANOMALY_MAX_RESULTS,
+):
+    """
+    Flag the expenses that are unusually large for their category. The baselines are turned into
+    per-category constants of the score, so the scan, the scoring and the ranking are one query
+    and only the flagged rows leave the db.
+    :param user_id: A unique identifier for a user
+    :param session: A workspace for interacting with db
+    :param start: First day scanned, the whole history if NONE
+    :param end: Last day scanned (inclusive), up to the latest transaction if NONE
+    :param threshold: Robust z-score above which an expense is flagged
+    :param limit: Most expenses returned
+    :return a list of transaction anomalies, highest score first
+    """
+    baselines = {
+        category_id: baseline
+        for category_id, baseline in (await get_amount_baselines(user_id, session)).items()
+        if baseline[2] >= settings.ANOMALY_MIN_SAMPLES
+    }
+    if not baselines:
+        return []
+
+    medians = np.array([median for median, _, _ in baselines.values()])
+    mads = np.array([mad for _, mad, _ in baselines.values()])
+    # score = (amount - median) * factor
+    factors = _MAD_SCALE / _spread(medians, mads)
+
+    median = case(
+        {category_id: float(value) for category_id, value in zip(baselines, medians)},
+        value=Transaction.category_id,
+    )
+    factor = case(
+        {category_id: float(value) for category_id, value in zip(baselines, factors)},
+        value=Transaction.category_id,
+    )
+    score = ((Transaction.amount - median) * factor).label("score")
+
+    query = (
+        select(
+            Transaction.transaction_id,
+            Category.name,
+            Transaction.amount,
+            Transaction.occurred_at,
+            Transaction.description,
+            median.label("median"),
+            score,
+        )
+        .join(Category, Category.category_id == Transaction.category_id)
+        .where(Transaction.user_id == user_id)
+        .where(Transaction.direction == "out")
+        .where(Transaction.category_id.in_(list(baselines)))
+        .where(score > threshold)
+        .order_by(score.desc())
+        .limit(limit)
+    )
+    if start is not None:
+        query = query.where(
+            Transaction.occurred_at
+            >= datetime(start.year, start.month, start.day, tzinfo=timezone.utc)
+        )
+    # There is no day after date.max, the range is then open-ended
+    if end is not None and end < date.max:
+        query = query.where(
+            Transaction.occurred_at
+            < datetime(end.year, end.month, end.day, tzinfo=timezone.utc) + timedelta(days=1)
+        )
+
+    return [
+        TransactionAnomaly(
+            transaction_id=row.transaction_id,
+            category=row.name,
+            amount=row.amount,
+            occurred_at=row.occurred_at,
+            description=row.description,
+            typical_amount=round(row.median, 2),
+            score=round(row.score, 2),
+        )
+        for row in (await session.exec(query)).all()
+    ]
+
+
+async def find_category_month_anomalies(
+    user_id,
+    session: SessionDep,
+    start: date | None = None,
+    end: date | None = None,
+    threshold: float = settings.ANOMALY_THRESHOLD,
+    limit: int = settings.ANOMALY_MAX_RESULTS,
+):
+    """
+    Flag the months whose spending in a category is unusually high compared with the other months
+    the category had spending, from a (category x month) matrix of the rollups
+    :param user_id: A unique identifier for a user
+    :param session: A workspace for interacting with db
+    :param start: Months from the one of this day are flagged, all if NONE
+    :param end: Months up to the one of this day are flagged, all if NONE
+    :param threshold: Robust z-score above which a month is flagged
+    :param limit: Most months returned
+    :return a list of category-month anomalies, highest score first
+    """
+    month_index = MonthlyCategoryRollup.year * 12 + MonthlyCategoryRollup.month - 1
+    rows = (
+        await session.exec(
+            select(month_index, Category.name, MonthlyCategoryRollup.total)
+            .join(Category, Category.category_id == MonthlyCategoryRollup.category_id)
+            .where(MonthlyCategoryRollup.user_id == user_id)
+            .where(MonthlyCategoryRollup.direction == "out")
+            .where(MonthlyCategoryRollup.count > 0)
+        )
+    ).all()
+    if not rows:
+        return []
+
+    names = sorted({row[1] for row in rows})
+    first = min(row[0] for row in rows)
+    span = max(row[0] for row in rows) - first + 1
+
+    # Months without spending are NaN, they are not part of the category's history
+    matrix = np.zeros((len(names), span))
+    present = np.zeros((len(names), span), dtype=bool)
+    position = {name: index for index, name in enumerate(names)}
+    rows_index = np.fromiter((position[row[1]] for row in rows), dtype=np.intp, count=len(rows))
+    columns = np.fromiter((row[0] - first for row in rows), dtype=np.intp, count=len(rows))
+    np.add.at(
+        matrix,
+        (rows_index, columns),
+        np.fromiter((row[2] for row in rows), dtype=float, count=len(rows)),
+    )
+    present[rows_index, columns] = True
+    matrix[~present] = np.nan
+
+    # Every category has at least one month with spending
+    medians = np.nanmedian(matrix, axis=1)
+    mads = np.nanmedian(np.abs(matrix - medians[:, None]), axis=1)
+    scores = _robust_scores(matrix, medians[:, None], mads[:, None])
+
+    flagged = (
+        present
+        & (present.sum(axis=1) >= settings.ANOMALY_MIN_SAMPLES)[:, None]
+        & (scores > threshold)
+    )
+    if start is not None:
+        flagged[:, : max(0, start.year * 12 + start.month - 1 - first)] = False
+    if end is not None:
+        flagged[:, max(0, end.year * 12 + end.month - first) :] = False
+
+    categories, months = np.nonzero(flagged)
+    order = np.argsort(-scores[categories, months], kind="stable")[:limit]
+
+    return [
+        CategoryMonthAnomaly(
+            category=names[categories[index]],
+            month=f"{(first + months[index]) // 12}-{(first + months[index]) % 12 + 1:02d}",
+            total=round(float(matrix[categories[index], months[index]]), 2),
+            typical_total=round(float(medians[categories[index]]), 2),
+            score=round(float(scores[categories[index], months[index]]), 2),
+        )
+        for index in order
+    ]
+
+
+async def detect_anomalies(
+    user_id,
+    session: SessionDep,
+    start: date | None = None,
+    end: date | None = None,
+    threshold: float = settings.ANOMALY_THRESHOLD,
+    limit: int = settings.ANOMALY_MAX_RESULTS,
+) -> AnomalyReport:
+    """
+    Flag unusual expenses and unusual category-months of a date range,
+    against baselines over the user's whole history
+    :param user_id: A unique identifier for a user
+    :param session: A workspace for interacting with db
+    :param start: First day of the range, the whole history if NONE
+    :param end: Last day of the range (inclusive), up to the latest transaction if NONE
+    :param threshold: Robust z-score above which an item is flagged
+    :param limit: Most items of each kind returned
+    :return an anomaly report
+    """
+    return AnomalyReport(
+        transactions=await find_transaction_anomalies(
+            user_id, session, start=start, end=end, threshold=threshold, limit=limit
+        ),
+        category_months=await find_category_month_anomalies(
+            user_id, session, start=start, end=end, threshold=threshold, limit=limit
+        ),
+    )
+
+
+async def with_anomalies(report: FinancialReport, user_id, session: SessionDep):
+    """
+    Attach the anomalies of a report's period, as structured input of the AI insight
+    (only when an insight is generated, a cached insight does not need them)
+    :param report: A monthly report (left as it is, it may be shared by the report cache)
+    :param user_id: A unique identifier for a user
+    :param session: A workspace for interacting with db
+    :return a copy of the report with its anomalies
+    """
+    # The whole month, the period end of a report without totals is its first day
+    year, month = report.period_start.year, report.period_start.month
+    _, last_day = calendar.monthrange(year, month)
+    try:
+        anomalies = await detect_anomalies(
+            user_id,
+            session,
+            start=date(year, month, 1),
+            end=date(year, month, last_day),
+        )
+    except Exception as e:
+        raise HTTPException(
+            status_code=400, detail=f"An error occurred while detecting the anomalies: {e}"
+        )
+    return report.model_copy(update={"anomalies": anomalies})
@@ -1,7 +1,16 @@
 from app.models.db.category_db import Category
-from app.db.session import SessionDep
-from sqlmodel import select
+from app.db.session import SessionDep, on_commit
+from app.db.engine import dialect_insert, row_chunks
+from app.config import settings
+from app.utils.lru_cache import LRUCache
+from sqlmodel import select, tuple_
 from fastapi import HTTPException
+from uuid import uuid4
+from datetime import datetime, timezone
+
+# (user_id, category name, category type) -> category ID
+# Categories are never renamed or deleted, so an entry only has to wait for its row to be committed
+_category_cache = LRUCache(maxsize=settings.CATEGORY_CACHE_SIZE)
 
 
 async def get_category(category_name: str, user_id: str, session: SessionDep):
@@ -13,10 +22,12 @@ async def get_category(category_name: str, user_id: str, session: SessionDep):
     """
 
     try:
-        category = session.exec(
-            select(Category)
-            .where(Category.user_id == user_id)
-            .where(Category.name == category_name)
+        category = (
+            await session.exec(
+                select(Category)
+                .where(Category.user_id == user_id)
+                .where(Category.name == category_name)
+            )
         ).first()
     except Exception as e:
         raise HTTPException(
@@ -35,10 +46,12 @@ async def get_category_by_id(id: str, user_id: str, session: SessionDep):
     """
 
     try:
-        category = session.exec(
-            select(Category)
-            .where(Category.user_id == user_id)
-            .where(Category.category_id == id)
+        category = (
+            await session.exec(
+                select(Category)
+                .where(Category.user_id == user_id)
+                .where(Category.category_id == id)
+            )
         ).first()
     except Exception as e:
         raise HTTPException(
@@ -64,8 +77,8 @@ async def add_category(
         category = Category(user_id=user_id, name=category_name, type=category_type)
 
         session.add(category)
-        session.commit()
-        session.refresh(category)
+        await session.commit()
+        await session.refresh(category)
 
         return category
     except Exception as e:
@@ -73,3 +86,102 @@ async def add_category(
             status_code=400,
             detail=f"An error occurred while creating a new category in db: {e}",
         )
+
+
+async def get_or_create_category_ids(
+    user_id: str, categories: set[tuple[str, str]], session: SessionDep
+):
+    """
+    Resolve the IDs of several categories at once, creating missing ones, without committing
+    :param user_id: A unique identifier for a user.
+    :param categories: A set of (category name, category type)
+    :param session: A workspace for interacting with db
+    :return a dict of (category name, category type) -> category ID
+    """
+
+    resolved = {}
+    missing = []
+    for key in categories:
+        category_id = _category_cache.get((str(user_id), *key))
+        if category_id:
+            resolved[key] = category_id
+        else:
+            missing.append(key)
+
+    if not missing:
+        return resolved
+
+    try:
+        # Multi-row INSERT ... ON CONFLICT DO NOTHING RETURNING, only new rows are returned
+        now = datetime.now(timezone.utc)
+        new = {}
+        for chunk in row_chunks(missing):
+            created = (
+                await session.exec(
+                    dialect_insert(Category)
+                    .values(
+                        [
+                            {
+                                "category_id": uuid4(),
+                                "user_id": user_id,
+                                "name": category_name,
+                                "type": category_type,
+                                "created_at": now,
+                            }
+                            for category_name, category_type in chunk
+                        ]
+                    )
+                    .on_conflict_do_nothing(index_elements=["user_id", "name", "type"])
+                    .returning(Category.category_id, Category.name, Category.type)
+                )
+            ).all()
+            for row in created:
+                new[(row.name, row.type)] = row.category_id
+        resolved.update(new)
+
+        # The remaining categories already exist (and are committed)
+        existing = [key for key in missing if key not in new]
+        for chunk in row_chunks(existing):
+            rows = (
+                await session.exec(
+                    select(Category.category_id, Category.name, Category.type)
+                    .where(Category.user_id == user_id)
+                    .where(tuple_(Category.name, Category.type).in_(chunk))
+                )
+            ).all()
+            for row in rows:
+                resolved[(row.name, row.type)] = row.category_id
+                _category_cache.set((str(user_id), row.name, row.type), row.category_id)
+    except Exception as e:
+        raise HTTPException(
+            status_code=400,
+            detail=f"An error occurred while resolving the categories in db: {e}",
+        )
+
+    # Cache the new categories only once the caller commits them
+    def cache_new_categories():
+        for key, category_id in new.items():
+            _category_cache.set((str(user_id), *key), category_id)
+
+    on_commit(session, cache_new_categories)
+
+    return resolved
+
+
+async def get_or_create_category_id(
+    user_id: str, category_name: str, category_type: str, session: SessionDep
+):
+    """
+    Resolve the ID of a category, creating it if needed, without committing
+    :param user_id: A unique identifier for a user.
+    :param category_name: A category name of a transaction (rent, food, salary, and so on)
+    :param category_type: Income or Expense
+    :param session: A workspace for interacting with db
+    :return the category ID
+    """
+
+    key = (category_name, category_type)
+    resolved = await get_or_create_category_ids(
+        user_id=user_id, categories={key}, session=session
+    )
+    return resolved[key]
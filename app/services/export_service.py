@@ -0,0 +1,327 @@
+from app.models.db.transaction_db import Transaction
+from app.models.db.category_db import Category
+from app.db.session import session_scope
+from app.db.engine import engine
+from app.config import settings
+from sqlalchemy.ext.asyncio import AsyncEngine
+from sqlmodel import select, cast, func, String
+from fastapi import HTTPException
+from datetime import date, datetime, timedelta, timezone
+import asyncio
+import contextlib
+import csv
+import io
+import zlib
+
+# format -> (media type, file extension)
+EXPORT_FORMATS = {
+    "csv": ("application/gzip", "csv.gz"),
+    "parquet": ("application/vnd.apache.parquet", "parquet"),
+    "arrow": ("application/vnd.apache.arrow.stream", "arrows"),
+}
+
+# Exported columns, in order
+COLUMNS = [
+    "transaction_id",
+    "occurred_at",
+    "amount",
+    "direction",
+    "category_id",
+    "category_name",
+    "category_type",
+    "description",
+    "created_at",
+]
+
+
+def _uuid_text(column, dialect: str):
+    """
+    A UUID column as its text form, formatted in db so that no UUID objects are built
+    """
+    if dialect == "postgresql":
+        return cast(column, String)
+    # SQLite stores UUIDs as 32 hex digits
+    parts = [
+        func.substr(column, start, length, type_=String)
+        for start, length in ((1, 8), (9, 4), (13, 4), (17, 4), (21, 12))
+    ]
+    return parts[0] + "-" + parts[1] + "-" + parts[2] + "-" + parts[3] + "-" + parts[4]
+
+
+def _timestamp_text(column, dialect: str):
+    """
+    A timestamp column as ISO 8601 text in UTC, formatted in db so that no datetime objects are built
+    """
+    if dialect == "postgresql":
+        return func.to_char(
+            func.timezone("UTC", column), 'YYYY-MM-DD"T"HH24:MI:SS.US"Z"', type_=String
+        )
+    # SQLite values are stored in UTC, with millisecond precision here
+    return func.strftime("%Y-%m-%dT%H:%M:%fZ", column, type_=String)
+
+
+def _export_query(user_id, start: date | None, end: date | None, dialect: str):
+    """
+    Build the export query, oldest first
+    """
+    columns = [
+        _uuid_text(Transaction.transaction_id, dialect),
+        _timestamp_text(Transaction.occurred_at, dialect),
+        Transaction.amount,
+        Transaction.direction,
+        _uuid_text(Transaction.category_id, dialect),
+        Category.name,
+        Category.type,
+        Transaction.description,
+        _timestamp_text(Transaction.created_at, dialect),
+    ]
+    query = (
+        select(*(column.label(name) for column, name in zip(columns, COLUMNS)))
+        .join(Category, Category.category_id == Transaction.category_id)
+        .where(Transaction.user_id == user_id)
+        .order_by(Transaction.occurred_at, Transaction.transaction_id)
+    )
+    if start is not None:
+        query = query.where(
+            Transaction.occurred_at
+            >= datetime(start.year, start.month, start.day, tzinfo=timezone.utc)
+        )
+    # There is no day after date.max, the range is then open-ended
+    if end is not None and end < date.max:
+        query = query.where(
+            Transaction.occurred_at
+            < datetime(end.year, end.month, end.day, tzinfo=timezone.utc) + timedelta(days=1)
+        )
+    return query
+
+
+def _pyarrow():
+    """
+    pyarrow is only needed by the parquet and arrow formats, it is imported on first use.
+    It is a requirement of the app; the 501 only covers an install without it.
+    :return the pyarrow and pyarrow.parquet modules
+    """
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError:
+        raise HTTPException(
+            status_code=501,
+            detail="The parquet and arrow formats need pyarrow installed on the server",
+        )
+    return pyarrow, pyarrow.parquet
+
+
+class _CsvEncoder:
+    """
+    CSV with a header line, gzip-compressed as it is written
+    """
+
+    def __init__(self, level: int):
+        # wbits=31 writes a gzip container
+        self._compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+        self._pending = [COLUMNS]
+
+    def encode(self, rows) -> bytes:
+        text = io.StringIO()
+        # The writer converts every value in C, there is no per-row Python code
+        csv.writer(text, lineterminator="\n").writerows(self._pending + rows)
+        self._pending = []
+        return self._compressor.compress(text.getvalue().encode())
+
+    def close(self) -> bytes:
+        data = self.encode([]) if self._pending else b""
+        return data + self._compressor.flush()
+
+
+class _ArrowEncoder:
+    """
+    Arrow IPC stream or Parquet, one record batch (or row group) per batch of rows
+    """
+
+    def __init__(self, parquet: bool):
+        pa, pq = _pyarrow()
+        self._pa = pa
+        self._schema = pa.schema(
+            [
+                ("transaction_id", pa.string()),
+                ("occurred_at", pa.timestamp("us", tz="UTC")),
+                ("amount", pa.float64()),
+                ("direction", pa.string()),
+                ("category_id", pa.string()),
+                ("category_name", pa.string()),
+                ("category_type", pa.string()),
+                ("description", pa.string()),
+                ("created_at", pa.timestamp("us", tz="UTC")),
+            ]
+        )
+        self._sink = io.BytesIO()
+        if parquet:
+            self._writer = pq.ParquetWriter(self._sink, self._schema, compression="zstd")
+        else:
+            self._writer = pa.ipc.new_stream(self._sink, self._schema)
+
+    def _drain(self) -> bytes:
+        data = self._sink.getvalue()
+        self._sink.seek(0)
+        self._sink.truncate()
+        return data
+
+    def encode(self, rows) -> bytes:
+        if rows:
+            # Rows are transposed into columns, pyarrow converts each column in C
+            columns = list(zip(*rows))
+            self._writer.write_batch(
+                self._pa.record_batch(
+                    [
+                        # Timestamps come as ISO 8601 text, the cast parses them in C
+                        self._pa.array(column, type=self._pa.string()).cast(field.type)
+                        if self._pa.types.is_timestamp(field.type)
+                        else self._pa.array(column, type=field.type)
+                        for column, field in zip(columns, self._schema)
+                    ],
+                    schema=self._schema,
+                )
+            )
+        return self._drain()
+
+    def close(self) -> bytes:
+        self._writer.close()
+        return self._drain()
+
+
+async def _asyncpg(query, session):
+    """
+    :return the asyncpg connection of a session and the query as SQL, with the values rendered
+        by their column types (UUIDs and datetimes) since COPY takes no parameters
+    """
+    connection = await (await session.connection()).get_raw_connection()
+    sql = str(
+        query.compile(
+            dialect=session.bind.dialect, compile_kwargs={"literal_binds": True}
+        )
+    )
+    return connection.driver_connection, sql
+
+
+async def _cursor_batches(query, session, batch_size: int):
+    """
+    Rows of a server-side cursor, batch_size at a time
+    :return an async generator of lists of rows
+    """
+    if session.bind.dialect.name == "postgresql":
+        # asyncpg records are tuples already, SQLAlchemy's result processing is skipped
+        connection, sql = await _asyncpg(query, session)
+        # A cursor lives in a transaction, SQLAlchemy has not started one on the connection yet
+        async with connection.transaction(readonly=True):
+            cursor = await connection.cursor(sql)
+            while rows := await cursor.fetch(batch_size):
+                yield rows
+        return
+
+    result = await session.stream(query.execution_options(yield_per=batch_size))
+    async for rows in result.partitions():
+        yield rows
+
+
+async def _copy_csv(query, session, level: int):
+    """
+    Postgres writes the CSV itself with COPY, it is only gzip-compressed here
+    :param query: A statement from _export_query
+    :param session: A workspace for interacting with db
+    :param level: gzip level
+    :return an async generator of compressed chunks
+    """
+    connection, sql = await _asyncpg(query, session)
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+    queue = asyncio.Queue()
+    # At most 16 chunks wait in the queue, COPY waits while the client is slower than the db
+    slots = asyncio.Semaphore(16)
+
+    async def output(chunk):
+        await slots.acquire()
+        queue.put_nowait(compressor.compress(chunk))
+
+    async def copy():
+        try:
+            await connection.copy_from_query(
+                sql, output=output, format="csv", header=True
+            )
+        finally:
+            # Never waits for a slot, the client may be gone
+            queue.put_nowait(None)
+
+    task = asyncio.ensure_future(copy())
+    try:
+        while (chunk := await queue.get()) is not None:
+            slots.release()
+            if chunk:
+                yield chunk
+        # Raises if COPY failed
+        await task
+        yield compressor.flush()
+    finally:
+        # The connection goes back to the pool with the session, COPY must be over by then
+        if not task.done():
+            task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await task
+
+
+def export_transactions(
+    user_id,
+    format: str,
+    start: date | None = None,
+    end: date | None = None,
+    batch_size: int = settings.EXPORT_BATCH_SIZE,
+    bind: AsyncEngine | None = None,
+):
+    """
+    Stream the transactions of a user with their category, encoded batch by batch
+    from a server-side cursor, so memory stays bounded by the batch size
+    (CSV from Postgres is streamed by COPY instead)
+    :param user_id: A unique identifier for a user
+    :param format: csv (gzip-compressed), parquet or arrow (IPC stream)
+    :param start: First day exported, the whole history if NONE
+    :param end: Last day exported (inclusive), up to the latest transaction if NONE
+    :param batch_size: The number of rows fetched and encoded at a time
+    :param bind: The engine to read from (a read replica), the primary if NONE
+    :return an async generator of encoded chunks
+    """
+    dialect = (bind or engine).dialect.name
+    query = _export_query(user_id, start, end, dialect)
+
+    # Fails before the response starts when pyarrow is missing
+    if format == "csv":
+        encoder = _CsvEncoder(level=settings.EXPORT_GZIP_LEVEL)
+    else:
+        encoder = _ArrowEncoder(parquet=format == "parquet")
+
+    async def chunks():
+        # The request session is closed before a streaming body is sent, so use our own
+        async with session_scope(bind=bind) as session:
+            # Inner generators are closed before the session, they use its connection
+            if format == "csv" and dialect == "postgresql":
+                async with contextlib.aclosing(
+                    _copy_csv(query, session, settings.EXPORT_GZIP_LEVEL)
+                ) as copied:
+                    async for chunk in copied:
+                        yield chunk
+                return
+
+            # Encoding and compression run off the event loop, a batch is encoded
+            # while the next one is fetched
+            encoding = None
+            async with contextlib.aclosing(
+                _cursor_batches(query, session, batch_size)
+            ) as batches:
+                async for rows in batches:
+                    if encoding is not None:
+                        yield await encoding
+                    encoding = asyncio.ensure_future(asyncio.to_thread(encoder.encode, rows))
+            if encoding is not None:
+                yield await encoding
+
+        yield await asyncio.to_thread(encoder.close)
+
+    return chunks()
@@ -1,62 +1,136 @@
-import pandas as pd
-from app.models.db.transaction_db import Transaction
+from app.models.db.rollup_db import MonthlyCategoryRollup
 from app.models.db.category_db import Category
+from app.models.db.transaction_db import Transaction
 from app.db.session import SessionDep
-from app.models.finance import CategorySummary, FinancialReport
-from sqlmodel import select, extract
-from datetime import datetime
+from app.models.finance import (
+    CategorySummary,
+    CategoryTrend,
+    FinancialReport,
+    TrendReport,
+)
+from app.services.report_cache import report_cache
+from app.utils.metrics import REPORT_PHASE_SECONDS
+from sqlmodel import select, func
+from datetime import date, datetime, timedelta, timezone
+from collections import defaultdict
 import calendar
+import numpy as np
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+
+def _bucket_first(day: date, granularity: str):
+    if granularity == "day":
+        return day
+    if granularity == "week":
+        # date.min is a Monday, so this never goes below it
+        return day - timedelta(days=day.weekday())
+    return day.replace(day=1)
+
+
+def bucket_count(start: date, end: date, granularity: str):
+    """
+    The number of days, weeks (from Monday) or months overlapping a date range, without listing them
+    :param start: First day of the range
+    :param end: Last day of the range (inclusive)
+    :param granularity: day, week or month
+    :return the number of buckets of bucket_starts
+    """
+    if granularity == "month":
+        return 12 * (end.year - start.year) + end.month - start.month + 1
+    days = (_bucket_first(end, granularity) - _bucket_first(start, granularity)).days
+    return days // (7 if granularity == "week" else 1) + 1
+
+
+def bucket_starts(start: date, end: date, granularity: str):
+    """
+    The days, weeks (from Monday) or months overlapping a date range
+    :param start: First day of the range
+    :param end: Last day of the range (inclusive)
+    :param granularity: day, week or month
+    :return a generator of (first day of the bucket, last day of the bucket), the last week
+        of the calendar ends at date.max
+    """
+    current = _bucket_first(start, granularity)
+    while True:
+        if granularity == "day":
+            last = current
+        elif granularity == "week":
+            last = current + timedelta(days=min(6, (date.max - current).days))
+        else:
+            last = current.replace(day=calendar.monthrange(current.year, current.month)[1])
+        yield current, last
+
+        # The next bucket is only computed when there is one, past date.max it can't be built
+        if last >= end:
+            return
+        current = last + timedelta(days=1)
 
 
 class FinanceEngine:
     def __init__(self, db: SessionDep):
         self.db = db
 
-    def generate_monthly_report(self, user_id, month, year) -> FinancialReport:
+    async def get_monthly_report(self, user_id, month, year) -> FinancialReport:
+        """
+        Get the monthly report from the report cache, generating it on a miss
+        """
+        with REPORT_PHASE_SECONDS.labels(phase="cache_lookup").time():
+            report = await report_cache.get(user_id, year, month)
+        if report is not None:
+            return report
+
+        # Taken before reading, a write committed meanwhile makes the cache reject this report
+        version = await report_cache.version()
+        report = await self.generate_monthly_report(user_id=user_id, month=month, year=year)
+        await report_cache.set(user_id, year, month, report, version)
+
+        return report
+
+    async def generate_monthly_report(self, user_id, month, year) -> FinancialReport:
+        # Sum and count per (direction, category) are maintained in the rollups,
+        # so this reads one row per category no matter how many transactions there are
         query = (
-            select(Transaction)
-            .where(Transaction.user_id == user_id)
-            .where(extract("month", Transaction.occurred_at) == month)
-            .where(extract("year", Transaction.occurred_at) == year)
+            select(
+                MonthlyCategoryRollup.direction,
+                # An outer join, amounts of a missing category still count in the totals
+                func.coalesce(Category.name, "Uncategorized").label("name"),
+                MonthlyCategoryRollup.total,
+                MonthlyCategoryRollup.count,
+            )
+            .outerjoin(Category, Category.category_id == MonthlyCategoryRollup.category_id)
+            .where(MonthlyCategoryRollup.user_id == user_id)
+            .where(MonthlyCategoryRollup.year == year)
+            .where(MonthlyCategoryRollup.month == month)
+            # Rows of categories whose transactions were all removed stay at 0
+            .where(MonthlyCategoryRollup.count > 0)
+            .order_by(MonthlyCategoryRollup.total.desc())
         )
 
-        # Load directly into pandas DataFrame
-        df = pd.read_sql(query, self.db.bind)
+        started = time.perf_counter()
+        rows = (await self.db.exec(query)).all()
+        queried = time.perf_counter()
+        REPORT_PHASE_SECONDS.labels(phase="query").observe(queried - started)
 
-        if df.empty:
+        if not rows:
             return self._empty_report(month, year)
-        
-        expense = df[df['direction'] == 'out']['amount'].sum()
-        income = df[df['direction'] == 'in']['amount'].sum()
+
+        expense = sum(row.total for row in rows if row.direction == "out")
+        income = sum(row.total for row in rows if row.direction == "in")
         net = income - expense
-        
-        print("-------DEBUG------ Total Expense: ", expense)
-        print("-------DEBUG------ Total Income: ", income)
-
-        # Group by categories
-        expense_df = df[df['direction'] == 'out']
-        print("-------DEBUG------ EXPENSE DF: ", expense_df)
-        cat_group = expense_df.groupby('category_id')['amount'].agg(['sum', 'count']).reset_index()
-        cat_group = cat_group.sort_values(by='sum', ascending=False)
-        
-        # Fetch category names and merge with grouped data
-        category_query = select(Category).where(Category.user_id == user_id)
-        categories_df = pd.read_sql(category_query, self.db.bind)
-        print("-------DEBUG------ CATEGORIES DF: ", categories_df)
-        cat_group = pd.merge(cat_group, categories_df, on='category_id', how='left')
-        print("-------DEBUG------ CAT GROUP: \n", cat_group)
-
-        # Structure Data
-        top_categories = []
-        for _, row in cat_group.iterrows():
-            top_categories.append(CategorySummary(category=row['name'], total=row['sum'], count=row['count']))
-        
-        print("-------DEBUG------ TOP CATEGORIES: \n", top_categories)
 
+        # Rows are already sorted by total, only expenses are reported per category
+        top_categories = [
+            CategorySummary(category=row.name, total=row.total, count=row.count)
+            for row in rows
+            if row.direction == "out"
+        ]
 
         # Get the exact last day of the month
         _, last_day = calendar.monthrange(year, month)
-        return FinancialReport(
+        report = FinancialReport(
             period_start=datetime(year, month, 1),
             period_end=datetime(year, month, last_day, 23, 59, 59),
             total_income=income,
@@ -65,6 +139,200 @@ class FinanceEngine:
             top_spending_categories=top_categories
         )
 
+        built = time.perf_counter()
+        REPORT_PHASE_SECONDS.labels(phase="build").observe(built - queried)
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(
+                "Monthly report generated",
+                extra={
+                    "year": year,
+                    "month": month,
+                    "rows": len(rows),
+                    "query_ms": round((queried - started) * 1000, 2),
+                    "build_ms": round((built - queried) * 1000, 2),
+                },
+            )
+
+        return report
+
+    async def generate_trend_report(
+        self, user_id, months: int, year: int | None = None, month: int | None = None
+    ) -> TrendReport:
+        """
+        Get the month-over-month trend of every spending category, computed over a dense
+        (category x month) matrix built from the rollups with one query
+        :param user_id: A unique identifier for a user
+        :param months: Number of months of the report
+        :param year: Year of the last month, the current one if NONE
+        :param month: The last month, the current one if NONE
+        :return a trend report
+        """
+        if year is None or month is None:
+            today = datetime.now(timezone.utc)
+            year, month = today.year, today.month
+
+        # 11 months before the report feed the rolling averages of its first months
+        last = year * 12 + month - 1
+        first = last - months + 1
+        history = first - 11
+        month_index = MonthlyCategoryRollup.year * 12 + MonthlyCategoryRollup.month - 1
+
+        query = (
+            select(month_index, Category.name, MonthlyCategoryRollup.total)
+            .join(Category, Category.category_id == MonthlyCategoryRollup.category_id)
+            .where(MonthlyCategoryRollup.user_id == user_id)
+            .where(MonthlyCategoryRollup.direction == "out")
+            .where(month_index >= history)
+            .where(month_index <= last)
+        )
+        rows = (await self.db.exec(query)).all()
+
+        names = sorted({row[1] for row in rows})
+        span = last - history + 1
+        matrix = np.zeros((len(names), span))
+        if rows:
+            position = {name: index for index, name in enumerate(names)}
+            np.add.at(
+                matrix,
+                (
+                    np.fromiter((position[row[1]] for row in rows), dtype=np.intp, count=len(rows)),
+                    np.fromiter((row[0] - history for row in rows), dtype=np.intp, count=len(rows)),
+                ),
+                np.fromiter((row[2] for row in rows), dtype=float, count=len(rows)),
+            )
+
+        # Trailing averages from cumulative sums, the window of column i ends at i
+        cumulative = np.concatenate([np.zeros((len(names), 1)), matrix.cumsum(axis=1)], axis=1)
+
+        def rolling(window):
+            ends = np.arange(span) + 1
+            starts = np.maximum(ends - window, 0)
+            return (cumulative[:, ends] - cumulative[:, starts]) / window
+
+        rolling_3, rolling_12 = rolling(3), rolling(12)
+
+        # Only the months of the report from here on (column 11 of the history is its first month)
+        previous = matrix[:, 10:-1]
+        current = matrix[:, 11:]
+        rolling_3, rolling_12 = rolling_3[:, 11:], rolling_12[:, 11:]
+
+        delta = current - previous
+        with np.errstate(divide="ignore", invalid="ignore"):
+            delta_pct = np.where(previous != 0, delta / previous * 100, np.nan)
+            monthly_totals = current.sum(axis=0)
+            share = np.where(monthly_totals != 0, current / monthly_totals, 0.0)
+            period_totals = current.sum(axis=1)
+            period_share = period_totals / period_totals.sum() if period_totals.sum() else np.zeros(len(names))
+
+        categories = [
+            CategoryTrend(
+                category=names[index],
+                totals=current[index].round(2).tolist(),
+                month_over_month=delta[index].round(2).tolist(),
+                month_over_month_pct=[
+                    None if np.isnan(value) else round(float(value), 2)
+                    for value in delta_pct[index]
+                ],
+                rolling_3_month_avg=rolling_3[index].round(2).tolist(),
+                rolling_12_month_avg=rolling_12[index].round(2).tolist(),
+                share=share[index].round(4).tolist(),
+                period_share=round(float(period_share[index]), 4),
+            )
+            # Largest spending over the period first, categories without any are left out
+            for index in np.argsort(-period_totals, kind="stable")
+            if period_totals[index] > 0
+        ]
+
+        return TrendReport(
+            months=[f"{index // 12}-{index % 12 + 1:02d}" for index in range(first, last + 1)],
+            total_expense=monthly_totals.round(2).tolist(),
+            categories=categories,
+        )
+
+    def _bucket(self, granularity: str):
+        """
+        SQL expression of the start of the day/week/month of a transaction, in UTC
+        """
+        if self.db.bind.dialect.name == "postgresql":
+            return func.date_trunc(granularity, func.timezone("UTC", Transaction.occurred_at))
+
+        # SQLite has no date_trunc, values are stored in UTC as text
+        if granularity == "day":
+            return func.strftime("%Y-%m-%d 00:00:00", Transaction.occurred_at)
+        if granularity == "week":
+            # Back to the Monday of the week, like date_trunc('week')
+            return func.date(Transaction.occurred_at, "weekday 0", "-6 days") + " 00:00:00"
+        return func.strftime("%Y-%m-01 00:00:00", Transaction.occurred_at)
+
+    async def generate_range_report(
+        self, user_id, start: date, end: date, granularity: str
+    ) -> list[FinancialReport]:
+        """
+        Get a report per day, week or month of a date range from one grouped query
+        :param user_id: A unique identifier for a user
+        :param start: First day of the range
+        :param end: Last day of the range (inclusive)
+        :param granularity: day, week or month
+        :return a list of reports, one per bucket in order, buckets without transactions included
+        """
+        bucket = self._bucket(granularity).label("bucket")
+        query = (
+            select(
+                bucket,
+                Transaction.direction,
+                Category.name,
+                func.sum(Transaction.amount),
+                func.count(),
+            )
+            .join(Category, Category.category_id == Transaction.category_id)
+            .where(Transaction.user_id == user_id)
+            .where(
+                Transaction.occurred_at
+                >= datetime(start.year, start.month, start.day, tzinfo=timezone.utc)
+            )
+            .group_by(bucket, Transaction.direction, Category.name)
+        )
+        # There is no day after date.max, the range is then open-ended
+        if end < date.max:
+            query = query.where(
+                Transaction.occurred_at
+                < datetime(end.year, end.month, end.day, tzinfo=timezone.utc)
+                + timedelta(days=1)
+            )
+
+        # bucket start -> direction -> category -> (total, count)
+        totals = defaultdict(lambda: {"in": {}, "out": {}})
+        for key, direction, name, total, count in (await self.db.exec(query)).all():
+            if isinstance(key, str):
+                key = datetime.fromisoformat(key)
+            totals[key.date()][direction][name] = (total, count)
+
+        reports = []
+        for bucket_start, bucket_last in bucket_starts(start, end, granularity):
+            rows = totals.get(bucket_start, {"in": {}, "out": {}})
+            income = sum(total for total, _ in rows["in"].values())
+            expense = sum(total for total, _ in rows["out"].values())
+            period_start = max(bucket_start, start)
+            period_end = min(bucket_last, end)
+            reports.append(
+                FinancialReport(
+                    period_start=datetime(period_start.year, period_start.month, period_start.day),
+                    period_end=datetime(period_end.year, period_end.month, period_end.day, 23, 59, 59),
+                    total_income=income,
+                    total_expense=expense,
+                    net_savings=income - expense,
+                    # Only expenses are reported per category, largest first
+                    top_spending_categories=[
+                        CategorySummary(category=name, total=total, count=count)
+                        for name, (total, count) in sorted(
+                            rows["out"].items(), key=lambda item: item[1][0], reverse=True
+                        )
+                    ],
+                )
+            )
+
+        return reports
+
     def _empty_report(self, month, year):
         return FinancialReport(
             period_start=datetime(year, month, 1),
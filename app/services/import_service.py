@@ -0,0 +1,371 @@
+from app.models.db.transaction_db import Transaction
+from app.db.session import SessionDep
+from app.db.engine import dialect_insert
+from app.services.category_service import get_or_create_category_ids
+from app.services.rollup_service import (
+    apply_rollup_query,
+    grouped_rollups,
+    apply_histogram_query,
+    grouped_histograms,
+)
+from app.services.recurring_service import invalidate_recurring
+from app.services.report_cache import report_cache
+from app.db.replicas import replica_router
+from sqlalchemy import Table, Column, MetaData, Integer, Float, String, DateTime, Uuid, cast
+from sqlmodel import select, insert, func, literal, true
+from fastapi import HTTPException
+from starlette.concurrency import run_in_threadpool
+from datetime import datetime, timezone
+from uuid import UUID, uuid4
+from typing import BinaryIO, Iterator
+import csv
+import hashlib
+import io
+import re
+
+# Lines of a statement are copied here first, then merged into transactions in one statement
+_staging = Table(
+    "transactions_import_staging",
+    MetaData(),
+    Column("line_no", Integer),
+    Column("transaction_id", Uuid),
+    Column("category_id", Uuid),
+    Column("amount", Float),
+    Column("direction", String),
+    Column("description", String),
+    Column("occurred_at", DateTime(timezone=True)),
+    Column("content_hash", String),
+    prefixes=["TEMPORARY"],
+)
+_STAGING_COLUMNS = [column.name for column in _staging.columns]
+
+# Only the first errors are reported, the number of skipped lines is always exact
+_MAX_REPORTED_ERRORS = 20
+
+
+class ImportLineError(ValueError):
+    pass
+
+
+def _parse_amount(value: str):
+    try:
+        return float(value.strip().replace(",", ""))
+    except (AttributeError, ValueError):
+        raise ImportLineError(f"Invalid amount {value!r}")
+
+
+def _parse_date(value: str, date_format: str | None):
+    try:
+        value = value.strip()
+        occurred_at = (
+            datetime.strptime(value, date_format)
+            if date_format
+            else datetime.fromisoformat(value)
+        )
+    except (AttributeError, ValueError):
+        raise ImportLineError(f"Invalid date {value!r}")
+    return occurred_at if occurred_at.tzinfo else occurred_at.replace(tzinfo=timezone.utc)
+
+
+def _statement_line(
+    amount: float,
+    occurred_at: datetime,
+    description: str | None,
+    category_name: str,
+    category_type: str | None,
+):
+    """
+    Normalize a statement line, a negative amount without a type is an expense
+    """
+    if not category_type:
+        category_type = "expense" if amount < 0 else "income"
+    if category_type not in ("income", "expense"):
+        raise ImportLineError(f"Invalid category type {category_type!r}")
+    if amount == 0:
+        raise ImportLineError("Amount must not be 0")
+
+    return {
+        "amount": abs(amount),
+        "occurred_at": occurred_at,
+        "description": description or None,
+        "category_name": category_name,
+        "category_type": category_type,
+    }
+
+
+def parse_csv(
+    file: BinaryIO,
+    date_column: str = "date",
+    amount_column: str = "amount",
+    description_column: str = "description",
+    category_column: str = "category",
+    type_column: str = "type",
+    date_format: str | None = None,
+    default_category: str = "Uncategorized",
+) -> Iterator[tuple[int, dict | ImportLineError]]:
+    """
+    Parse a CSV statement line by line
+    :param file: A binary file object
+    :return a generator of (line number, statement line or the error of that line)
+    """
+    reader = csv.DictReader(io.TextIOWrapper(file, encoding="utf-8-sig", newline=""))
+
+    missing = {date_column, amount_column} - set(reader.fieldnames or [])
+    if missing:
+        raise HTTPException(
+            status_code=400,
+            detail=f"The CSV file has no {', '.join(sorted(missing))} column",
+        )
+
+    for row in reader:
+        try:
+            yield reader.line_num, _statement_line(
+                amount=_parse_amount(row.get(amount_column)),
+                occurred_at=_parse_date(row.get(date_column), date_format),
+                description=(row.get(description_column) or "").strip(),
+                category_name=(row.get(category_column) or "").strip()
+                or default_category,
+                category_type=(row.get(type_column) or "").strip().lower(),
+            )
+        except ImportLineError as e:
+            yield reader.line_num, e
+
+
+def _ofx_tokens(file: BinaryIO, chunk_size: int = 64 * 1024):
+    """
+    Tokenize an OFX file (SGML or XML) into (tag, text) pairs without loading it whole
+    """
+    text = io.TextIOWrapper(file, encoding="utf-8", errors="replace")
+    buffer = ""
+    while True:
+        chunk = text.read(chunk_size)
+        buffer += chunk
+        parts = buffer.split("<")
+        # The last part may be cut in the middle, keep it for the next chunk
+        buffer = parts.pop() if chunk else ""
+        for part in parts:
+            tag, _, value = part.partition(">")
+            if tag:
+                yield tag.strip().upper(), value.strip()
+        if not chunk:
+            return
+
+
+def _parse_ofx_date(value: str):
+    # YYYYMMDD[HHMMSS[.XXX]][[+-]gmt offset[:tz name]], the offset is ignored (UTC is assumed)
+    match = re.match(r"(\d{8})(\d{6})?", value or "")
+    if not match:
+        raise ImportLineError(f"Invalid date {value!r}")
+    return datetime.strptime(
+        match.group(1) + (match.group(2) or "000000"), "%Y%m%d%H%M%S"
+    ).replace(tzinfo=timezone.utc)
+
+
+def parse_ofx(
+    file: BinaryIO, default_category: str = "Uncategorized"
+) -> Iterator[tuple[int, dict | ImportLineError]]:
+    """
+    Parse the STMTTRN records of an OFX statement
+    :param file: A binary file object
+    :return a generator of (record number, statement line or the error of that record)
+    """
+    record, number = None, 0
+    for tag, value in _ofx_tokens(file):
+        if tag == "STMTTRN":
+            record, number = {}, number + 1
+        elif tag == "/STMTTRN" and record is not None:
+            try:
+                yield number, _statement_line(
+                    amount=_parse_amount(record.get("TRNAMT")),
+                    occurred_at=_parse_ofx_date(record.get("DTPOSTED")),
+                    description=record.get("NAME") or record.get("MEMO"),
+                    category_name=default_category,
+                    category_type=None,
+                )
+            except ImportLineError as e:
+                yield number, e
+            record = None
+        elif record is not None and not tag.startswith("/"):
+            record[tag] = value
+
+
+def _chunks(lines: Iterator, size: int):
+    chunk = []
+    for line in lines:
+        chunk.append(line)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def _content_hash(user_id: str, line: dict):
+    content = "|".join(
+        [
+            str(user_id),
+            line["occurred_at"].isoformat(),
+            f"{line['amount']:.2f}",
+            line["category_type"],
+            line["category_name"],
+            line["description"] or "",
+        ]
+    )
+    return hashlib.sha256(content.encode()).hexdigest()
+
+
+def _create_staging(connection):
+    # A failed import may have left the temporary table on this pooled connection
+    _staging.drop(connection, checkfirst=True)
+    _staging.create(connection)
+
+
+async def _copy_to_staging(session: SessionDep, records: list[tuple]):
+    """
+    Load records into the staging table, through COPY on Postgres
+    """
+    connection = await session.connection()
+    if connection.dialect.name == "postgresql":
+        raw = await connection.get_raw_connection()
+        await raw.driver_connection.copy_records_to_table(
+            _staging.name, records=records, columns=_STAGING_COLUMNS
+        )
+    else:
+        await session.exec(
+            insert(_staging),
+            params=[dict(zip(_STAGING_COLUMNS, record)) for record in records],
+        )
+
+
+async def import_statement(
+    user_id: str, lines: Iterator, session: SessionDep, chunk_size: int
+):
+    """
+    Import the lines of a statement in one DB transaction, skipping lines that were already imported
+    :param user_id: A unique identifier for a user.
+    :param lines: A generator from parse_csv or parse_ofx
+    :param session: A workspace for interacting with db
+    :param chunk_size: The number of lines parsed and copied at a time
+    :return a summary of the import
+    """
+
+    rows, skipped, errors = 0, 0, []
+    category_ids = {}
+
+    try:
+        connection = await session.connection()
+        await connection.run_sync(_create_staging)
+
+        chunks = _chunks(lines, chunk_size)
+        while True:
+            # Parsing is CPU bound, keep it off the event loop
+            chunk = await run_in_threadpool(next, chunks, None)
+            if chunk is None:
+                break
+
+            parsed = []
+            for line_no, line in chunk:
+                if isinstance(line, ImportLineError):
+                    skipped += 1
+                    if len(errors) < _MAX_REPORTED_ERRORS:
+                        errors.append({"line": line_no, "detail": str(line)})
+                else:
+                    parsed.append((line_no, line))
+
+            # Resolve the categories of the chunk that weren't seen yet with one batched upsert
+            new_categories = {
+                (line["category_name"], line["category_type"]) for _, line in parsed
+            } - category_ids.keys()
+            if new_categories:
+                category_ids.update(
+                    await get_or_create_category_ids(
+                        user_id=user_id, categories=new_categories, session=session
+                    )
+                )
+
+            await _copy_to_staging(
+                session,
+                [
+                    (
+                        line_no,
+                        uuid4(),
+                        category_ids[(line["category_name"], line["category_type"])],
+                        line["amount"],
+                        "in" if line["category_type"] == "income" else "out",
+                        line["description"],
+                        line["occurred_at"],
+                        _content_hash(user_id, line),
+                    )
+                    for line_no, line in parsed
+                ],
+            )
+            rows += len(parsed)
+
+        # Identical lines within a statement are told apart by their ordinal
+        ordinal = func.row_number().over(
+            partition_by=_staging.c.content_hash, order_by=_staging.c.line_no
+        )
+        result = await session.exec(
+            dialect_insert(Transaction)
+            .from_select(
+                [
+                    "transaction_id",
+                    "user_id",
+                    "category_id",
+                    "amount",
+                    "direction",
+                    "description",
+                    "occurred_at",
+                    "created_at",
+                    "import_hash",
+                ],
+                select(
+                    _staging.c.transaction_id,
+                    literal(UUID(str(user_id)), Transaction.user_id.type),
+                    _staging.c.category_id,
+                    _staging.c.amount,
+                    _staging.c.direction,
+                    _staging.c.description,
+                    _staging.c.occurred_at,
+                    literal(datetime.now(timezone.utc), Transaction.created_at.type),
+                    _staging.c.content_hash + ":" + cast(ordinal, String),
+                )
+                # SQLite needs a WHERE clause to parse INSERT ... SELECT ... ON CONFLICT
+                .where(true()),
+            )
+            .on_conflict_do_nothing(index_elements=["user_id", "import_hash"])
+        )
+        imported = result.rowcount
+
+        # Inserted rows keep their staging IDs, duplicates were never inserted
+        imported_rows = (
+            Transaction.user_id == user_id,
+            Transaction.transaction_id.in_(select(_staging.c.transaction_id)),
+        )
+        await apply_rollup_query(grouped_rollups(*imported_rows), session)
+        await apply_histogram_query(grouped_histograms(*imported_rows), session)
+
+        await connection.run_sync(_staging.drop)
+        await session.commit()
+
+        # A statement can span any number of months
+        await report_cache.invalidate_user(user_id)
+        # Every imported row has the created_at of the import's start, a long import commits
+        # after the margin within which a refresh reads new rows again
+        invalidate_recurring(user_id)
+        replica_router.mark_write(user_id)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=400,
+            detail=f"An error occurred while importing the statement: {e}",
+        )
+
+    return {
+        "rows": rows,
+        "imported": imported,
+        "duplicates": rows - imported,
+        "skipped": skipped,
+        "errors": errors,
+    }
@@ -0,0 +1,217 @@
+from app.ai.llm_client import LLMClient
+from app.db.session import session_scope
+from app.models.finance import FinancialReport
+from app.services.insight_service import get_financial_insight, insight_key
+from app.utils.lru_cache import LRUCache
+from fastapi import Depends, Request
+from collections import deque
+from datetime import datetime, timezone
+from typing import Annotated, Optional
+from uuid import UUID, uuid4
+import asyncio
+import math
+import statistics
+import time
+
+
+class InsightQueueFullError(Exception):
+    """
+    The job queue is at capacity
+    """
+
+
+class InsightJob:
+    """
+    One insight generation, shared by every request for the same user, month and report
+    """
+
+    def __init__(
+        self,
+        user_id: str,
+        year: int,
+        month: int,
+        report: FinancialReport,
+        refresh: bool,
+        key: tuple,
+    ):
+        self.job_id = str(uuid4())
+        self.user_id = user_id
+        self.year = year
+        self.month = month
+        self.report = report
+        self.refresh = refresh
+        self.key = key
+
+        self.status = "queued"
+        self.insight: Optional[str] = None
+        self.cached: Optional[bool] = None
+        self.error: Optional[str] = None
+        self.created_at = datetime.now(timezone.utc)
+        self.finished_at: Optional[datetime] = None
+        self._queued = time.perf_counter()
+        self._started: Optional[float] = None
+        self.done = asyncio.Event()
+
+    def to_dict(self):
+        return {
+            "job_id": self.job_id,
+            "status": self.status,
+            "year": self.year,
+            "month": self.month,
+            "report": self.report,
+            "ai_insight": self.insight,
+            "cached": self.cached,
+            "error": self.error,
+            "created_at": self.created_at,
+            "finished_at": self.finished_at,
+        }
+
+
+class InsightJobQueue:
+    """
+    A bounded queue of insight jobs drained by a pool of worker tasks.
+    Identical in-flight requests (same user, month and report hash) share one job.
+    """
+
+    def __init__(self, workers: int, maxsize: int, retention: float):
+        self.workers = workers
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=maxsize)
+        # job key -> job, only while the job is queued or running
+        self._inflight: dict = {}
+        # job ID -> job, kept while queued or running, then pollable for the retention period
+        self._jobs = LRUCache(maxsize=maxsize * 100, ttl=retention)
+        self._tasks: list[asyncio.Task] = []
+        self._llm_client: Optional[LLMClient] = None
+
+        self.submitted = 0
+        self.coalesced = 0
+        self.succeeded = 0
+        self.failed = 0
+        # Seconds spent waiting in the queue and running, of the latest jobs
+        self._wait_times = deque(maxlen=1000)
+        self._run_times = deque(maxlen=1000)
+
+    async def start(self, llm_client: LLMClient):
+        self._llm_client = llm_client
+        self._tasks = [asyncio.create_task(self._work()) for _ in range(self.workers)]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def submit(
+        self,
+        user_id: str,
+        year: int,
+        month: int,
+        report: FinancialReport,
+        refresh: bool = False,
+    ):
+        """
+        Queue an insight generation, or join the identical one already in flight
+        :return the job
+        """
+        key = (str(user_id), year, month, insight_key(report), refresh)
+
+        job = self._inflight.get(key)
+        if job is not None:
+            self.coalesced += 1
+            return job
+
+        job = InsightJob(str(user_id), year, month, report, refresh, key)
+        try:
+            self._queue.put_nowait(job)
+        except asyncio.QueueFull:
+            raise InsightQueueFullError("Too many AI insight jobs queued, try again later")
+
+        self.submitted += 1
+        self._inflight[key] = job
+        # Does not expire before it finishes, however long it waits in the queue
+        self._jobs.set(job.job_id, job, ttl=math.inf)
+        return job
+
+    def get(self, job_id: str, user_id: str):
+        """
+        :return the job of the user or NONE (unknown, expired or someone else's)
+        """
+        job = self._jobs.get(job_id)
+        if job is None or job.user_id != str(user_id):
+            return None
+        return job
+
+    async def wait(self, job: InsightJob, timeout: float):
+        """
+        Long-poll a job: return as soon as it finishes or after timeout seconds
+        """
+        try:
+            await asyncio.wait_for(job.done.wait(), timeout=timeout)
+        except asyncio.TimeoutError:
+            pass
+        return job
+
+    async def _work(self):
+        while True:
+            job = await self._queue.get()
+            job.status = "running"
+            job._started = time.perf_counter()
+            self._wait_times.append(job._started - job._queued)
+            try:
+                async with session_scope() as session:
+                    job.insight, job.cached = await get_financial_insight(
+                        report=job.report,
+                        session=session,
+                        llm_client=self._llm_client,
+                        refresh=job.refresh,
+                        user_id=UUID(job.user_id),
+                    )
+                job.status = "succeeded"
+                self.succeeded += 1
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                job.status = "failed"
+                job.error = str(e)
+                self.failed += 1
+            finally:
+                self._run_times.append(time.perf_counter() - job._started)
+                job.finished_at = datetime.now(timezone.utc)
+                self._inflight.pop(job.key, None)
+                # The retention period starts once the job is finished
+                self._jobs.set(job.job_id, job)
+                job.done.set()
+                self._queue.task_done()
+
+    def stats(self):
+        def summary(samples):
+            if not samples:
+                return None
+            ordered = sorted(samples)
+            return {
+                "avg": statistics.fmean(ordered),
+                "p50": ordered[len(ordered) // 2],
+                "p95": ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))],
+                "max": ordered[-1],
+            }
+
+        return {
+            "workers": self.workers,
+            "queue_depth": self._queue.qsize(),
+            "queue_capacity": self._queue.maxsize,
+            "in_flight": len(self._inflight),
+            "submitted": self.submitted,
+            "coalesced": self.coalesced,
+            "succeeded": self.succeeded,
+            "failed": self.failed,
+            "wait_seconds": summary(self._wait_times),
+            "run_seconds": summary(self._run_times),
+        }
+
+
+def get_insight_jobs(request: Request) -> InsightJobQueue:
+    # Created once in the lifespan of the app
+    return request.app.state.insight_jobs
+
+
+InsightJobsDep = Annotated[InsightJobQueue, Depends(get_insight_jobs)]
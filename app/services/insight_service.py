@@ -0,0 +1,183 @@
+from app.ai.ai_analyst import AIAnalyst
+from app.ai.llm_client import LLMClient
+from app.ai.prompt import PROMPT_VERSION
+from app.config import settings
+from app.db.engine import dialect_insert
+from app.db.session import SessionDep, session_scope
+from app.models.db.insight_db import AIInsight
+from app.models.finance import FinancialReport
+from app.services.anomaly_service import with_anomalies
+from app.utils.lru_cache import LRUCache
+from sqlmodel import select
+import hashlib
+import json
+import time
+
+# insight key -> insight text
+_insight_cache = LRUCache(maxsize=settings.INSIGHT_CACHE_SIZE)
+
+
+def insight_key(
+    report: FinancialReport,
+    model: str = settings.MODEL,
+    top_n: int = settings.PROMPT_TOP_CATEGORIES,
+    user_id: str | None = None,
+):
+    """
+    Content address of an insight: the same numbers, prompt and model give the same key.
+    The anomalies are left out: they are scored against the whole history, so they move with
+    writes to other months, while the insight of a month only has to change with its own numbers.
+    They are the user's own transactions though, so an insight whose prompt lists them is keyed
+    on the user and never served to another one with the same numbers.
+    :param report: A monthly report
+    :param model: The LLM model name
+    :param top_n: The number of categories listed one by one in the prompt
+    :param user_id: The owner of the report when its prompt lists the anomalies, else NONE
+    :return a hex digest
+    """
+    canonical = json.dumps(
+        report.model_dump(mode="json", exclude={"anomalies"}),
+        sort_keys=True,
+        separators=(",", ":"),
+    )
+    return hashlib.sha256(
+        f"{canonical}|{PROMPT_VERSION}|{top_n}|{model}|{user_id or ''}".encode()
+    ).hexdigest()
+
+
+async def get_cached_insight(key: str, session: SessionDep):
+    """
+    Look an insight up in memory, then in db when persistence is enabled
+    :param key: An insight key
+    :param session: A workspace for interacting with db
+    :return the insight text or NONE
+    """
+    insight = _insight_cache.get(key)
+    if insight is not None or not settings.INSIGHT_CACHE_PERSIST:
+        return insight
+
+    insight = (
+        await session.exec(select(AIInsight.insight).where(AIInsight.insight_key == key))
+    ).first()
+    if insight is not None:
+        _insight_cache.set(key, insight)
+
+    return insight
+
+
+async def cache_insight(key: str, insight: str, session: SessionDep):
+    """
+    Store an insight in memory, and in db when persistence is enabled
+    :param key: An insight key
+    :param insight: The generated insight text
+    :param session: A workspace for interacting with db
+    """
+    _insight_cache.set(key, insight)
+    if not settings.INSIGHT_CACHE_PERSIST:
+        return
+
+    statement = dialect_insert(AIInsight).values(
+        insight_key=key,
+        model=settings.MODEL,
+        prompt_version=PROMPT_VERSION,
+        insight=insight,
+    )
+    await session.exec(
+        statement.on_conflict_do_update(
+            index_elements=["insight_key"], set_={"insight": statement.excluded.insight}
+        )
+    )
+    await session.commit()
+
+
+async def get_financial_insight(
+    report: FinancialReport,
+    session: SessionDep,
+    llm_client: LLMClient,
+    refresh: bool = False,
+    user_id: str | None = None,
+):
+    """
+    Get the AI insight of a report, only calling the LLM when the report changed
+    :param report: A monthly report
+    :param session: A workspace for interacting with db
+    :param llm_client: The app-wide LLM client
+    :param refresh: Regenerate the insight even if it is cached
+    :param user_id: The owner of the report, the prompt then lists the month's anomalies
+    :return a tuple of (insight text, whether it came from the cache)
+    """
+    key = insight_key(report, user_id=user_id)
+
+    if not refresh:
+        insight = await get_cached_insight(key, session)
+        if insight is not None:
+            return insight, True
+
+    if user_id is not None:
+        report = await with_anomalies(report, user_id, session)
+
+    ai_analyst = AIAnalyst(client=llm_client)
+    insight = await ai_analyst.generate_financial_insight(report=report)
+
+    await cache_insight(key, insight, session)
+
+    return insight, False
+
+
+async def stream_financial_insight(
+    report: FinancialReport,
+    llm_client: LLMClient,
+    refresh: bool = False,
+    user_id: str | None = None,
+):
+    """
+    Stream the AI insight of a report: the report first, then the model tokens as they arrive
+    :param report: A monthly report
+    :param llm_client: The app-wide LLM client
+    :param refresh: Regenerate the insight even if it is cached
+    :param user_id: The owner of the report, the prompt then lists the month's anomalies
+    :return an async generator of (event name, payload)
+    """
+    started = time.perf_counter()
+    key = insight_key(report, user_id=user_id)
+
+    yield "report", report.model_dump(mode="json")
+
+    # The request session is closed before a streaming body is sent, so use our own
+    async with session_scope() as session:
+        insight = None if refresh else await get_cached_insight(key, session)
+        if insight is None and user_id is not None:
+            report = await with_anomalies(report, user_id, session)
+
+    if insight is not None:
+        yield "token", {"content": insight}
+        yield "done", {
+            "cached": True,
+            "elapsed_ms": round((time.perf_counter() - started) * 1000, 1),
+        }
+        return
+
+    ai_analyst = AIAnalyst(client=llm_client)
+    parts = []
+    first_token_ms = None
+    last = None
+    async for chunk in ai_analyst.stream_financial_insight(report=report):
+        last = chunk
+        content = chunk.message.content
+        if content:
+            if first_token_ms is None:
+                first_token_ms = round((time.perf_counter() - started) * 1000, 1)
+            parts.append(content)
+            yield "token", {"content": content}
+
+    # The fully assembled text feeds the insight cache like a non-streamed generation
+    async with session_scope() as session:
+        await cache_insight(key, "".join(parts), session)
+
+    yield "done", {
+        "cached": False,
+        "elapsed_ms": round((time.perf_counter() - started) * 1000, 1),
+        "time_to_first_token_ms": first_token_ms,
+        "prompt_tokens": last.prompt_eval_count if last else None,
+        "completion_tokens": last.eval_count if last else None,
+    }
@@ -0,0 +1,293 @@
+from app.models.db.category_db import Category
+from app.models.db.transaction_db import Transaction
+from app.db.session import SessionDep
+from app.models.finance import RecurringReport, RecurringSeries
+from app.config import settings
+from app.utils.lru_cache import LRUCache
+from sqlmodel import select
+from datetime import date, datetime, timedelta, timezone
+import asyncio
+import bisect
+import calendar
+import functools
+import numpy as np
+import re
+
+# name, days between occurrences, tolerated jitter in days, fewest occurrences, occurrences per month
+_CADENCES = [
+    ("weekly", 7.0, 1.5, 4, 52 / 12),
+    ("biweekly", 14.0, 2.5, 4, 26 / 12),
+    ("monthly", 30.44, 4.0, 3, 1.0),
+    ("yearly", 365.25, 10.0, 2, 1 / 12),
+]
+_PERIODS = np.array([period for _, period, _, _, _ in _CADENCES])
+
+# Share of the intervals of a series that must match its cadence
+_MIN_REGULARITY = 0.75
+# Amounts of a group more than 25% apart (sorted) start a new amount band
+_BAND_RATIO = 1.25
+# The amount of a series is the median of its latest occurrences, it follows price changes
+_RECENT_OCCURRENCES = 3
+# A transaction commits at most this long after its created_at, a refresh re-reads the
+# transactions created this long before the previous read so that none committed meanwhile is missed
+_COMMIT_MARGIN = timedelta(minutes=5)
+
+_DIGITS = re.compile(r"\d+")
+_NON_WORD = re.compile(r"[\W_]+")
+
+
+@functools.lru_cache(maxsize=10000)
+def normalize_description(description: str | None):
+    """
+    Grouping key of a description: lower case, without numbers (dates, references) and punctuation
+    :param description: A transaction description
+    :return the normalized description, an empty string for NONE
+    """
+    if not description:
+        return ""
+    return " ".join(_NON_WORD.sub(" ", _DIGITS.sub(" ", description.lower())).split())
+
+
+def _utc(value: datetime):
+    # SQLite gives back naive UTC values
+    return value if value.tzinfo else value.replace(tzinfo=timezone.utc)
+
+
+def _add_months(day: date, months: int):
+    month = day.month - 1 + months
+    year = day.year + month // 12
+    month = month % 12 + 1
+    return date(year, month, min(day.day, calendar.monthrange(year, month)[1]))
+
+
+def _next_expected(last: date, cadence: str, period: float):
+    if cadence == "monthly":
+        return _add_months(last, 1)
+    if cadence == "yearly":
+        return _add_months(last, 12)
+    return last + timedelta(days=period)
+
+
+class _Group:
+    """
+    Occurrences of one (normalized description, category, direction), sorted by time
+    """
+
+    __slots__ = ("category", "direction", "times", "amounts", "descriptions")
+
+    def __init__(self, category: str, direction: str):
+        self.category = category
+        self.direction = direction
+        # Seconds since the epoch, with the amount and description at the same position
+        self.times: list[float] = []
+        self.amounts: list[float] = []
+        self.descriptions: list[str | None] = []
+
+    def add(self, occurred_at: datetime, amount: float, description: str | None):
+        timestamp = _utc(occurred_at).timestamp()
+        # Rows arrive sorted on a rebuild, so this appends; later rows are usually the newest too
+        position = bisect.bisect_right(self.times, timestamp)
+        self.times.insert(position, timestamp)
+        self.amounts.insert(position, amount)
+        self.descriptions.insert(position, description)
+
+    def detect(self, today: date):
+        """
+        Split the group into amount bands and find the ones with a cadence
+        :param today: Series whose next occurrence is overdue by more than the jitter are inactive
+        :return a list of RecurringSeries
+        """
+        times = np.array(self.times)
+        amounts = np.array(self.amounts)
+
+        # Bands are runs of the sorted amounts without a jump of more than _BAND_RATIO
+        order = np.argsort(amounts, kind="stable")
+        ordered = amounts[order]
+        bands = np.empty(len(amounts), dtype=np.intp)
+        bands[order] = np.concatenate([[0], np.cumsum(ordered[1:] > ordered[:-1] * _BAND_RATIO)])
+
+        # Positions grouped by band, a stable sort keeps each band in time order
+        by_band = np.argsort(bands, kind="stable")
+        boundaries = np.flatnonzero(np.diff(bands[by_band])) + 1
+
+        series = []
+        for members in np.split(by_band, boundaries):
+            if len(members) < 2:
+                continue
+            found = self._series(members, times[members], amounts[members], today)
+            if found is not None:
+                series.append(found)
+        return series
+
+    def _series(self, members, times, amounts, today: date):
+        days = times / 86400
+        # Several payments on the same day count as one occurrence
+        keep = np.concatenate([[True], np.diff(days) >= 0.5])
+        members, days, amounts = members[keep], days[keep], amounts[keep]
+        if len(days) < 2:
+            return None
+
+        intervals = np.diff(days)
+        median = float(np.median(intervals))
+        # The cadence closest to the typical interval, relative to its period
+        index = int(np.argmin(np.abs(_PERIODS - median) / _PERIODS))
+        cadence, period, tolerance, fewest, per_month = _CADENCES[index]
+
+        if len(days) < fewest or abs(median - period) > tolerance:
+            return None
+        if np.mean(np.abs(intervals - period) <= tolerance) < _MIN_REGULARITY:
+            return None
+
+        first = datetime.fromtimestamp(days[0] * 86400, timezone.utc).date()
+        last = datetime.fromtimestamp(days[-1] * 86400, timezone.utc).date()
+        next_expected = _next_expected(last, cadence, period)
+        amount = float(np.median(amounts[-_RECENT_OCCURRENCES:]))
+
+        return RecurringSeries(
+            description=self.descriptions[members[-1]],
+            category=self.category,
+            direction=self.direction,
+            cadence=cadence,
+            amount=round(amount, 2),
+            occurrences=len(days),
+            first_date=first,
+            last_date=last,
+            next_expected=next_expected,
+            monthly_cost=round(amount * per_month, 2),
+            active=today <= next_expected + timedelta(days=tolerance),
+        )
+
+
+class _RecurringState:
+    """
+    A user's transactions grouped for detection, the series found per group,
+    and when the transactions were last read
+    """
+
+    def __init__(self):
+        self.lock = asyncio.Lock()
+        self.groups: dict[tuple, _Group] = {}
+        self.series: dict[tuple, list[RecurringSeries]] = {}
+        self.read_at: datetime | None = None
+        # IDs of the transactions the next refresh reads again (created within _COMMIT_MARGIN of the read)
+        self.recent: dict = {}
+        self.detected_on: date | None = None
+
+
+# user_id -> _RecurringState
+_recurring_states = LRUCache(
+    maxsize=settings.RECURRING_CACHE_SIZE, ttl=settings.RECURRING_CACHE_TTL
+)
+
+
+def invalidate_recurring(user_id):
+    """
+    Drop the recurring state of a user, after an update, a removal or an import (new transactions
+    are picked up by the next refresh on their own, unless they commit late)
+    :param user_id: A unique identifier for a user
+    """
+    # A refresh in flight finishes on the dropped state, which is not reused
+    _recurring_states.pop(str(user_id))
+
+
+async def _refresh(state: _RecurringState, user_id, session: SessionDep, today: date):
+    """
+    Read the transactions created since the last read and re-detect the groups they touched
+    """
+    started = datetime.now(timezone.utc)
+    query = (
+        select(
+            Transaction.transaction_id,
+            Transaction.category_id,
+            Transaction.direction,
+            Transaction.amount,
+            Transaction.description,
+            Transaction.occurred_at,
+            Transaction.created_at,
+        )
+        .where(Transaction.user_id == user_id)
+        # Sorted so that a rebuild only appends to the groups
+        .order_by(Transaction.occurred_at)
+    )
+    if state.read_at is not None:
+        query = query.where(Transaction.created_at > state.read_at - _COMMIT_MARGIN)
+    rows = (await session.exec(query)).all()
+    if not rows and state.detected_on == today:
+        state.read_at = started
+        return
+
+    names = dict(
+        (
+            await session.exec(
+                select(Category.category_id, Category.name).where(Category.user_id == user_id)
+            )
+        ).all()
+    )
+
+    horizon = started - _COMMIT_MARGIN
+    touched = set()
+    for row in rows:
+        if row.transaction_id in state.recent:
+            continue
+        key = (normalize_description(row.description), row.category_id, row.direction)
+        group = state.groups.get(key)
+        if group is None:
+            group = state.groups[key] = _Group(
+                names.get(row.category_id, "Uncategorized"), row.direction
+            )
+        group.add(row.occurred_at, row.amount, row.description)
+        touched.add(key)
+
+        created_at = _utc(row.created_at)
+        if created_at > horizon:
+            state.recent[row.transaction_id] = created_at
+
+    state.recent = {
+        transaction_id: created_at
+        for transaction_id, created_at in state.recent.items()
+        if created_at > horizon
+    }
+    state.read_at = started
+
+    # Whether a series is active depends on the day, every group is re-checked once a day
+    if state.detected_on != today:
+        touched = state.groups.keys()
+        state.detected_on = today
+    for key in touched:
+        state.series[key] = state.groups[key].detect(today)
+
+
+async def detect_recurring(
+    user_id, session: SessionDep, include_inactive: bool = False
+) -> RecurringReport:
+    """
+    Find the recurring payments (and incomes) of a user. Transactions are hashed into groups by
+    normalized description, category and direction, each group is split into amount bands, and a
+    band is a series when the intervals between its dates match a cadence. The grouped history
+    is kept in memory, later calls only read the transactions created since.
+    :param user_id: A unique identifier for a user
+    :param session: A workspace for interacting with db
+    :param include_inactive: Also return the series whose next occurrence is overdue
+    :return a recurring report
+    """
+    key = str(user_id)
+    state = _recurring_states.get(key)
+    if state is None:
+        state = _RecurringState()
+        # Cached before reading, so that an invalidation meanwhile drops it
+        _recurring_states.set(key, state)
+
+    async with state.lock:
+        await _refresh(state, user_id, session, datetime.now(timezone.utc).date())
+        series = [item for items in state.series.values() for item in items]
+
+    series = [item for item in series if include_inactive or item.active]
+    series.sort(key=lambda item: item.monthly_cost, reverse=True)
+
+    return RecurringReport(
+        series=series,
+        total_monthly_cost=round(
+            sum(item.monthly_cost for item in series if item.active and item.direction == "out"),
+            2,
+        ),
+    )
@@ -0,0 +1,129 @@
+from abc import ABC, abstractmethod
+from typing import Iterable, Optional
+from app.config import settings
+from app.models.finance import FinancialReport
+from app.utils.lru_cache import LRUCache
+
+
+class ReportCache(ABC):
+    """
+    Cache of monthly FinancialReports keyed by (user_id, year, month).
+
+    Reads are versioned: take version() before building a report and pass it to set(),
+    so a report built from data that was written (and invalidated) meanwhile is never stored.
+    """
+
+    @abstractmethod
+    async def version(self) -> int:
+        """
+        :return the version to pass to set() for a report that is about to be built
+        """
+
+    @abstractmethod
+    async def get(self, user_id: str, year: int, month: int) -> Optional[FinancialReport]:
+        """
+        :return the cached report or NONE
+        """
+
+    @abstractmethod
+    async def set(
+        self, user_id: str, year: int, month: int, report: FinancialReport, version: int
+    ):
+        """
+        Cache a report unless its month was invalidated after version
+        """
+
+    @abstractmethod
+    async def invalidate(self, user_id: str, months: Iterable[tuple[int, int]]):
+        """
+        Drop the reports of some (year, month) of a user
+        """
+
+    @abstractmethod
+    async def invalidate_user(self, user_id: str):
+        """
+        Drop every report of a user
+        """
+
+    @abstractmethod
+    def stats(self) -> dict:
+        """
+        :return hit/miss counters of the cache
+        """
+
+
+class InMemoryReportCache(ReportCache):
+    """
+    A bounded LRU + TTL cache living in the worker process
+    """
+
+    def __init__(self, maxsize: int, ttl: float):
+        self._reports = LRUCache(maxsize=maxsize, ttl=ttl)
+        # (user_id, year, month) or (user_id,) -> sequence number of its last invalidation
+        self._invalidations = LRUCache(maxsize=maxsize * 4, on_evict=self._forget)
+        self._sequence = 0
+        # A forgotten invalidation is assumed to be as recent as the newest forgotten one
+        self._floor = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def _forget(self, key, sequence: int):
+        self._floor = max(self._floor, sequence)
+
+    def _invalidated_at(self, user_id: str, year: int, month: int):
+        return max(
+            self._invalidations.get((user_id, year, month), 0),
+            self._invalidations.get((user_id,), 0),
+            self._floor,
+        )
+
+    async def version(self):
+        return self._sequence
+
+    async def get(self, user_id, year, month):
+        entry = self._reports.get((str(user_id), year, month))
+        if entry is not None:
+            report, version = entry
+            if version >= self._invalidated_at(str(user_id), year, month):
+                self.hits += 1
+                return report
+
+        self.misses += 1
+        return None
+
+    async def set(self, user_id, year, month, report, version):
+        if version < self._invalidated_at(str(user_id), year, month):
+            return
+        self._reports.set((str(user_id), year, month), (report, version))
+
+    async def invalidate(self, user_id, months):
+        for year, month in set(months):
+            self._sequence += 1
+            self.invalidations += 1
+            self._invalidations.set((str(user_id), year, month), self._sequence)
+            self._reports.pop((str(user_id), year, month))
+
+    async def invalidate_user(self, user_id):
+        # Entries of the user are left to expire, _invalidated_at rejects them
+        self._sequence += 1
+        self.invalidations += 1
+        self._invalidations.set((str(user_id),), self._sequence)
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+            "invalidations": self.invalidations,
+            "size": len(self._reports),
+            "max_size": self._reports.maxsize,
+        }
+
+
+# Shared by the finance routes and the transaction service
+report_cache: ReportCache = InMemoryReportCache(
+    maxsize=settings.REPORT_CACHE_SIZE, ttl=settings.REPORT_CACHE_TTL
+)
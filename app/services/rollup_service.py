@@ -0,0 +1,316 @@
+from app.models.db.rollup_db import MonthlyCategoryRollup
+from app.models.db.amount_histogram_db import CategoryAmountHistogram
+from app.models.db.transaction_db import Transaction
+from app.db.session import SessionDep
+from app.db.engine import dialect_insert, engine, row_chunks
+from sqlmodel import select, delete, func, extract, true, cast, Integer
+from datetime import datetime, timezone
+from collections import defaultdict
+from fastapi import HTTPException
+import math
+
+# Sums are floats, a rollup matches the transactions when it is within this tolerance
+_TOLERANCE = 1e-6
+
+# Amount histogram buckets are 5% wide: bucket b holds amounts in [BUCKET_RATIO^b, BUCKET_RATIO^(b+1)).
+# Changing it requires rebuild_rollups.
+BUCKET_RATIO = 1.05
+_LOG_RATIO = math.log(BUCKET_RATIO)
+
+
+def rollup_key(occurred_at: datetime, category_id, direction: str):
+    """
+    Key of the rollup row a transaction belongs to (months are calendar months in UTC)
+    :param occurred_at: The time of the transaction (naive values are UTC)
+    :param category_id: An ID of a category
+    :param direction: In if it's an income or Out if it's an expense
+    :return a tuple of (year, month, category_id, direction)
+    """
+    if occurred_at.tzinfo:
+        occurred_at = occurred_at.astimezone(timezone.utc)
+    return occurred_at.year, occurred_at.month, category_id, direction
+
+
+def amount_bucket(amount: float):
+    """
+    Histogram bucket of an amount, log-scale so that the relative precision is the same for any amount
+    :param amount: A transaction amount
+    :return the bucket number, NONE when the amount is not positive
+    """
+    if amount <= 0:
+        return None
+    return math.floor(math.log(amount) / _LOG_RATIO)
+
+
+class RollupDeltas(defaultdict):
+    """
+    Mapping of rollup key -> [total delta, count delta], and in histogram the
+    mapping of (category_id, direction, bucket) -> count delta
+    """
+
+    def __init__(self):
+        super().__init__(lambda: [0.0, 0])
+        self.histogram = defaultdict(int)
+
+
+def new_deltas():
+    """
+    :return empty deltas of the rollups and amount histograms
+    """
+    return RollupDeltas()
+
+
+def add_delta(deltas, occurred_at: datetime, category_id, direction: str, amount: float, sign: int):
+    """
+    Record that a transaction is added (sign=1) or removed (sign=-1)
+    """
+    delta = deltas[rollup_key(occurred_at, category_id, direction)]
+    delta[0] += sign * amount
+    delta[1] += sign
+
+    bucket = amount_bucket(amount)
+    if bucket is not None:
+        deltas.histogram[(category_id, direction, bucket)] += sign
+
+
+async def apply_rollup_deltas(user_id: str, deltas, session: SessionDep):
+    """
+    Add deltas to the rollups of a user with multi-row upserts, without committing
+    :param user_id: A unique identifier for a user.
+    :param deltas: A mapping from new_deltas
+    :param session: A workspace for interacting with db
+    """
+    rows = [
+        {
+            "user_id": user_id,
+            "year": year,
+            "month": month,
+            "category_id": category_id,
+            "direction": direction,
+            "total": total,
+            "count": count,
+        }
+        for (year, month, category_id, direction), (total, count) in deltas.items()
+        # An update that doesn't move the transaction nets out to nothing
+        if count or abs(total) > _TOLERANCE
+    ]
+    for chunk in row_chunks(rows):
+        statement = dialect_insert(MonthlyCategoryRollup).values(chunk)
+        await session.exec(
+            statement.on_conflict_do_update(
+                index_elements=["user_id", "year", "month", "category_id", "direction"],
+                set_={
+                    "total": MonthlyCategoryRollup.total + statement.excluded.total,
+                    "count": MonthlyCategoryRollup.count + statement.excluded.count,
+                },
+            )
+        )
+
+
+async def apply_histogram_deltas(user_id: str, deltas, session: SessionDep):
+    """
+    Add the histogram deltas to the amount histograms of a user with multi-row upserts, without committing
+    :param user_id: A unique identifier for a user.
+    :param deltas: A mapping from new_deltas
+    :param session: A workspace for interacting with db
+    """
+    rows = [
+        {
+            "user_id": user_id,
+            "category_id": category_id,
+            "direction": direction,
+            "bucket": bucket,
+            "count": count,
+        }
+        for (category_id, direction, bucket), count in deltas.histogram.items()
+        if count
+    ]
+    for chunk in row_chunks(rows):
+        statement = dialect_insert(CategoryAmountHistogram).values(chunk)
+        await session.exec(
+            statement.on_conflict_do_update(
+                index_elements=["user_id", "category_id", "direction", "bucket"],
+                set_={"count": CategoryAmountHistogram.count + statement.excluded.count},
+            )
+        )
+
+
+def _utc(column):
+    # SQLite stores UTC values as they are, Postgres has to convert from the session time zone
+    if engine.dialect.name == "postgresql":
+        return func.timezone("UTC", column)
+    return column
+
+
+def grouped_rollups(*where):
+    """
+    Build a query aggregating transactions into rollup rows
+    :param where: Filters on the transactions
+    :return a select statement with the columns of monthly_category_rollups
+    """
+    occurred_at = _utc(Transaction.occurred_at)
+    year = extract("year", occurred_at)
+    month = extract("month", occurred_at)
+    return (
+        select(
+            Transaction.user_id,
+            year,
+            month,
+            Transaction.category_id,
+            Transaction.direction,
+            func.sum(Transaction.amount),
+            func.count(),
+        )
+        # SQLite needs a WHERE clause to parse INSERT ... SELECT ... ON CONFLICT
+        .where(true(), *where)
+        .group_by(
+            Transaction.user_id,
+            year,
+            month,
+            Transaction.category_id,
+            Transaction.direction,
+        )
+    )
+
+
+async def apply_rollup_query(query, session: SessionDep):
+    """
+    Add the rows of a grouped_rollups query to the rollups, without committing
+    :param query: A statement from grouped_rollups
+    :param session: A workspace for interacting with db
+    """
+    statement = dialect_insert(MonthlyCategoryRollup).from_select(
+        ["user_id", "year", "month", "category_id", "direction", "total", "count"],
+        query,
+    )
+    await session.exec(
+        statement.on_conflict_do_update(
+            index_elements=["user_id", "year", "month", "category_id", "direction"],
+            set_={
+                "total": MonthlyCategoryRollup.total + statement.excluded.total,
+                "count": MonthlyCategoryRollup.count + statement.excluded.count,
+            },
+        )
+    )
+
+
+def grouped_histograms(*where):
+    """
+    Build a query aggregating transactions into amount histogram rows, bucketed like amount_bucket
+    :param where: Filters on the transactions
+    :return a select statement with the columns of category_amount_histograms
+    """
+    bucket = cast(func.floor(func.ln(Transaction.amount) / _LOG_RATIO), Integer)
+    return (
+        select(
+            Transaction.user_id,
+            Transaction.category_id,
+            Transaction.direction,
+            bucket,
+            func.count(),
+        )
+        .where(Transaction.amount > 0, *where)
+        .group_by(
+            Transaction.user_id,
+            Transaction.category_id,
+            Transaction.direction,
+            bucket,
+        )
+    )
+
+
+async def apply_histogram_query(query, session: SessionDep):
+    """
+    Add the rows of a grouped_histograms query to the amount histograms, without committing
+    :param query: A statement from grouped_histograms
+    :param session: A workspace for interacting with db
+    """
+    statement = dialect_insert(CategoryAmountHistogram).from_select(
+        ["user_id", "category_id", "direction", "bucket", "count"], query
+    )
+    await session.exec(
+        statement.on_conflict_do_update(
+            index_elements=["user_id", "category_id", "direction", "bucket"],
+            set_={"count": CategoryAmountHistogram.count + statement.excluded.count},
+        )
+    )
+
+
+async def rebuild_rollups(session: SessionDep, user_id: str | None = None):
+    """
+    Recompute the rollups and amount histograms from the transactions (backfill or repair)
+    :param session: A workspace for interacting with db
+    :param user_id: Only rebuild the rollups of this user, all users if NONE
+    """
+    user_filter = [] if user_id is None else [Transaction.user_id == user_id]
+    rollup_filter = (
+        [] if user_id is None else [MonthlyCategoryRollup.user_id == user_id]
+    )
+    histogram_filter = (
+        [] if user_id is None else [CategoryAmountHistogram.user_id == user_id]
+    )
+
+    try:
+        await session.exec(delete(MonthlyCategoryRollup).where(*rollup_filter))
+        await apply_rollup_query(grouped_rollups(*user_filter), session)
+        await session.exec(delete(CategoryAmountHistogram).where(*histogram_filter))
+        await apply_histogram_query(grouped_histograms(*user_filter), session)
+        await session.commit()
+    except Exception as e:
+        raise HTTPException(
+            status_code=400,
+            detail=f"An error occurred while rebuilding the rollups: {e}",
+        )
+
+
+async def verify_rollups(session: SessionDep, user_id: str | None = None):
+    """
+    Compare the rollups with the transactions
+    :param session: A workspace for interacting with db
+    :param user_id: Only verify the rollups of this user, all users if NONE
+    :return a list of mismatches, empty when the rollups are consistent
+    """
+    user_filter = [] if user_id is None else [Transaction.user_id == user_id]
+    rollup_filter = (
+        [] if user_id is None else [MonthlyCategoryRollup.user_id == user_id]
+    )
+
+    expected = {
+        (str(row[0]), int(row[1]), int(row[2]), str(row[3]), row[4]): (row[5], row[6])
+        for row in (await session.exec(grouped_rollups(*user_filter))).all()
+    }
+    actual = {
+        (
+            str(row.user_id),
+            row.year,
+            row.month,
+            str(row.category_id),
+            row.direction,
+        ): (row.total, row.count)
+        for row in (
+            await session.exec(select(MonthlyCategoryRollup).where(*rollup_filter))
+        ).all()
+        if row.count
+    }
+
+    mismatches = []
+    for key in expected.keys() | actual.keys():
+        expected_total, expected_count = expected.get(key, (0.0, 0))
+        actual_total, actual_count = actual.get(key, (0.0, 0))
+        if (
+            expected_count != actual_count
+            or abs(expected_total - actual_total) > _TOLERANCE
+        ):
+            mismatches.append(
+                {
+                    "user_id": key[0],
+                    "year": key[1],
+                    "month": key[2],
+                    "category_id": key[3],
+                    "direction": key[4],
+                    "expected": {"total": expected_total, "count": expected_count},
+                    "actual": {"total": actual_total, "count": actual_count},
+                }
+            )
+
+    return mismatches
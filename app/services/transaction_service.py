@@ -1,9 +1,79 @@
-from app.models.db.transaction_db import Transaction
+from app.models.db.transaction_db import Transaction, search_document
 from app.models.db.category_db import Category
-from app.db.session import SessionDep
-from sqlmodel import select
+from app.db.session import SessionDep, session_scope
+from app.db.replicas import replica_router
+from sqlalchemy.ext.asyncio import AsyncEngine
+from sqlmodel import select, tuple_, insert, delete, func, text
 from fastapi import HTTPException
-from app.models.api.transaction import TransactionUpdate
+from app.models.api.transaction import (
+    TransactionUpdate,
+    TransactionRead,
+    TransactionCreate,
+    TransactionBulkItemResult,
+)
+from app.services.category_service import (
+    get_or_create_category_id,
+    get_or_create_category_ids,
+)
+from app.services.rollup_service import (
+    new_deltas,
+    add_delta,
+    apply_rollup_deltas,
+    apply_histogram_deltas,
+)
+from app.services.report_cache import report_cache
+from app.services.recurring_service import invalidate_recurring
+from datetime import date, datetime, timedelta, timezone
+from uuid import UUID, uuid4
+import base64
+import re
+
+
+async def _after_write(user_id: str, deltas, session: SessionDep):
+    """
+    Keep the data derived from transactions in sync, in the same DB transaction as the write
+    :param user_id: A unique identifier for a user
+    :param deltas: Rollup deltas of the written transactions (see rollup_service.new_deltas)
+    :param session: A workspace for interacting with db
+    """
+    await apply_rollup_deltas(user_id=user_id, deltas=deltas, session=session)
+    await apply_histogram_deltas(user_id=user_id, deltas=deltas, session=session)
+
+
+async def _after_commit(user_id: str, deltas):
+    """
+    Drop what was cached about the months touched by a committed write
+    :param user_id: A unique identifier for a user
+    :param deltas: Rollup deltas of the written transactions (including the old month of an update)
+    """
+    await report_cache.invalidate(
+        user_id, {(year, month) for year, month, _, _ in deltas}
+    )
+    # Read replicas may not have the write yet
+    replica_router.mark_write(user_id)
+
+
+def _transaction_read_query(user_id: str):
+    """
+    Build a query that projects transactions together with their category name and type
+    :param user_id: A unique identifier for a user
+    :return a select statement whose rows map onto TransactionRead
+    """
+    return (
+        select(
+            Transaction.transaction_id,
+            Transaction.category_id,
+            Transaction.amount,
+            Transaction.direction,
+            Transaction.description,
+            Transaction.occurred_at,
+            Transaction.created_at,
+            Category.name.label("category_name"),
+            Category.type.label("category_type"),
+        )
+        .join(Category, Category.category_id == Transaction.category_id)
+        .where(Transaction.user_id == user_id)
+    )
 
 
 async def add_transaction(
@@ -37,9 +107,15 @@ async def add_transaction(
             description=description,
         )
 
+        # All values are set client-side, so no refresh round trip is needed after commit
         session.add(transaction)
-        session.commit()
-        session.refresh(transaction)
+
+        deltas = new_deltas()
+        add_delta(deltas, occurred_at, category_id, direction, amount, 1)
+        await _after_write(user_id, deltas, session)
+
+        await session.commit()
+        await _after_commit(user_id, deltas)
 
         return transaction
     except Exception as e:
@@ -49,27 +125,299 @@ async def add_transaction(
         )
 
 
-async def get_list_transactions(user_id: str, session: SessionDep):
+def encode_cursor(transaction: TransactionRead):
     """
-    Retrieve a list of transactions
+    Encode the position of a transaction in the listing order into an opaque cursor
+    :param transaction: The last transaction of a page
+    :return a url-safe cursor string
+    """
+    raw = f"{transaction.occurred_at.isoformat()}|{transaction.transaction_id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def decode_cursor(cursor: str):
+    """
+    Decode a cursor produced by encode_cursor
+    :param cursor: A cursor from a previous page
+    :return a tuple of (occurred_at, transaction_id)
+    """
+    try:
+        occurred_at, transaction_id = (
+            base64.urlsafe_b64decode(cursor.encode()).decode().split("|")
+        )
+        return datetime.fromisoformat(occurred_at), UUID(transaction_id)
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor!")
+
+
+def _ordered_transaction_read_query(user_id: str):
+    """
+    Listing order is newest first, the transaction ID breaks ties so the order is total
     :param user_id: A unique identifier for a user
+    :return a select statement ordered by (occurred_at, transaction_id) desc
+    """
+    return _transaction_read_query(user_id).order_by(
+        Transaction.occurred_at.desc(), Transaction.transaction_id.desc()
+    )
+
+
+async def add_transactions_bulk(
+    user_id: str, items: list[TransactionCreate], session: SessionDep
+):
+    """
+    Add many transactions in one DB transaction
+    :param user_id: A unique identifier for a user.
+    :param items: Details of the transactions
     :param session: A workspace for interacting with db
-    :return a list of transactions
+    :return a result per item, in the same order as items
     """
 
+    results = [None] * len(items)
+    valid = []
+    for index, item in enumerate(items):
+        if item.amount <= 0:
+            results[index] = TransactionBulkItemResult(
+                index=index, status="error", detail="Amount must be greater than 0!"
+            )
+        else:
+            valid.append((index, item))
+
+    if not valid:
+        return results
+
+    # Resolve every distinct category with one batched upsert
+    category_ids = await get_or_create_category_ids(
+        user_id=user_id,
+        categories={(item.category_name, item.category_type) for _, item in valid},
+        session=session,
+    )
+
+    now = datetime.now(timezone.utc)
+    rows = [
+        {
+            "transaction_id": uuid4(),
+            "user_id": user_id,
+            "category_id": category_ids[(item.category_name, item.category_type)],
+            "amount": item.amount,
+            # In for income and Out for Expense
+            "direction": "in" if item.category_type == "income" else "out",
+            "description": item.description,
+            "occurred_at": item.occurred_at,
+            "created_at": now,
+        }
+        for _, item in valid
+    ]
+
     try:
-        transactions = session.exec(
-            select(Transaction)
-            .where(Transaction.user_id == user_id)
-            .order_by(Transaction.occurred_at.desc())
-        ).all()
+        # executemany is batched into multi-row INSERTs by the driver
+        await session.exec(insert(Transaction), params=rows)
+
+        deltas = new_deltas()
+        for row in rows:
+            add_delta(
+                deltas,
+                row["occurred_at"],
+                row["category_id"],
+                row["direction"],
+                row["amount"],
+                1,
+            )
+        await _after_write(user_id, deltas, session)
+
+        await session.commit()
+        await _after_commit(user_id, deltas)
+    except Exception as e:
+        raise HTTPException(
+            status_code=400,
+            detail=f"An error occurred while creating the transactions in db: {e}",
+        )
+
+    for (index, item), row in zip(valid, rows):
+        results[index] = TransactionBulkItemResult(
+            index=index,
+            status="created",
+            transaction=TransactionRead(
+                **row, category_name=item.category_name, category_type=item.category_type
+            ),
+        )
+
+    return results
+
+
+async def get_list_transactions(
+    user_id: str, session: SessionDep, limit: int = 100, cursor: str | None = None
+):
+    """
+    Retrieve a page of transactions with their category details (one joined query)
+    :param user_id: A unique identifier for a user
+    :param session: A workspace for interacting with db
+    :param limit: The maximum number of transactions in the page
+    :param cursor: The cursor returned with the previous page or NONE for the first page
+    :return a tuple of (list of transactions, cursor of the next page or NONE)
+    """
+
+    query = _ordered_transaction_read_query(user_id)
+
+    # Keyset pagination: continue strictly after the last row of the previous page
+    if cursor:
+        query = query.where(
+            tuple_(Transaction.occurred_at, Transaction.transaction_id)
+            < tuple_(*decode_cursor(cursor))
+        )
+
+    try:
+        # Fetch one extra row to know whether there is a next page
+        rows = (await session.exec(query.limit(limit + 1))).all()
     except Exception as e:
         raise HTTPException(
             status_code=400,
             detail=f"An error occurred while retrieving the list of transactions: {e}",
         )
 
-    return transactions
+    transactions = [TransactionRead(**row._mapping) for row in rows[:limit]]
+    next_cursor = encode_cursor(transactions[-1]) if len(rows) > limit else None
+
+    return transactions, next_cursor
+
+
+def _search_terms(query: str):
+    """
+    Words of a search query, lower case; punctuation is dropped so it never reaches a query syntax
+    """
+    return re.findall(r"[^\W_]+", query.lower())
+
+
+def _text_match(user_id: str, terms: list[str], dialect: str):
+    """
+    Filter on the transactions whose description has every term, as a prefix of one of its words
+    :param user_id: A unique identifier for a user
+    :param terms: Words from _search_terms
+    :param dialect: postgresql uses the GIN index of search documents, sqlite the FTS5 table
+    :return a where clause
+    """
+    if dialect == "postgresql":
+        return search_document(Transaction.description).op("@@")(
+            func.to_tsquery("simple", " & ".join(f"{term}:*" for term in terms))
+        )
+
+    match = f'user_id:"{UUID(str(user_id)).hex}" AND description:(' + " ".join(
+        f'"{term}"*' for term in terms
+    ) + ")"
+    return Transaction.transaction_id.in_(
+        select(text("transaction_id"))
+        .select_from(text("transactions_fts"))
+        .where(text("transactions_fts MATCH :match").bindparams(match=match))
+    )
+
+
+async def search_transactions(
+    user_id: str,
+    session: SessionDep,
+    query: str | None = None,
+    start: date | None = None,
+    end: date | None = None,
+    direction: str | None = None,
+    category_name: str | None = None,
+    min_amount: float | None = None,
+    max_amount: float | None = None,
+    limit: int = 100,
+    cursor: str | None = None,
+):
+    """
+    Search the transactions of a user by description and filters, newest first, a page at a time
+    :param user_id: A unique identifier for a user
+    :param session: A workspace for interacting with db
+    :param query: Words the description must have (each may be the start of a word), NONE for any
+    :param start: First day searched, the whole history if NONE
+    :param end: Last day searched (inclusive), up to the latest transaction if NONE
+    :param direction: in or out, both if NONE
+    :param category_name: Name of the category, all if NONE
+    :param min_amount: Lowest amount, inclusive
+    :param max_amount: Highest amount, inclusive
+    :param limit: The maximum number of transactions in the page
+    :param cursor: The cursor returned with the previous page or NONE for the first page
+    :return a tuple of (list of transactions, cursor of the next page or NONE)
+    """
+
+    statement = _ordered_transaction_read_query(user_id)
+
+    terms = _search_terms(query or "")
+    if terms:
+        statement = statement.where(
+            _text_match(user_id, terms, session.bind.dialect.name)
+        )
+    if start is not None:
+        statement = statement.where(
+            Transaction.occurred_at
+            >= datetime(start.year, start.month, start.day, tzinfo=timezone.utc)
+        )
+    # There is no day after date.max, the range is then open-ended
+    if end is not None and end < date.max:
+        statement = statement.where(
+            Transaction.occurred_at
+            < datetime(end.year, end.month, end.day, tzinfo=timezone.utc) + timedelta(days=1)
+        )
+    if direction is not None:
+        statement = statement.where(Transaction.direction == direction)
+    if category_name is not None:
+        # By ID, a category belongs to one user so its index only holds this user's transactions
+        statement = statement.where(
+            Transaction.category_id.in_(
+                select(Category.category_id)
+                .where(Category.user_id == user_id)
+                .where(Category.name == category_name)
+            )
+        )
+    if min_amount is not None:
+        statement = statement.where(Transaction.amount >= min_amount)
+    if max_amount is not None:
+        statement = statement.where(Transaction.amount <= max_amount)
+
+    # Keyset pagination in the listing order, as get_list_transactions
+    if cursor:
+        statement = statement.where(
+            tuple_(Transaction.occurred_at, Transaction.transaction_id)
+            < tuple_(*decode_cursor(cursor))
+        )
+
+    try:
+        # Fetch one extra row to know whether there is a next page
+        rows = (await session.exec(statement.limit(limit + 1))).all()
+    except Exception as e:
+        raise HTTPException(
+            status_code=400,
+            detail=f"An error occurred while searching the transactions: {e}",
+        )
+
+    transactions = [TransactionRead(**row._mapping) for row in rows[:limit]]
+    next_cursor = encode_cursor(transactions[-1]) if len(rows) > limit else None
+
+    return transactions, next_cursor
+
+
+async def stream_transactions(
+    user_id: str, batch_size: int = 1000, bind: AsyncEngine | None = None
+):
+    """
+    Stream the whole transaction history as NDJSON through a server-side cursor
+    :param user_id: A unique identifier for a user
+    :param batch_size: The number of rows fetched from the cursor at a time
+    :param bind: The engine to read from (a read replica), the primary if NONE
+    :return an async generator of NDJSON chunks
+    """
+
+    # The request session is closed before a streaming body is sent, so use our own
+    async with session_scope(bind=bind) as session:
+        result = await session.stream(
+            _ordered_transaction_read_query(user_id).execution_options(
+                yield_per=batch_size
+            )
+        )
+        async for rows in result.partitions():
+            yield "".join(
+                TransactionRead(**row._mapping).model_dump_json() + "\n"
+                for row in rows
+            )
 
 
 async def get_transaction_by_id(transaction_id: str, user_id: str, session: SessionDep):
@@ -82,10 +430,12 @@ async def get_transaction_by_id(transaction_id: str, user_id: str, session: Sess
     """
 
     try:
-        transaction = session.exec(
-            select(Transaction)
-            .where(Transaction.user_id == user_id)
-            .where(Transaction.transaction_id == transaction_id)
+        transaction = (
+            await session.exec(
+                select(Transaction)
+                .where(Transaction.user_id == user_id)
+                .where(Transaction.transaction_id == transaction_id)
+            )
         ).first()
     except Exception as e:
         raise HTTPException(
@@ -96,30 +446,91 @@ async def get_transaction_by_id(transaction_id: str, user_id: str, session: Sess
     return transaction
 
 
+async def get_transaction_read_by_id(
+    transaction_id: str, user_id: str, session: SessionDep
+):
+    """
+    Retrieve a transaction by ID with its category details (one joined query)
+    :param transaction_id: Transaction ID
+    :param user_id: A unique identifier for a user
+    :param session: A workspace for interacting with db
+    :return a transaction by its id or NONE if it isn't in db
+    """
+
+    try:
+        row = (
+            await session.exec(
+                _transaction_read_query(user_id).where(
+                    Transaction.transaction_id == transaction_id
+                )
+            )
+        ).first()
+    except Exception as e:
+        raise HTTPException(
+            status_code=400,
+            detail=f"An error occurred while retrieving the {transaction_id} transaction: {e}",
+        )
+
+    return TransactionRead(**row._mapping) if row else None
+
+
 async def remove_transaction(transaction_id: str, user_id: str, session: SessionDep):
     """
     Remove a transaction by ID
     :param transaction_id: Transaction ID
     :param user_id: A unique identifier for a user
     :param session: A workspace for interacting with db
-    :return a transaction is removed from db
+    :return whether the transaction was removed (False if it doesn't exist or was removed meanwhile)
     """
 
     try:
-        transaction = session.exec(
-            select(Transaction)
+        # Locked until the commit: a concurrent update or removal of the same transaction waits,
+        # so the rollups lose its old values once
+        transaction = (
+            await session.exec(
+                select(Transaction)
+                .where(Transaction.user_id == user_id)
+                .where(Transaction.transaction_id == transaction_id)
+                .with_for_update()
+                .execution_options(populate_existing=True)
+            )
+        ).first()
+        if transaction is None:
+            return False
+
+        result = await session.exec(
+            delete(Transaction)
             .where(Transaction.user_id == user_id)
             .where(Transaction.transaction_id == transaction_id)
-        ).first()
+        )
+        # SQLite does not lock rows, a concurrent removal may have won and applied the deltas
+        if result.rowcount == 0:
+            await session.rollback()
+            return False
 
-        session.delete(transaction)
-        session.commit()
+        deltas = new_deltas()
+        add_delta(
+            deltas,
+            transaction.occurred_at,
+            transaction.category_id,
+            transaction.direction,
+            transaction.amount,
+            -1,
+        )
+        await _after_write(user_id, deltas, session)
+
+        await session.commit()
+        await _after_commit(user_id, deltas)
+        # Only new transactions are picked up incrementally
+        invalidate_recurring(user_id)
     except Exception as e:
         raise HTTPException(
             status_code=400,
             detail=f"An error while removing the {transaction_id} transaction: {e}",
         )
 
+    return True
+
 
 async def update_transaction_in_db(
     transaction_id: str, user_id: str, data: TransactionUpdate, session: SessionDep
@@ -133,15 +544,31 @@ async def update_transaction_in_db(
     :return an updated transaction
     """
 
-    transaction = session.exec(
-        select(Transaction)
-        .where(Transaction.transaction_id == transaction_id)
-        .where(Transaction.user_id == user_id)
+    # Locked until the commit, so that concurrent updates each start from the values the other left
+    transaction = (
+        await session.exec(
+            select(Transaction)
+            .where(Transaction.transaction_id == transaction_id)
+            .where(Transaction.user_id == user_id)
+            .with_for_update()
+            .execution_options(populate_existing=True)
+        )
     ).first()
 
     if not transaction:
         raise HTTPException(status_code=404, detail="Transaction not found")
 
+    # Take the transaction out of its current rollup, it is added back with its new values
+    deltas = new_deltas()
+    add_delta(
+        deltas,
+        transaction.occurred_at,
+        transaction.category_id,
+        transaction.direction,
+        transaction.amount,
+        -1,
+    )
+
     # Update amount
     if data.amount is not None:
         if data.amount <= 0:
@@ -158,32 +585,33 @@ async def update_transaction_in_db(
     if data.occurred_at is not None:
         transaction.occurred_at = data.occurred_at
 
-    # Update category
+    # Update category (created in the same DB transaction if needed)
     if data.category_name and data.category_type:
-        category = session.exec(
-            select(Category)
-            .where(Category.user_id == user_id)
-            .where(Category.name == data.category_name)
-            .where(Category.type == data.category_type)
-        ).first()
-
-        if not category:
-            category = Category(
-                user_id=user_id,
-                name=data.category_name,
-                type=data.category_type,
-            )
-            session.add(category)
-            session.commit()
-            session.refresh(category)
-
-        transaction.category_id = category.category_id
+        transaction.category_id = await get_or_create_category_id(
+            user_id=user_id,
+            category_name=data.category_name,
+            category_type=data.category_type,
+            session=session,
+        )
 
         # Direction stays deterministic
         transaction.direction = "in" if data.category_type == "income" else "out"
 
     session.add(transaction)
-    session.commit()
-    session.refresh(transaction)
+
+    add_delta(
+        deltas,
+        transaction.occurred_at,
+        transaction.category_id,
+        transaction.direction,
+        transaction.amount,
+        1,
+    )
+    await _after_write(user_id, deltas, session)
+
+    await session.commit()
+    await _after_commit(user_id, deltas)
+    # Only new transactions are picked up incrementally
+    invalidate_recurring(user_id)
 
     return transaction
@@ -1,7 +1,18 @@
 from app.models.db.user_db import User
-from app.db.session import SessionDep
-from sqlmodel import select
+from app.db.session import SessionDep, on_commit, session_scope
+from app.config import settings
+from app.utils.jwt_handler import revoked_user_ids
+from app.utils.lru_cache import LRUCache
+from sqlmodel import select, update
+from sqlalchemy.exc import IntegrityError
 from fastapi import HTTPException
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+# user_id -> User, dropped whenever the user is updated
+_user_cache = LRUCache(maxsize=settings.USER_CACHE_SIZE, ttl=settings.USER_CACHE_TTL)
 
 
 async def get_user_by_email_from_db(email: str, session: SessionDep):
@@ -11,8 +22,8 @@ async def get_user_by_email_from_db(email: str, session: SessionDep):
     :param session: A workspace for interacting with db
     """
     try:
-        existing_email = session.exec(
-            select(User).where(User.user_email == email)
+        existing_email = (
+            await session.exec(select(User).where(User.user_email == email))
         ).first()
     except Exception as e:
         raise HTTPException(
@@ -29,8 +40,8 @@ async def get_user_by_username_from_db(username: str, session: SessionDep):
     :param session: A workspace for interacting with db
     """
     try:
-        existing_username = session.exec(
-            select(User).where(User.username == username)
+        existing_username = (
+            await session.exec(select(User).where(User.username == username))
         ).first()
     except Exception as e:
         raise HTTPException(
@@ -47,8 +58,8 @@ async def get_user_by_user_id_from_db(user_id: str, session: SessionDep):
     :param session: A workspace for interacting with db
     """
     try:
-        user_id = session.exec(
-            select(User).where(User.user_id == user_id)
+        user_id = (
+            await session.exec(select(User).where(User.user_id == user_id))
         ).first()
     except Exception as e:
         raise HTTPException(
@@ -57,6 +68,25 @@ async def get_user_by_user_id_from_db(user_id: str, session: SessionDep):
         )
     return user_id
 
+async def get_cached_user(user_id: str, session: SessionDep):
+    """
+    Get user information by their user_id, from memory when it was read recently
+    :param user_id: User user_id
+    :param session: A workspace for interacting with db
+    :return the user or NONE
+    """
+    user = _user_cache.get(str(user_id))
+    if user is None:
+        user = await get_user_by_user_id_from_db(user_id, session)
+        if user is not None:
+            _user_cache.set(str(user_id), user)
+    return user
+
+
+def invalidate_cached_user(user_id: str):
+    _user_cache.pop(str(user_id))
+
+
 async def create_user_in_db(
     username: str, user_email: str, password: str, session: SessionDep
 ):
@@ -67,7 +97,7 @@ async def create_user_in_db(
     :password: A hashed password
     :param session: A workspace for interacting with db
     """
-    # Create new user into a db
+    # Create new user into a db, the unique constraints reject a taken username or email
     try:
         user = User(
             username=username,
@@ -76,12 +106,99 @@ async def create_user_in_db(
         )
 
         session.add(user)
-        session.commit()
-        session.refresh(user)
+        await session.commit()
 
         return user
+    except IntegrityError as e:
+        await session.rollback()
+        # Postgres names the violated constraint, SQLite names the column
+        taken = user_email if "user_email" in str(e.orig) else username
+        raise HTTPException(status_code=400, detail=f"{taken} already registered")
     except Exception as e:
         raise HTTPException(
             status_code=400,
             detail=f"An error occurred while creating a new user in db: {e}",
-        )
\ No newline at end of file
+        )
+
+
+async def update_user_password_hash(user: User, hashed_password: str, session: SessionDep):
+    """
+    Replace the stored password hash of a user (rehash on login)
+    :param user: The user
+    :param hashed_password: The new hash
+    :param session: A workspace for interacting with db
+    """
+    try:
+        await session.exec(
+            update(User)
+            .where(User.user_id == user.user_id)
+            .values(hashed_password=hashed_password)
+        )
+        on_commit(session, lambda: invalidate_cached_user(user.user_id))
+        await session.commit()
+    except Exception as e:
+        raise HTTPException(
+            status_code=400,
+            detail=f"An error occurred while updating user's password in db: {e}",
+        )
+
+
+async def set_user_active(user_id: str, is_active: bool, session: SessionDep):
+    """
+    Activate or deactivate a user, the tokens of a deactivated user are rejected
+    :param user_id: User user_id
+    :param is_active: Whether the user may use the app
+    :param session: A workspace for interacting with db
+    :return whether the user exists
+    """
+
+    def apply():
+        invalidate_cached_user(user_id)
+        if is_active:
+            revoked_user_ids.discard(str(user_id))
+        else:
+            revoked_user_ids.add(str(user_id))
+
+    try:
+        result = await session.exec(
+            update(User).where(User.user_id == user_id).values(is_active=is_active)
+        )
+        on_commit(session, apply)
+        await session.commit()
+    except Exception as e:
+        raise HTTPException(
+            status_code=400,
+            detail=f"An error occurred while updating user's status in db: {e}",
+        )
+    return result.rowcount > 0
+
+
+async def load_revoked_users(session: SessionDep):
+    """
+    Reload the IDs of the deactivated users (one query for all of them)
+    :param session: A workspace for interacting with db
+    """
+    user_ids = (
+        await session.exec(select(User.user_id).where(User.is_active == False))
+    ).all()
+    revoked = {str(user_id) for user_id in user_ids}
+    # Users activated elsewhere are dropped from the cache so /profile sees their new record
+    for user_id in revoked_user_ids ^ revoked:
+        invalidate_cached_user(user_id)
+    revoked_user_ids.clear()
+    revoked_user_ids.update(revoked)
+
+
+async def watch_revoked_users(interval: float):
+    """
+    Reload the deactivated users every interval seconds, until cancelled
+    (users deactivated by another process, e.g. the CLI, are picked up within it)
+    :param interval: Seconds between reloads
+    """
+    while True:
+        try:
+            async with session_scope() as session:
+                await load_revoked_users(session)
+        except Exception:
+            logger.exception("An error occurred while loading the deactivated users")
+        await asyncio.sleep(interval)
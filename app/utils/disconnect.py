@@ -0,0 +1,25 @@
+import asyncio
+from fastapi import HTTPException, Request
+
+
+async def run_until_disconnected(request: Request, awaitable, poll_interval: float = 0.5):
+    """
+    Await something slow (e.g. an LLM call) and cancel it if the HTTP client goes away
+    :param request: The incoming request
+    :param awaitable: A coroutine to run
+    :param poll_interval: Seconds between two disconnection checks
+    :return the result of the awaitable
+    """
+    task = asyncio.ensure_future(awaitable)
+    try:
+        while True:
+            done, _ = await asyncio.wait({task}, timeout=poll_interval)
+            if done:
+                return task.result()
+            if await request.is_disconnected():
+                task.cancel()
+                # 499: nginx's "client closed request", nobody is left to read it
+                raise HTTPException(status_code=499, detail="Client disconnected")
+    finally:
+        # The request itself may be cancelled too
+        task.cancel()
@@ -1,14 +1,30 @@
 import jwt
+import asyncio
+import hashlib
+import time
 from app.config import settings
+from app.utils.lru_cache import LRUCache
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta, timezone
 from passlib.context import CryptContext
 from fastapi import HTTPException, Header
+from uuid import UUID
 
 SECRET_KEY = settings.SECRET_KEY
 ALGORITHM = "HS256"
 
-# Password hasing
-pwd_context = CryptContext(schemes=["bcrypt"])
+# Password hasing, a hash with another cost factor needs an update
+pwd_context = CryptContext(
+    schemes=["bcrypt"],
+    bcrypt__rounds=settings.PASSWORD_HASH_ROUNDS,
+    bcrypt__min_rounds=settings.PASSWORD_HASH_ROUNDS,
+    bcrypt__max_rounds=settings.PASSWORD_HASH_ROUNDS,
+)
+
+# bcrypt is CPU bound and releases the GIL, a few threads run it without blocking the event loop
+_password_pool = ThreadPoolExecutor(
+    max_workers=settings.PASSWORD_HASH_WORKERS, thread_name_prefix="password"
+)
 
 
 def verify_password(plain_password, hashed_password):
@@ -19,6 +35,37 @@ def get_password_hash(password: str):
     return pwd_context.hash(password)
 
 
+async def hash_password(password: str):
+    """
+    Hash a password on the password thread pool
+    :param password: The plain password
+    :return the bcrypt hash
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_password_pool, get_password_hash, password)
+
+
+async def verify_and_update_password(plain_password: str, hashed_password: str):
+    """
+    Verify a password on the password thread pool
+    :param plain_password: The password to check
+    :param hashed_password: The stored hash
+    :return a tuple of (whether the password matches, a new hash to store if the cost factor changed or NONE)
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(
+        _password_pool, pwd_context.verify_and_update, plain_password, hashed_password
+    )
+
+
+# sha256 of a token -> its decoded payload, each entry expires with its token
+_token_cache = LRUCache(maxsize=settings.TOKEN_CACHE_SIZE)
+
+# IDs of deactivated users, their tokens are rejected without a query
+# (kept up to date by app.services.user_service)
+revoked_user_ids: set[str] = set()
+
+
 def create_backend_token(id: str, expires_in: int = 3600):
     """
     Generate a JWT token for backend functionalities
@@ -43,7 +90,12 @@ def jwt_required(authorization: str = Header(None, alias="Authorization")):
         )
 
     token = authorization.split(" ")[1]
-    return validate_backend_token(token=token)
+    payload = validate_backend_token(token=token)
+
+    if str(payload.get("sub")) in revoked_user_ids:
+        raise HTTPException(status_code=401, detail="User is inactive")
+
+    return payload
 
 
 def validate_backend_token(token: str):
@@ -53,10 +105,27 @@ def validate_backend_token(token: str):
     :return: Decoded payload if valid.
     """
 
+    # A token that was already validated is only checked again once it expires
+    digest = hashlib.sha256(token.encode()).digest()
+    payload = _token_cache.get(digest)
+    if payload is not None:
+        return payload
+
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        return payload
     except jwt.ExpiredSignatureError:
         raise HTTPException(status_code=401, detail="Token expired")
     except jwt.InvalidTokenError:
         raise HTTPException(status_code=401, detail="Invalid token")
+
+    # Claims are strings, the DB layer binds UUIDs (SQLite has no native UUID type)
+    try:
+        payload["sub"] = UUID(payload["sub"])
+    except (KeyError, TypeError, ValueError):
+        raise HTTPException(status_code=401, detail="Invalid token")
+
+    ttl = payload["exp"] - time.time() if "exp" in payload else None
+    if ttl is None or ttl > 0:
+        _token_cache.set(digest, payload, ttl=ttl)
+
+    return payload
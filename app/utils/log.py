@@ -0,0 +1,48 @@
+from app.config import settings
+from datetime import datetime, timezone
+import json
+import logging
+
+# Attributes every LogRecord has, anything else was passed through extra={...}
+_RESERVED = set(logging.LogRecord("", 0, "", 0, "", (), None).__dict__) | {"message"}
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    One JSON object per line, with the fields passed through extra={...}
+    """
+
+    def format(self, record: logging.LogRecord):
+        entry = {
+            "time": datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        entry.update(
+            (key, value) for key, value in record.__dict__.items() if key not in _RESERVED
+        )
+        if record.exc_info:
+            entry["exc_info"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+def configure_logging():
+    """
+    Set up the root logger from LOG_LEVEL and LOG_FORMAT, and the SQL statement log from SQL_LOG_LEVEL.
+    Records below a level are dropped before they are formatted.
+    """
+    handler = logging.StreamHandler()
+    if settings.LOG_FORMAT == "json":
+        handler.setFormatter(JsonFormatter())
+    else:
+        handler.setFormatter(
+            logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s")
+        )
+
+    root = logging.getLogger()
+    root.handlers = [handler]
+    root.setLevel(settings.LOG_LEVEL.upper())
+
+    # INFO logs every SQL statement (what echo=True did), DEBUG also logs the result rows
+    logging.getLogger("sqlalchemy.engine").setLevel(settings.SQL_LOG_LEVEL.upper())
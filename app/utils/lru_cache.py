@@ -0,0 +1,84 @@
+from collections import OrderedDict
+from typing import Any, Callable, Hashable, Optional
+import threading
+import time
+
+
+class LRUCache:
+    """
+    A bounded in-process mapping that evicts the least recently used entry when it is full.
+    Entries optionally expire ttl seconds after they are set.
+    Safe to share between threads (sync dependencies run on the threadpool).
+    """
+
+    def __init__(
+        self,
+        maxsize: int,
+        ttl: Optional[float] = None,
+        on_evict: Optional[Callable[[Hashable, Any], None]] = None,
+    ):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.on_evict = on_evict
+        # key -> (expiry time or NONE, value)
+        self._data: OrderedDict = OrderedDict()
+        # Reentrant, an on_evict callback may use the cache
+        self._lock = threading.RLock()
+
+    def get(self, key: Hashable, default: Any = None):
+        """
+        Get a cached value and mark it as recently used
+        :param key: Cache key
+        :param default: Returned when the key isn't cached or has expired
+        :return the cached value or default
+        """
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return default
+            expires_at, value = entry
+            if expires_at is not None and expires_at <= time.monotonic():
+                self._data.pop(key, None)
+                return default
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None):
+        """
+        Cache a value, evicting the least recently used entry if the cache is full
+        :param key: Cache key
+        :param value: Value to cache
+        :param ttl: Seconds until the entry expires, defaults to the ttl of the cache
+        """
+        ttl = self.ttl if ttl is None else ttl
+        expires_at = time.monotonic() + ttl if ttl is not None else None
+        with self._lock:
+            self._data[key] = (expires_at, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                evicted_key, (_, evicted_value) = self._data.popitem(last=False)
+                if self.on_evict:
+                    self.on_evict(evicted_key, evicted_value)
+
+    def pop(self, key: Hashable, default: Any = None):
+        """
+        Remove a key from the cache
+        :param key: Cache key
+        :return the removed value or default
+        """
+        with self._lock:
+            entry = self._data.pop(key, None)
+        return default if entry is None else entry[1]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __contains__(self, key: Hashable):
+        return self.get(key, _MISSING) is not _MISSING
+
+    def __len__(self):
+        return len(self._data)
+
+
+_MISSING = object()
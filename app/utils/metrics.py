@@ -0,0 +1,141 @@
+from prometheus_client import Counter, Gauge, Histogram, REGISTRY
+from prometheus_client.core import GaugeMetricFamily
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncEngine
+import time
+
+# Served at GET /metrics in the Prometheus text format
+
+HTTP_REQUEST_SECONDS = Histogram(
+    "http_request_duration_seconds",
+    "Latency of HTTP requests until the response is sent",
+    ["method", "route", "status"],
+)
+
+DB_QUERY_SECONDS = Histogram(
+    "db_query_duration_seconds",
+    "Time spent executing SQL statements, the _count series counts them",
+    ["engine", "statement"],
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5),
+)
+
+LLM_CALL_SECONDS = Histogram(
+    "llm_call_duration_seconds",
+    "Latency of LLM generations, from sending the prompt to the last token",
+    ["call", "outcome"],
+    buckets=(0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120),
+)
+
+LLM_TOKENS = Counter(
+    "llm_tokens_total",
+    "Prompt and completion tokens reported by the model server",
+    ["kind"],
+)
+
+DB_READ_SESSIONS = Counter(
+    "db_read_sessions_total",
+    "Read-only sessions by where they were routed: replica, primary, or primary after the user's own write",
+    ["target"],
+)
+
+DB_REPLICA_HEALTHY = Gauge(
+    "db_replica_healthy",
+    "Whether a read replica passed its last health check",
+    ["replica"],
+)
+
+REPORT_PHASE_SECONDS = Histogram(
+    "report_phase_duration_seconds",
+    "Time spent in each phase of getting a monthly report",
+    ["phase"],
+    buckets=(0.0001, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1),
+)
+
+
+class MetricsMiddleware:
+    """
+    ASGI middleware observing the latency of every request in HTTP_REQUEST_SECONDS.
+    Requests are labelled with their route template (/transaction/{id}), not their path.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        started = time.perf_counter()
+        status = 500
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            route = scope.get("route")
+            HTTP_REQUEST_SECONDS.labels(
+                method=scope["method"],
+                route=route.path if route is not None else "unmatched",
+                status=status,
+            ).observe(time.perf_counter() - started)
+
+
+def instrument_engine(engine: AsyncEngine, name: str):
+    """
+    Time every statement executed by the engine and export its connection pool stats
+    :param engine: An app-wide async engine
+    :param name: The engine label of its metrics (primary, replica0, ...)
+    """
+    sync_engine = engine.sync_engine
+
+    @event.listens_for(sync_engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+    @event.listens_for(sync_engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        started = conn.info["query_started"].pop()
+        # The first keyword is a bounded label: SELECT, INSERT, UPDATE, DELETE, ...
+        keyword = statement.lstrip().split(None, 1)[0].upper() if statement.strip() else "OTHER"
+        DB_QUERY_SECONDS.labels(engine=name, statement=keyword).observe(
+            time.perf_counter() - started
+        )
+
+    @event.listens_for(sync_engine, "handle_error")
+    def _error(context):
+        # A failed statement never reaches after_cursor_execute
+        if context.connection is not None:
+            started = context.connection.info.get("query_started")
+            if started:
+                started.pop()
+
+    _pool_collector.pools[name] = sync_engine.pool
+
+
+class _PoolCollector:
+    def __init__(self):
+        # engine label -> pool
+        self.pools = {}
+
+    def collect(self):
+        for metric, documentation, method in (
+            ("db_pool_size", "Connections the pool keeps open", "size"),
+            ("db_pool_checked_in", "Idle connections in the pool", "checkedin"),
+            ("db_pool_checked_out", "Connections in use", "checkedout"),
+            ("db_pool_overflow", "Connections open beyond the pool size", "overflow"),
+        ):
+            family = GaugeMetricFamily(metric, documentation, labels=["engine"])
+            for name, pool in self.pools.items():
+                # Only queue pools have a fixed size and overflow
+                if hasattr(pool, method):
+                    family.add_metric([name], getattr(pool, method)())
+            yield family
+
+
+_pool_collector = _PoolCollector()
+REGISTRY.register(_pool_collector)
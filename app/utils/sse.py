@@ -0,0 +1,11 @@
+import json
+
+
+def sse_event(event: str, data) -> str:
+    """
+    Format one server-sent event
+    :param event: The event name
+    :param data: A JSON serializable payload
+    :return the text of the event
+    """
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
@@ -0,0 +1,8 @@
+"""
+Performance benchmarks of the app, run against SQLite or a local Postgres:
+    python -m benchmarks --db sqlite --out results.json
+    python -m benchmarks --db postgresql://postgres@localhost:5432/bench --reset --baseline results.json
+
+The database is filled with seeded synthetic data (see benchmarks.datagen), the LLM is a local stub
+(see benchmarks.stub_ollama). Results are written as JSON and optionally compared with a baseline.
+"""
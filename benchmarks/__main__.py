@@ -0,0 +1,159 @@
+"""
+Run the benchmarks, see benchmarks/__init__.py
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(prog="python -m benchmarks")
+    parser.add_argument(
+        "--db",
+        default="sqlite",
+        help="sqlite (a fresh temporary file) or a database URL (default: sqlite)",
+    )
+    parser.add_argument(
+        "--reset",
+        action="store_true",
+        help="Drop and recreate every table of the database URL first (never implied)",
+    )
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--transactions", type=int, default=2000, help="Per user")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--iterations", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument(
+        "--suite",
+        action="append",
+        choices=["engine", "services", "routes"],
+        help="Suites to run (default: all)",
+    )
+    parser.add_argument(
+        "--llm-latency", type=float, default=0.2, help="Seconds per stub generation"
+    )
+    parser.add_argument("--out", help="Write the results to this JSON file")
+    parser.add_argument("--baseline", help="Compare with the results of a previous run")
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=0.2,
+        help="A p50 this much slower than the baseline is a regression (default: 0.2)",
+    )
+    return parser.parse_args()
+
+
+def _git_revision():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True
+        ).stdout.strip() or None
+    except OSError:
+        return None
+
+
+async def run(args):
+    # Settings are read when the app is imported, so the environment is set up first
+    from benchmarks import stub_ollama
+
+    port = stub_ollama.free_port()
+    if args.db == "sqlite":
+        directory = tempfile.mkdtemp(prefix="benchmarks-")
+        url = f"sqlite+aiosqlite:///{os.path.join(directory, 'bench.db')}"
+    else:
+        url = args.db
+    os.environ["POSTGRES_URL"] = url
+    os.environ["OLLAMA_HOST"] = f"http://127.0.0.1:{port}"
+    os.environ.setdefault("SECRET_KEY", "benchmarks")
+    os.environ.setdefault("MODEL", "benchmark-stub")
+    os.environ.setdefault("LOG_LEVEL", "WARNING")
+
+    from app.db.engine import engine
+    from app.db.db import init_db
+    from app.db.session import session_scope
+    from app.main import app
+    from benchmarks import datagen, suites
+    from benchmarks.harness import compare
+    from sqlmodel import SQLModel
+
+    stub = await stub_ollama.serve(port, args.llm_latency)
+
+    if args.reset:
+        async with engine.begin() as connection:
+            await connection.run_sync(SQLModel.metadata.drop_all)
+    await init_db()
+
+    started = time.perf_counter()
+    async with session_scope() as session:
+        user_ids = await datagen.load(
+            session, users=args.users, transactions=args.transactions, seed=args.seed
+        )
+    load_seconds = time.perf_counter() - started
+    print(
+        f"Loaded {args.users} users x {args.transactions} transactions in {load_seconds:.1f}s",
+        file=sys.stderr,
+    )
+
+    ctx = suites.Context(user_ids, args.iterations, args.concurrency)
+    await ctx.sample()
+
+    selected = args.suite or ["engine", "services", "routes"]
+    results = []
+    # The lifespan creates the LLM client and the insight job workers
+    async with app.router.lifespan_context(app):
+        if "engine" in selected:
+            results += await suites.engine_benchmarks(ctx)
+        if "services" in selected:
+            results += await suites.service_benchmarks(ctx, app.state.llm_client)
+        if "routes" in selected:
+            results += await suites.route_benchmarks(ctx, app)
+
+    stub.should_exit = True
+    await stub.task
+
+    output = {
+        "meta": {
+            "revision": _git_revision(),
+            "python": platform.python_version(),
+            "dialect": engine.dialect.name,
+            "users": args.users,
+            "transactions_per_user": args.transactions,
+            "seed": args.seed,
+            "iterations": args.iterations,
+            "concurrency": args.concurrency,
+            "llm_latency_s": args.llm_latency,
+            "load_seconds": round(load_seconds, 2),
+        },
+        "results": results,
+    }
+
+    if args.baseline:
+        with open(args.baseline) as file:
+            baseline = json.load(file)["results"]
+        output["comparison"] = compare(results, baseline, args.threshold)
+
+    return output
+
+
+def main():
+    args = parse_args()
+    output = asyncio.run(run(args))
+
+    text = json.dumps(output, indent=2)
+    if args.out:
+        with open(args.out, "w") as file:
+            file.write(text)
+    print(text)
+
+    # Non-zero when a benchmark regressed against the baseline
+    return 1 if any(row["regression"] for row in output.get("comparison", [])) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,140 @@
+from app.models.db.user_db import User
+from app.models.db.category_db import Category
+from app.models.db.transaction_db import Transaction
+from app.services.rollup_service import rebuild_rollups
+from app.utils.jwt_handler import get_password_hash
+from sqlmodel import insert
+from sqlmodel.ext.asyncio.session import AsyncSession
+from datetime import datetime, timedelta, timezone
+from uuid import UUID
+import math
+import random
+
+# Every synthetic user logs in with this password
+PASSWORD = "benchmark-password"
+
+# name, type, transactions per month, median amount, spread (sigma of the log amount), merchants
+CATEGORIES = [
+    ("Rent", "expense", 1, 1200.0, 0.05, ["Landlord"]),
+    ("Groceries", "expense", 10, 45.0, 0.5, ["FreshMart", "Green Grocer", "SuperSave"]),
+    ("Restaurants", "expense", 6, 25.0, 0.6, ["Pizza Place", "Sushi Bar", "Burger Joint", "Cafe Luna"]),
+    ("Transport", "expense", 12, 8.0, 0.7, ["Metro", "RideShare", "Gas Station"]),
+    ("Utilities", "expense", 2, 70.0, 0.3, ["City Power", "Water Co"]),
+    ("Entertainment", "expense", 3, 30.0, 0.8, ["Cinema", "Concert Hall", "Game Store"]),
+    ("Shopping", "expense", 3, 60.0, 0.9, ["Online Store", "Mall", "Bookshop"]),
+    ("Health", "expense", 1, 40.0, 0.8, ["Pharmacy", "Clinic"]),
+    ("Travel", "expense", 0.3, 400.0, 0.7, ["Airline", "Hotel"]),
+    ("Subscriptions", "expense", 3, 12.0, 0.3, ["StreamFlix", "MusicBox", "CloudDrive"]),
+    ("Salary", "income", 1, 4000.0, 0.1, ["Employer"]),
+    ("Freelance", "income", 0.5, 600.0, 0.6, ["Client"]),
+]
+
+_WEIGHTS = [frequency for _, _, frequency, _, _, _ in CATEGORIES]
+
+
+def _uuid(rng: random.Random):
+    return UUID(int=rng.getrandbits(128), version=4)
+
+
+def generate_user(index: int, transactions: int, months: int, seed: int, end: datetime):
+    """
+    Generate one user, their categories and their transactions, the same for the same arguments
+    :param index: Number of the user
+    :param transactions: Number of transactions of the user
+    :param months: The transactions are spread over this many months before end
+    :param seed: Seed of the whole data set
+    :param end: The time of the latest possible transaction
+    :return a tuple of (user row, category rows, transaction rows) as dicts
+    """
+    rng = random.Random(seed * 1_000_003 + index)
+    user_id = _uuid(rng)
+    user = {
+        "user_id": user_id,
+        "username": f"bench{index}",
+        "user_email": f"bench{index}@example.com",
+        "is_active": True,
+        "created_at": end,
+    }
+
+    categories = []
+    for name, type, _, _, _, _ in CATEGORIES:
+        categories.append(
+            {
+                "category_id": _uuid(rng),
+                "user_id": user_id,
+                "name": name,
+                "type": type,
+                "created_at": end,
+            }
+        )
+
+    span = timedelta(days=30 * months).total_seconds()
+    rows = []
+    for _ in range(transactions):
+        position = rng.choices(range(len(CATEGORIES)), weights=_WEIGHTS)[0]
+        _, type, _, median, sigma, merchants = CATEGORIES[position]
+        # Amounts are log-normal around the median of the category
+        amount = round(rng.lognormvariate(math.log(median), sigma), 2) or 0.01
+        rows.append(
+            {
+                "transaction_id": _uuid(rng),
+                "user_id": user_id,
+                "category_id": categories[position]["category_id"],
+                "amount": amount,
+                "direction": "in" if type == "income" else "out",
+                "description": rng.choice(merchants),
+                "occurred_at": end - timedelta(seconds=rng.uniform(0, span)),
+                "created_at": end,
+            }
+        )
+
+    return user, categories, rows
+
+
+async def load(
+    session: AsyncSession,
+    users: int,
+    transactions: int,
+    months: int = 12,
+    seed: int = 42,
+    chunk_size: int = 5000,
+):
+    """
+    Generate the data set and load it with multi-row inserts, then build the rollups
+    :param session: A workspace for interacting with db
+    :param users: Number of users
+    :param transactions: Number of transactions per user
+    :param months: The transactions are spread over this many months
+    :param seed: Seed of the data set
+    :param chunk_size: Number of rows per insert
+    :return a list of the user IDs
+    """
+    # Anchored to a fixed month so that a seed always gives the same data
+    end = datetime(2025, 12, 31, 23, 59, tzinfo=timezone.utc)
+    # Hashing once keeps loading fast, every user gets the same password
+    hashed_password = get_password_hash(PASSWORD)
+
+    user_ids, pending = [], []
+
+    async def flush(table, rows):
+        for start in range(0, len(rows), chunk_size):
+            await session.exec(insert(table), params=rows[start : start + chunk_size])
+
+    for index in range(users):
+        user, categories, rows = generate_user(index, transactions, months, seed, end)
+        user["hashed_password"] = hashed_password
+        user_ids.append(user["user_id"])
+
+        await flush(User, [user])
+        await flush(Category, categories)
+        pending.extend(rows)
+        if len(pending) >= chunk_size:
+            await flush(Transaction, pending)
+            pending = []
+
+    await flush(Transaction, pending)
+    await session.commit()
+
+    await rebuild_rollups(session=session)
+
+    return user_ids
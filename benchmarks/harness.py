@@ -0,0 +1,96 @@
+from typing import Awaitable, Callable
+import asyncio
+import statistics
+import time
+
+
+def _percentile(ordered: list[float], fraction: float):
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+async def measure(
+    name: str,
+    call: Callable[[int], Awaitable],
+    iterations: int,
+    concurrency: int = 1,
+    warmup: int | range = 1,
+):
+    """
+    Run a call many times, at most concurrency at once, and time each run
+    :param name: Name of the benchmark in the results
+    :param call: Takes the number of the run and returns an awaitable
+    :param iterations: Number of timed runs
+    :param concurrency: Runs in flight at once
+    :param warmup: Number of untimed runs first (connections, caches of the process),
+        or the range of run numbers to run untimed (to fill a cache the timed runs hit)
+    :return a dict of latency percentiles in milliseconds and throughput
+    """
+    for index in warmup if isinstance(warmup, range) else range(-warmup, 0):
+        await call(index)
+
+    latencies, errors = [], []
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def run(index: int):
+        async with semaphore:
+            started = time.perf_counter()
+            try:
+                await call(index)
+            except Exception as e:
+                errors.append(repr(e))
+                return
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(run(index) for index in range(iterations)))
+    elapsed = time.perf_counter() - started
+
+    result = {
+        "name": name,
+        "iterations": iterations,
+        "concurrency": concurrency,
+        "errors": len(errors),
+        "throughput_per_s": round(len(latencies) / elapsed, 2) if elapsed else None,
+    }
+    if errors:
+        result["first_error"] = errors[0]
+    if latencies:
+        ordered = sorted(latencies)
+        result.update(
+            {
+                "mean_ms": round(statistics.fmean(ordered) * 1000, 3),
+                "p50_ms": round(_percentile(ordered, 0.50) * 1000, 3),
+                "p95_ms": round(_percentile(ordered, 0.95) * 1000, 3),
+                "p99_ms": round(_percentile(ordered, 0.99) * 1000, 3),
+                "max_ms": round(ordered[-1] * 1000, 3),
+            }
+        )
+    return result
+
+
+def compare(results: list[dict], baseline: list[dict], threshold: float):
+    """
+    Compare the p50 latency of each benchmark with a baseline run
+    :param results: Results of this run
+    :param baseline: Results of the baseline run
+    :param threshold: A ratio above 1 + threshold is a regression
+    :return a list of dicts of (name, baseline p50, p50, ratio, regression)
+    """
+    previous = {result["name"]: result for result in baseline}
+    comparison = []
+    for result in results:
+        before = previous.get(result["name"], {}).get("p50_ms")
+        after = result.get("p50_ms")
+        if not before or after is None:
+            continue
+        ratio = after / before
+        comparison.append(
+            {
+                "name": result["name"],
+                "baseline_p50_ms": before,
+                "p50_ms": after,
+                "ratio": round(ratio, 3),
+                "regression": ratio > 1 + threshold,
+            }
+        )
+    return comparison
@@ -0,0 +1,74 @@
+from fastapi import FastAPI, Request
+from fastapi.responses import StreamingResponse
+import asyncio
+import json
+import socket
+import uvicorn
+
+_WORDS = ["Your", " spending", " is", " within", " your", " income", " this", " month", "."]
+
+
+def create_stub(latency: float = 0.2):
+    """
+    A stand-in for the Ollama chat API with a fixed generation time
+    :param latency: Seconds a generation takes, spread over the tokens when streaming
+    :return a FastAPI app
+    """
+    stub = FastAPI()
+    stub.state.calls = 0
+
+    @stub.post("/api/chat")
+    async def chat(request: Request):
+        body = await request.json()
+        stub.state.calls += 1
+        # Roughly what a tokenizer would count
+        prompt_tokens = sum(len(message["content"]) for message in body["messages"]) // 4
+        done = {
+            "model": body["model"],
+            "created_at": "2025-01-01T00:00:00Z",
+            "done": True,
+            "done_reason": "stop",
+            "prompt_eval_count": prompt_tokens,
+            "eval_count": len(_WORDS),
+        }
+
+        if not body.get("stream", True):
+            await asyncio.sleep(latency)
+            return {**done, "message": {"role": "assistant", "content": "".join(_WORDS)}}
+
+        async def chunks():
+            for word in _WORDS:
+                await asyncio.sleep(latency / len(_WORDS))
+                yield json.dumps(
+                    {
+                        "model": body["model"],
+                        "created_at": "2025-01-01T00:00:00Z",
+                        "message": {"role": "assistant", "content": word},
+                        "done": False,
+                    }
+                ) + "\n"
+            yield json.dumps({**done, "message": {"role": "assistant", "content": ""}}) + "\n"
+
+        return StreamingResponse(chunks(), media_type="application/x-ndjson")
+
+    return stub
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+async def serve(port: int, latency: float):
+    """
+    Start the stub on a local port in the running event loop
+    :return the uvicorn server, call should_exit = True to stop it
+    """
+    server = uvicorn.Server(
+        uvicorn.Config(create_stub(latency), host="127.0.0.1", port=port, log_level="warning")
+    )
+    server.task = asyncio.create_task(server.serve())
+    while not server.started:
+        await asyncio.sleep(0.01)
+    return server
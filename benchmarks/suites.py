@@ -0,0 +1,557 @@
+from app.config import settings
+from app.db.session import session_scope
+from app.models.api.transaction import TransactionCreate, TransactionUpdate
+from app.models.db.category_db import Category
+from app.models.db.transaction_db import Transaction
+from app.services.finance import FinanceEngine
+from app.services.anomaly_service import detect_anomalies
+from app.services.recurring_service import detect_recurring, invalidate_recurring
+from app.services.category_service import get_or_create_category_ids
+from app.services.import_service import import_statement, parse_csv
+from app.services.insight_service import get_financial_insight
+from app.services.transaction_service import (
+    add_transaction,
+    add_transactions_bulk,
+    get_list_transactions,
+    get_transaction_read_by_id,
+    remove_transaction,
+    search_transactions,
+    update_transaction_in_db,
+)
+from app.services.user_service import get_cached_user
+from app.utils.jwt_handler import create_backend_token, validate_backend_token
+from benchmarks.datagen import PASSWORD
+from benchmarks.harness import measure
+from sqlmodel import select
+from datetime import datetime, timezone
+import httpx
+import io
+
+# Months covered by the synthetic data (see benchmarks.datagen.load)
+MONTHS = [(2025, month) for month in range(1, 13)]
+
+
+class Context:
+    """
+    What the benchmarks share: the synthetic users and a sample of their rows
+    """
+
+    def __init__(self, user_ids: list, iterations: int, concurrency: int):
+        self.user_ids = user_ids
+        self.iterations = iterations
+        self.concurrency = concurrency
+        # user_id -> a few transaction IDs of the user
+        self.transaction_ids = {}
+        # user_id -> category ID of Groceries
+        self.category_ids = {}
+
+    def user(self, index: int):
+        return self.user_ids[index % len(self.user_ids)]
+
+    def month(self, index: int):
+        return MONTHS[index % len(MONTHS)]
+
+    async def sample(self, per_user: int = 20):
+        async with session_scope() as session:
+            for user_id in self.user_ids:
+                self.transaction_ids[user_id] = (
+                    await session.exec(
+                        select(Transaction.transaction_id)
+                        .where(Transaction.user_id == user_id)
+                        .limit(per_user)
+                    )
+                ).all()
+                self.category_ids[user_id] = (
+                    await session.exec(
+                        select(Category.category_id)
+                        .where(Category.user_id == user_id)
+                        .where(Category.name == "Groceries")
+                    )
+                ).one()
+
+    def transaction_id(self, index: int):
+        ids = self.transaction_ids[self.user(index)]
+        return ids[(index // len(self.user_ids)) % len(ids)]
+
+
+def _statement(lines: int, run: int):
+    rows = ["date,amount,description,category"]
+    rows.extend(
+        f"2025-06-{1 + line % 28:02d},-{10 + line % 90}.{run % 100:02d},Run {run} line {line},Imported"
+        for line in range(lines)
+    )
+    return "\n".join(rows).encode()
+
+
+async def engine_benchmarks(ctx: Context):
+    """
+    FinanceEngine.generate_monthly_report, bypassing the report cache, and get_monthly_report through it
+    """
+
+    async def generate(index):
+        year, month = ctx.month(index)
+        async with session_scope() as session:
+            await FinanceEngine(db=session).generate_monthly_report(
+                user_id=ctx.user(index), month=month, year=year
+            )
+
+    async def cached(index):
+        year, month = ctx.month(index)
+        async with session_scope() as session:
+            await FinanceEngine(db=session).get_monthly_report(
+                user_id=ctx.user(index), month=month, year=year
+            )
+
+    async def trends(index):
+        async with session_scope() as session:
+            await FinanceEngine(db=session).generate_trend_report(
+                user_id=ctx.user(index), months=24, year=2025, month=12
+            )
+
+    async def anomalies(index):
+        async with session_scope() as session:
+            await detect_anomalies(ctx.user(index), session)
+
+    async def recurring(index, rebuild):
+        if rebuild:
+            invalidate_recurring(ctx.user(index))
+        async with session_scope() as session:
+            await detect_recurring(ctx.user(index), session)
+
+    return [
+        await measure("engine.generate_monthly_report", generate, ctx.iterations, 1),
+        await measure(
+            "engine.generate_monthly_report.concurrent",
+            generate,
+            ctx.iterations,
+            ctx.concurrency,
+        ),
+        await measure("engine.get_monthly_report.cached", cached, ctx.iterations, 1),
+        await measure("engine.generate_trend_report.24", trends, ctx.iterations, 1),
+        await measure("engine.detect_anomalies.full_history", anomalies, ctx.iterations, 1),
+        await measure(
+            "engine.detect_recurring.rebuild",
+            lambda index: recurring(index, True),
+            ctx.iterations,
+            1,
+        ),
+        await measure(
+            "engine.detect_recurring.incremental",
+            lambda index: recurring(index, False),
+            ctx.iterations,
+            1,
+            warmup=range(ctx.iterations),
+        ),
+    ]
+
+
+async def service_benchmarks(ctx: Context, llm_client):
+    """
+    One benchmark per service function on the request path
+    """
+    created = []
+
+    async def list_page(index):
+        async with session_scope() as session:
+            await get_list_transactions(user_id=ctx.user(index), session=session, limit=100)
+
+    # Merchant names of benchmarks.datagen, common and rare, whole and started
+    search_queries = ["streamflix", "str", "cafe luna", "airline", "pizza place", "metro"]
+
+    async def search(index):
+        async with session_scope() as session:
+            await search_transactions(
+                user_id=ctx.user(index),
+                session=session,
+                query=search_queries[index % len(search_queries)],
+                limit=100,
+            )
+
+    async def search_filtered(index):
+        async with session_scope() as session:
+            await search_transactions(
+                user_id=ctx.user(index),
+                session=session,
+                direction="out",
+                category_name="Shopping",
+                min_amount=50,
+                limit=100,
+            )
+
+    async def read_one(index):
+        async with session_scope() as session:
+            await get_transaction_read_by_id(
+                transaction_id=ctx.transaction_id(index),
+                user_id=ctx.user(index),
+                session=session,
+            )
+
+    async def add(index):
+        user_id = ctx.user(index)
+        async with session_scope() as session:
+            transaction = await add_transaction(
+                user_id=user_id,
+                category_id=ctx.category_ids[user_id],
+                amount=12.5,
+                direction="out",
+                occurred_at=datetime(2025, 6, 15, tzinfo=timezone.utc),
+                session=session,
+                description="Benchmark",
+            )
+        created.append((user_id, transaction.transaction_id))
+
+    async def bulk(index):
+        items = [
+            TransactionCreate(
+                category_name="Groceries",
+                category_type="expense",
+                amount=5 + item,
+                occurred_at=datetime(2025, 7, 1 + item % 28, tzinfo=timezone.utc),
+                description="Bulk",
+            )
+            for item in range(100)
+        ]
+        async with session_scope() as session:
+            await add_transactions_bulk(user_id=ctx.user(index), items=items, session=session)
+
+    async def update(index):
+        async with session_scope() as session:
+            await update_transaction_in_db(
+                transaction_id=ctx.transaction_id(index),
+                user_id=ctx.user(index),
+                data=TransactionUpdate(amount=20 + index % 50),
+                session=session,
+            )
+
+    async def remove(index):
+        if index < 0:
+            return
+        user_id, transaction_id = created[index % len(created)]
+        async with session_scope() as session:
+            await remove_transaction(
+                transaction_id=transaction_id, user_id=user_id, session=session
+            )
+
+    async def categories(index):
+        async with session_scope() as session:
+            await get_or_create_category_ids(
+                user_id=ctx.user(index),
+                categories={("Groceries", "expense"), (f"New {index}", "expense")},
+                session=session,
+            )
+            await session.commit()
+
+    async def statement(index):
+        async with session_scope() as session:
+            await import_statement(
+                user_id=ctx.user(index),
+                lines=parse_csv(io.BytesIO(_statement(1000, index))),
+                session=session,
+                chunk_size=settings.IMPORT_CHUNK_SIZE,
+            )
+
+    async def insight(index, refresh):
+        year, month = ctx.month(index)
+        async with session_scope() as session:
+            report = await FinanceEngine(db=session).get_monthly_report(
+                user_id=ctx.user(index), month=month, year=year
+            )
+            await get_financial_insight(
+                report=report,
+                session=session,
+                llm_client=llm_client,
+                refresh=refresh,
+                user_id=ctx.user(index),
+            )
+
+    async def user(index):
+        async with session_scope() as session:
+            await get_cached_user(ctx.user(index), session)
+
+    tokens = [create_backend_token(id=str(user_id))["token"] for user_id in ctx.user_ids]
+
+    async def token(index):
+        validate_backend_token(tokens[index % len(tokens)])
+
+    iterations, concurrency = ctx.iterations, ctx.concurrency
+    return [
+        await measure("service.get_list_transactions", list_page, iterations, concurrency),
+        await measure("service.search_transactions.text", search, iterations, concurrency),
+        await measure("service.search_transactions.filters", search_filtered, iterations, concurrency),
+        await measure("service.get_transaction_read_by_id", read_one, iterations, concurrency),
+        await measure("service.add_transaction", add, iterations, concurrency),
+        await measure("service.add_transactions_bulk.100", bulk, max(1, iterations // 10), 1),
+        await measure("service.update_transaction_in_db", update, iterations, concurrency),
+        await measure("service.remove_transaction", remove, len(created) or 1, 1),
+        await measure("service.get_or_create_category_ids", categories, iterations, 1),
+        await measure("service.import_statement.1000", statement, max(1, iterations // 10), 1),
+        await measure(
+            "service.get_financial_insight.generated",
+            lambda index: insight(index, True),
+            max(1, iterations // 10),
+            concurrency,
+        ),
+        await measure(
+            "service.get_financial_insight.cached",
+            lambda index: insight(index, False),
+            iterations,
+            concurrency,
+            warmup=range(iterations),
+        ),
+        await measure("service.get_cached_user", user, iterations, concurrency),
+        await measure("service.validate_backend_token", token, iterations, 1),
+    ]
+
+
+async def route_benchmarks(ctx: Context, app):
+    """
+    End-to-end latency and throughput of every route, driving the ASGI app concurrently
+    """
+    headers = {
+        user_id: {
+            "Authorization": f"Bearer {create_backend_token(id=str(user_id))['token']}"
+        }
+        for user_id in ctx.user_ids
+    }
+    iterations, concurrency = ctx.iterations, ctx.concurrency
+    llm_iterations = max(1, iterations // 10)
+    created = []
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(
+        transport=transport, base_url="http://bench", timeout=None
+    ) as client:
+
+        def get(path, params=None):
+            async def call(index):
+                response = await client.get(
+                    path(index) if callable(path) else path,
+                    params=params(index) if callable(params) else params,
+                    headers=headers[ctx.user(index)],
+                )
+                response.raise_for_status()
+
+            return call
+
+        async def register(index):
+            response = await client.post(
+                "/api/v1/auth/register",
+                json={
+                    "username": f"route{index}",
+                    "user_email": f"route{index}@example.com",
+                    "password": PASSWORD,
+                },
+            )
+            response.raise_for_status()
+
+        async def login(index):
+            response = await client.post(
+                "/api/v1/auth/login",
+                json={"email": f"bench{index % len(ctx.user_ids)}@example.com", "password": PASSWORD},
+            )
+            response.raise_for_status()
+
+        async def create(index):
+            response = await client.post(
+                "/api/v1/transaction",
+                json={
+                    "category_name": "Groceries",
+                    "category_type": "expense",
+                    "amount": 9.99,
+                    "occurred_at": "2025-08-10T12:00:00Z",
+                    "description": "Route",
+                },
+                headers=headers[ctx.user(index)],
+            )
+            response.raise_for_status()
+            created.append((ctx.user(index), response.json()["transaction"]["transaction_id"]))
+
+        async def bulk(index):
+            response = await client.post(
+                "/api/v1/transactions/bulk",
+                json=[
+                    {
+                        "category_name": "Transport",
+                        "category_type": "expense",
+                        "amount": 3 + item,
+                        "occurred_at": "2025-09-01T08:00:00Z",
+                    }
+                    for item in range(100)
+                ],
+                headers=headers[ctx.user(index)],
+            )
+            response.raise_for_status()
+
+        async def upload(index):
+            response = await client.post(
+                "/api/v1/transactions/import",
+                files={"file": ("statement.csv", _statement(1000, 1000 + index), "text/csv")},
+                headers=headers[ctx.user(index)],
+            )
+            response.raise_for_status()
+
+        async def patch(index):
+            response = await client.patch(
+                f"/api/v1/transaction/{ctx.transaction_id(index)}",
+                json={"amount": 30 + index % 20},
+                headers=headers[ctx.user(index)],
+            )
+            response.raise_for_status()
+
+        async def delete(index):
+            if index < 0:
+                return
+            user_id, transaction_id = created[index % len(created)]
+            response = await client.delete(
+                f"/api/v1/transaction/{transaction_id}", headers=headers[user_id]
+            )
+            response.raise_for_status()
+
+        async def stream(index):
+            year, month = ctx.month(index)
+            async with client.stream(
+                "GET",
+                f"/api/v1/finance/insights/summary/{year}/{month}/stream",
+                params={"refresh": "true"},
+                headers=headers[ctx.user(index)],
+            ) as response:
+                response.raise_for_status()
+                async for _ in response.aiter_lines():
+                    pass
+
+        async def job(index):
+            year, month = ctx.month(index)
+            response = await client.post(
+                "/api/v1/finance/insights/jobs",
+                json={"year": year, "month": month, "refresh": True},
+                headers=headers[ctx.user(index)],
+            )
+            response.raise_for_status()
+            response = await client.get(
+                f"/api/v1/finance/insights/jobs/{response.json()['job']['job_id']}",
+                params={"wait": 30},
+                headers=headers[ctx.user(index)],
+            )
+            response.raise_for_status()
+
+        def month_path(prefix):
+            def path(index):
+                year, month = ctx.month(index)
+                return f"{prefix}/{year}/{month}"
+
+            return path
+
+        return [
+            await measure("route.POST /auth/register", register, max(1, iterations // 10), concurrency),
+            await measure("route.POST /auth/login", login, max(1, iterations // 10), concurrency),
+            await measure("route.GET /auth/profile", get("/api/v1/auth/profile"), iterations, concurrency),
+            await measure("route.POST /transaction", create, iterations, concurrency),
+            await measure("route.POST /transactions/bulk", bulk, max(1, iterations // 10), concurrency),
+            await measure("route.POST /transactions/import", upload, max(1, iterations // 10), 1),
+            await measure("route.GET /transactions", get("/api/v1/transactions"), iterations, concurrency),
+            await measure(
+                "route.GET /transactions?stream",
+                get("/api/v1/transactions", params={"stream": "true"}),
+                max(1, iterations // 10),
+                concurrency,
+            ),
+            await measure(
+                "route.GET /transactions/export?format=csv",
+                get("/api/v1/transactions/export", params={"format": "csv"}),
+                max(1, iterations // 10),
+                concurrency,
+            ),
+            await measure(
+                "route.GET /transactions/search?q",
+                get("/api/v1/transactions/search", params={"q": "str", "min_amount": 5}),
+                iterations,
+                concurrency,
+            ),
+            await measure(
+                "route.GET /transaction/{id}",
+                get(lambda index: f"/api/v1/transaction/{ctx.transaction_id(index)}"),
+                iterations,
+                concurrency,
+            ),
+            await measure("route.PATCH /transaction/{id}", patch, iterations, concurrency),
+            await measure("route.DELETE /transaction/{id}", delete, len(created) or 1, concurrency),
+            await measure(
+                "route.GET /finance/report/{year}/{month}",
+                get(month_path("/api/v1/finance/report")),
+                iterations,
+                concurrency,
+            ),
+            await measure(
+                "route.GET /finance/report?granularity=month",
+                get(
+                    "/api/v1/finance/report",
+                    params={"from": "2025-01-01", "to": "2025-12-31", "granularity": "month"},
+                ),
+                iterations,
+                concurrency,
+            ),
+            await measure(
+                "route.GET /finance/report?granularity=day",
+                get(
+                    "/api/v1/finance/report",
+                    params={"from": "2025-01-01", "to": "2025-12-31", "granularity": "day"},
+                ),
+                iterations,
+                concurrency,
+            ),
+            await measure(
+                "route.GET /finance/trends?months=24",
+                get(
+                    "/api/v1/finance/trends",
+                    params={"months": 24, "year": 2025, "month": 12},
+                ),
+                iterations,
+                concurrency,
+            ),
+            await measure(
+                "route.GET /finance/recurring",
+                get("/api/v1/finance/recurring"),
+                iterations,
+                concurrency,
+            ),
+            await measure(
+                "route.GET /finance/anomalies",
+                get("/api/v1/finance/anomalies"),
+                iterations,
+                concurrency,
+            ),
+            await measure(
+                "route.GET /finance/insights/summary/{year}/{month}",
+                get(month_path("/api/v1/finance/insights/summary"), params={"refresh": "true"}),
+                llm_iterations,
+                concurrency,
+            ),
+            await measure(
+                "route.GET /finance/insights/summary/{year}/{month}.cached",
+                get(month_path("/api/v1/finance/insights/summary")),
+                iterations,
+                concurrency,
+                warmup=range(iterations),
+            ),
+            await measure(
+                "route.GET /finance/insights/summary/{year}/{month}/stream",
+                stream,
+                llm_iterations,
+                concurrency,
+            ),
+            await measure("route.POST+GET /finance/insights/jobs", job, llm_iterations, concurrency),
+            await measure(
+                "route.GET /finance/insights/jobs/stats",
+                get("/api/v1/finance/insights/jobs/stats"),
+                iterations,
+                concurrency,
+            ),
+            await measure(
+                "route.GET /finance/insights/llm/stats",
+                get("/api/v1/finance/insights/llm/stats"),
+                iterations,
+                concurrency,
+            ),
+            await measure("route.GET /finance/cache/stats", get("/api/v1/finance/cache/stats"), iterations, concurrency),
+            await measure("route.GET /metrics", get("/metrics"), iterations, 1),
+        ]
@@ -0,0 +1,91 @@
+import os
+import tempfile
+
+# The settings are read when app is imported, a throwaway SQLite database keeps tests self-contained
+os.environ.setdefault(
+    "POSTGRES_URL", f"sqlite+aiosqlite:///{tempfile.mkdtemp()}/test.db"
+)
+os.environ.setdefault("SECRET_KEY", "test-secret-key-of-at-least-32-bytes")
+os.environ.setdefault("MODEL", "test-model")
+os.environ.setdefault("OLLAMA_HOST", "http://127.0.0.1:11434")
+os.environ.setdefault("PASSWORD_HASH_ROUNDS", "4")
+
+import contextlib
+import httpx
+import pytest
+from app.db.db import init_db
+from app.db.engine import engine
+from app.main import app
+from sqlalchemy import event
+
+
+@pytest.fixture(scope="session")
+def anyio_backend():
+    # One event loop for the whole session, pooled connections belong to it
+    return "asyncio"
+
+
+@pytest.fixture(scope="session")
+async def client(anyio_backend):
+    await init_db()
+    async with httpx.AsyncClient(
+        transport=httpx.ASGITransport(app=app), base_url="http://test"
+    ) as client:
+        yield client
+
+
+async def _register(client):
+    """
+    Register a new user and log in
+    :return the authorization headers of the user
+    """
+    email = f"user{os.urandom(4).hex()}@example.com"
+    response = await client.post(
+        "/api/v1/auth/register",
+        json={"username": email.split("@")[0], "user_email": email, "password": "pw"},
+    )
+    assert response.status_code == 201, response.text
+    response = await client.post(
+        "/api/v1/auth/login", json={"email": email, "password": "pw"}
+    )
+    assert response.status_code == 201, response.text
+    return {"Authorization": f"Bearer {response.json()['token']}"}
+
+
+@pytest.fixture
+async def headers(client):
+    """
+    :return the authorization headers of a new user
+    """
+    return await _register(client)
+
+
+@pytest.fixture
+async def other_headers(client):
+    """
+    :return the authorization headers of a second new user
+    """
+    return await _register(client)
+
+
+@pytest.fixture
+def count_queries():
+    """
+    :return a context manager counting the statements sent to the database, it yields a list
+        that holds the executed statements once the block exits
+    """
+
+    @contextlib.contextmanager
+    def count():
+        statements = []
+
+        def before_cursor_execute(conn, cursor, statement, *args):
+            statements.append(statement)
+
+        event.listen(engine.sync_engine, "before_cursor_execute", before_cursor_execute)
+        try:
+            yield statements
+        finally:
+            event.remove(engine.sync_engine, "before_cursor_execute", before_cursor_execute)
+
+    return count
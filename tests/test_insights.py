@@ -0,0 +1,193 @@
+from app.config import settings
+from app.main import app
+from app.models.finance import FinancialReport
+from app.services import anomaly_service
+from app.services.finance import FinanceEngine
+from app.services.insight_jobs import InsightJobQueue
+from app.services.insight_service import insight_key
+from datetime import date, datetime
+from uuid import uuid4
+import asyncio
+import pytest
+
+pytestmark = pytest.mark.anyio
+
+
+class FakeLLMClient:
+    """
+    Answers every prompt at once and keeps the prompts it was given
+    """
+
+    def __init__(self):
+        self.prompts = []
+
+    async def generate(self, messages):
+        self.prompts.append(messages)
+        return f"Insight {len(self.prompts)}"
+
+
+async def test_cached_insight_skips_anomaly_detection(client, headers, count_queries):
+    for day in range(1, 9):
+        response = await client.post(
+            "/api/v1/transaction",
+            json={
+                "category_name": "Groceries",
+                "category_type": "expense",
+                "amount": 500 if day == 8 else 40 + day,
+                "occurred_at": f"2025-01-{day:02d}T12:00:00",
+                "description": "FreshMart",
+            },
+            headers=headers,
+        )
+        assert response.status_code == 201, response.text
+
+    app.state.llm_client = llm_client = FakeLLMClient()
+    path = "/api/v1/finance/insights/summary/2025/1"
+
+    response = await client.get(path, headers=headers)
+    assert response.status_code == 200, response.text
+    assert response.json()["cached"] is False
+    # The month's unusual expense is part of the generated prompt
+    assert "Unusual transactions" in llm_client.prompts[0][1]["content"]
+
+    with count_queries() as statements:
+        response = await client.get(path, headers=headers)
+    assert response.json()["cached"] is True
+    assert response.json()["ai_insight"] == "Insight 1"
+    assert not any("category_amount_histograms" in statement for statement in statements)
+
+    # New expenses in another month move the baselines, not the insight of January
+    response = await client.post(
+        "/api/v1/transaction",
+        json={
+            "category_name": "Groceries",
+            "category_type": "expense",
+            "amount": 45,
+            "occurred_at": "2025-02-01T12:00:00",
+        },
+        headers=headers,
+    )
+    assert response.status_code == 201, response.text
+    response = await client.get(path, headers=headers)
+    assert response.json()["cached"] is True
+    assert len(llm_client.prompts) == 1
+
+
+async def test_cached_insight_is_not_shared_between_users(client, headers, other_headers):
+    # The same month for both users, each has their own unusual expense
+    for user_headers in (headers, other_headers):
+        for day in range(1, 9):
+            response = await client.post(
+                "/api/v1/transaction",
+                json={
+                    "category_name": "Groceries",
+                    "category_type": "expense",
+                    "amount": 500 if day == 8 else 40 + day,
+                    "occurred_at": f"2025-01-{day:02d}T12:00:00",
+                },
+                headers=user_headers,
+            )
+            assert response.status_code == 201, response.text
+
+    app.state.llm_client = llm_client = FakeLLMClient()
+    path = "/api/v1/finance/insights/summary/2025/1"
+
+    first = (await client.get(path, headers=headers)).json()
+    second = (await client.get(path, headers=other_headers)).json()
+    assert first["report"] == second["report"]
+    # The prompt of a user lists their own transactions, its insight is not served to another
+    assert second["cached"] is False
+    assert second["ai_insight"] != first["ai_insight"]
+    assert len(llm_client.prompts) == 2
+
+
+async def test_insight_job_generates_with_anomalies(client, headers):
+    response = await client.post(
+        "/api/v1/transaction",
+        json={
+            "category_name": "Rent",
+            "category_type": "expense",
+            "amount": 1200,
+            "occurred_at": "2025-03-01T12:00:00",
+        },
+        headers=headers,
+    )
+    assert response.status_code == 201, response.text
+
+    llm_client = FakeLLMClient()
+    app.state.insight_jobs = InsightJobQueue(workers=1, maxsize=10, retention=60)
+    await app.state.insight_jobs.start(llm_client)
+    try:
+        response = await client.post(
+            "/api/v1/finance/insights/jobs", json={"year": 2025, "month": 3}, headers=headers
+        )
+        assert response.status_code == 202, response.text
+        response = await client.get(
+            f"/api/v1/finance/insights/jobs/{response.json()['job']['job_id']}",
+            params={"wait": 10},
+            headers=headers,
+        )
+        job = response.json()["job"]
+        assert job["status"] == "succeeded", job["error"]
+        assert job["ai_insight"] == "Insight 1"
+    finally:
+        await app.state.insight_jobs.stop()
+
+
+def test_insight_key_changes_with_the_prompt_categories():
+    report = FinancialReport(
+        period_start=datetime(2025, 1, 1),
+        period_end=datetime(2025, 1, 31),
+        total_income=0,
+        total_expense=0,
+        net_savings=0,
+        top_spending_categories=[],
+    )
+    # A cached insight written for a prompt listing other categories is not reused
+    assert insight_key(report) == insight_key(report, top_n=settings.PROMPT_TOP_CATEGORIES)
+    assert insight_key(report) != insight_key(report, top_n=settings.PROMPT_TOP_CATEGORIES + 1)
+
+
+class SlowLLMClient(FakeLLMClient):
+    async def generate(self, messages):
+        await asyncio.sleep(0.3)
+        return await super().generate(messages)
+
+
+async def test_insight_job_is_kept_for_the_retention_after_it_finishes(client, headers):
+    jobs = InsightJobQueue(workers=1, maxsize=10, retention=0.2)
+    await jobs.start(SlowLLMClient())
+    try:
+        report = FinancialReport(
+            period_start=datetime(2025, 1, 1),
+            period_end=datetime(2025, 1, 31),
+            total_income=0,
+            total_expense=0,
+            net_savings=0,
+            top_spending_categories=[],
+        )
+        user_id = str(uuid4())
+        job = jobs.submit(user_id, 2025, 1, report)
+        # Runs longer than the retention, still pollable
+        await asyncio.sleep(0.25)
+        assert jobs.get(job.job_id, user_id) is job
+        await jobs.wait(job, timeout=10)
+        await asyncio.sleep(0.1)
+        assert jobs.get(job.job_id, user_id) is job
+        await asyncio.sleep(0.15)
+        assert jobs.get(job.job_id, user_id) is None
+    finally:
+        await jobs.stop()
+
+
+async def test_anomalies_of_a_report_without_totals_cover_the_whole_month(monkeypatch):
+    ranges = []
+
+    async def detect_anomalies(user_id, session, start=None, end=None):
+        ranges.append((start, end))
+        return None
+
+    monkeypatch.setattr(anomaly_service, "detect_anomalies", detect_anomalies)
+    report = FinanceEngine(db=None)._empty_report(2, 2024)
+    await anomaly_service.with_anomalies(report, uuid4(), session=None)
+    assert ranges == [(date(2024, 2, 1), date(2024, 2, 29))]
@@ -0,0 +1,25 @@
+from app.utils.lru_cache import LRUCache
+from concurrent.futures import ThreadPoolExecutor
+import sys
+
+
+def test_concurrent_get_and_set_do_not_raise():
+    # Evictions and expiries race with lookups, as with tokens checked on the threadpool
+    cache = LRUCache(maxsize=100)
+
+    def work(worker: int):
+        for index in range(20000):
+            key = (worker * 7 + index) % 150
+            cache.set(key, index, ttl=0 if index % 3 == 0 else 60)
+            cache.get((key + 1) % 150)
+            cache.get(key)
+
+    interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)
+    try:
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            # Re-raises the first exception of a worker
+            list(executor.map(work, range(8)))
+    finally:
+        sys.setswitchinterval(interval)
+    assert len(cache) <= 100
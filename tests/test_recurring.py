@@ -0,0 +1,34 @@
+from app.services.recurring_service import _recurring_states
+from datetime import date, timedelta
+import pytest
+
+pytestmark = pytest.mark.anyio
+
+
+async def test_import_is_picked_up_by_the_next_refresh(client, headers):
+    response = await client.get("/api/v1/finance/recurring", headers=headers)
+    assert response.status_code == 200, response.text
+    assert response.json()["recurring"]["series"] == []
+
+    # As if the last refresh ran long after a slow import started: its rows were created more
+    # than the commit margin before that read, the incremental read alone would miss them
+    profile = (await client.get("/api/v1/auth/profile", headers=headers)).json()
+    state = _recurring_states.get(str(profile["user"]["user_id"]))
+    state.read_at += timedelta(hours=1)
+
+    today = date.today()
+    lines = ["date,amount,description,category"] + [
+        f"{today.replace(day=1) - timedelta(days=30 * months):%Y-%m-%d},-15.99,NETFLIX.COM,Subscriptions"
+        for months in range(6)
+    ]
+    response = await client.post(
+        "/api/v1/transactions/import",
+        files={"file": ("statement.csv", "\n".join(lines).encode(), "text/csv")},
+        headers=headers,
+    )
+    assert response.status_code == 201, response.text
+
+    response = await client.get("/api/v1/finance/recurring", headers=headers)
+    assert [item["description"] for item in response.json()["recurring"]["series"]] == [
+        "NETFLIX.COM"
+    ]
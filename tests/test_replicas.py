@@ -0,0 +1,85 @@
+from app.db.replicas import ReplicaRouter
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import create_async_engine
+import asyncio
+import os
+import pytest
+import tempfile
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture
+async def engines():
+    """
+    A primary and two replicas, each a SQLite file that knows its own name
+    :return a dict of name -> engine
+    """
+    directory = tempfile.mkdtemp()
+    engines = {}
+    for name in ("primary", "replica0", "replica1"):
+        engines[name] = create_async_engine(f"sqlite+aiosqlite:///{directory}/{name}.db")
+        async with engines[name].begin() as connection:
+            await connection.execute(text("CREATE TABLE server (name TEXT)"))
+            await connection.execute(text(f"INSERT INTO server VALUES ('{name}')"))
+    yield engines
+    for engine in engines.values():
+        await engine.dispose()
+
+
+async def _server(engine):
+    async with engine.connect() as connection:
+        return (await connection.execute(text("SELECT name FROM server"))).scalar_one()
+
+
+def _router(engines, sticky_window: float = 60):
+    return ReplicaRouter(
+        engines["primary"], [engines["replica0"], engines["replica1"]], sticky_window
+    )
+
+
+async def test_reads_go_to_the_replicas_in_turn(engines):
+    router = _router(engines)
+    servers = [await _server(router.engine_for()) for _ in range(4)]
+    assert servers == ["replica0", "replica1", "replica0", "replica1"]
+
+
+async def test_unhealthy_replicas_fall_back_to_the_primary(engines):
+    router = _router(engines)
+    # A replica that can't be opened fails its health check
+    router.replicas[1] = create_async_engine(
+        f"sqlite+aiosqlite:///{os.path.join(tempfile.mkdtemp(), 'missing', 'replica1.db')}"
+    )
+    await router.check_health()
+    assert router.healthy == [True, False]
+    assert {await _server(router.engine_for()) for _ in range(4)} == {"replica0"}
+
+    router.replicas[0] = router.replicas[1]
+    await router.check_health()
+    assert router.healthy == [False, False]
+    assert await _server(router.engine_for()) == "primary"
+
+    # A replica that recovers gets reads again
+    router.replicas = [engines["replica0"], engines["replica1"]]
+    await router.check_health()
+    assert router.healthy == [True, True]
+    assert await _server(router.engine_for()) in ("replica0", "replica1")
+
+
+async def test_reads_of_a_writer_stay_on_the_primary_for_the_window(engines):
+    router = _router(engines, sticky_window=0.2)
+    router.mark_write("writer")
+
+    assert await _server(router.engine_for("writer")) == "primary"
+    assert (await _server(router.engine_for("other"))).startswith("replica")
+    assert (await _server(router.engine_for())).startswith("replica")
+
+    await asyncio.sleep(0.25)
+    assert (await _server(router.engine_for("writer"))).startswith("replica")
+
+
+async def test_primary_only_without_replicas(engines):
+    router = ReplicaRouter(engines["primary"], [], sticky_window=60)
+    router.mark_write("writer")
+    assert await _server(router.engine_for()) == "primary"
+    assert await _server(router.engine_for("writer")) == "primary"
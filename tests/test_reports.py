@@ -0,0 +1,93 @@
+from app.db.engine import engine
+from sqlalchemy import text
+from uuid import UUID
+import pytest
+import time
+
+pytestmark = pytest.mark.anyio
+
+
+async def test_range_report_rejects_too_many_buckets_at_once(client, headers):
+    started = time.perf_counter()
+    response = await client.get(
+        "/api/v1/finance/report",
+        params={"from": "0001-01-01", "to": "9999-12-31", "granularity": "day"},
+        headers=headers,
+    )
+    assert response.status_code == 400, response.text
+    # Counted, not listed
+    assert time.perf_counter() - started < 0.5
+
+
+@pytest.mark.parametrize(
+    "granularity, start, buckets",
+    [("day", "9999-12-31", 1), ("week", "9999-12-20", 2), ("month", "9999-11-15", 2)],
+)
+async def test_range_report_at_the_end_of_the_calendar(client, headers, granularity, start, buckets):
+    response = await client.get(
+        "/api/v1/finance/report",
+        params={"from": start, "to": "9999-12-31", "granularity": granularity},
+        headers=headers,
+    )
+    assert response.status_code == 200, response.text
+    reports = response.json()["reports"]
+    assert len(reports) == buckets
+    assert reports[-1]["period_end"].startswith("9999-12-31")
+
+
+async def test_anomalies_up_to_the_last_day_of_the_calendar(client, headers):
+    for day in range(1, 9):
+        response = await client.post(
+            "/api/v1/transaction",
+            json={
+                "category_name": "Groceries",
+                "category_type": "expense",
+                "amount": 500 if day == 8 else 40 + day,
+                "occurred_at": f"2025-01-{day:02d}T12:00:00",
+            },
+            headers=headers,
+        )
+        assert response.status_code == 201, response.text
+
+    response = await client.get(
+        "/api/v1/finance/anomalies",
+        params={"from": "0001-01-01", "to": "9999-12-31"},
+        headers=headers,
+    )
+    assert response.status_code == 200, response.text
+    assert [item["amount"] for item in response.json()["anomalies"]["transactions"]] == [500]
+
+
+@pytest.mark.skipif(
+    engine.dialect.name != "sqlite", reason="needs a rollup row without its category"
+)
+async def test_monthly_report_keeps_amounts_of_a_missing_category(client, headers):
+    for category, amount in (("Groceries", 40), ("Travel", 300)):
+        response = await client.post(
+            "/api/v1/transaction",
+            json={
+                "category_name": category,
+                "category_type": "expense",
+                "amount": amount,
+                "occurred_at": "2025-08-10T12:00:00",
+            },
+            headers=headers,
+        )
+        assert response.status_code == 201, response.text
+    category_id = response.json()["transaction"]["category_id"]
+
+    # SQLite does not enforce the foreign keys, the category row can go away
+    async with engine.begin() as connection:
+        await connection.execute(
+            text("DELETE FROM categories WHERE category_id = :category_id"),
+            {"category_id": UUID(category_id).hex},
+        )
+
+    response = await client.get("/api/v1/finance/report/2025/8", headers=headers)
+    assert response.status_code == 200, response.text
+    report = response.json()["report"]
+    assert float(report["total_expense"]) == 340
+    assert [item["category"] for item in report["top_spending_categories"]] == [
+        "Uncategorized",
+        "Groceries",
+    ]
@@ -0,0 +1,213 @@
+from app.db.db import init_db
+from app.db.engine import engine
+from app.db.session import session_scope
+from app.services.rollup_service import verify_rollups
+from uuid import UUID
+import asyncio
+import gzip
+import pytest
+
+pytestmark = pytest.mark.anyio
+
+
+async def _create(client, headers, count: int):
+    for index in range(count):
+        response = await client.post(
+            "/api/v1/transaction",
+            json={
+                "category_name": f"Category {index % 5}",
+                "category_type": "expense",
+                "amount": 10 + index,
+                "occurred_at": f"2025-01-{1 + index % 28:02d}T12:00:00",
+                "description": f"Transaction {index}",
+            },
+            headers=headers,
+        )
+        assert response.status_code == 201, response.text
+
+
+async def test_list_transactions_query_count_is_constant(client, headers, count_queries):
+    await _create(client, headers, 1)
+    # Untimed first call, per-process caches (user, token) are filled
+    assert (await client.get("/api/v1/transactions", headers=headers)).status_code == 200
+
+    with count_queries() as one:
+        response = await client.get("/api/v1/transactions", headers=headers)
+    assert len(response.json()["transactions"]) == 1
+
+    await _create(client, headers, 24)
+    with count_queries() as many:
+        response = await client.get("/api/v1/transactions", headers=headers)
+    assert len(response.json()["transactions"]) == 25
+
+    assert one
+    # Categories come with the transactions in the same query, not one query per row
+    assert len(many) == len(one)
+
+
+async def test_bulk_with_many_rollup_and_histogram_keys(client, headers):
+    # Thousands of (category, month) rollup keys and (category, amount bucket) histogram keys,
+    # more rows than a single multi-row upsert can bind
+    items = [
+        {
+            "category_name": f"Category {index % 30}",
+            "category_type": "expense",
+            "amount": round(0.5 * 1.05 ** (index // 30), 2),
+            "occurred_at": f"{2000 + index // 30 % 240 // 12}-{1 + index // 30 % 12:02d}-15T12:00:00",
+        }
+        for index in range(10000)
+    ]
+    response = await client.post("/api/v1/transactions/bulk", json=items, headers=headers)
+    assert response.status_code == 201, response.text
+    assert response.json()["created"] == len(items)
+
+
+async def test_bulk_with_many_new_categories(client, headers):
+    # Every item creates its own category
+    items = [
+        {
+            "category_name": f"Merchant {index}",
+            "category_type": "expense",
+            "amount": 12.5,
+            "occurred_at": "2025-03-15T12:00:00",
+        }
+        for index in range(7000)
+    ]
+    response = await client.post("/api/v1/transactions/bulk", json=items, headers=headers)
+    assert response.status_code == 201, response.text
+    assert response.json()["created"] == len(items)
+
+
+async def _month_expense(client, headers, year: int, month: int):
+    response = await client.get(f"/api/v1/finance/report/{year}/{month}", headers=headers)
+    assert response.status_code == 200, response.text
+    report = response.json()["report"]
+    return float(report["total_expense"]), sum(
+        category["count"] for category in report["top_spending_categories"]
+    )
+
+
+async def _create_one(client, headers, amount: float, occurred_at: str):
+    response = await client.post(
+        "/api/v1/transaction",
+        json={
+            "category_name": "Groceries",
+            "category_type": "expense",
+            "amount": amount,
+            "occurred_at": occurred_at,
+        },
+        headers=headers,
+    )
+    assert response.status_code == 201, response.text
+    return response.json()["transaction"]["transaction_id"]
+
+
+async def test_concurrent_removals_update_rollups_once(client, headers):
+    await _create_one(client, headers, 10, "2025-04-02T12:00:00")
+    transaction_id = await _create_one(client, headers, 100, "2025-04-03T12:00:00")
+
+    responses = await asyncio.gather(
+        *(
+            client.delete(f"/api/v1/transaction/{transaction_id}", headers=headers)
+            for _ in range(4)
+        )
+    )
+    assert [response.status_code for response in responses].count(200) == 1
+    assert await _month_expense(client, headers, 2025, 4) == (10.0, 1)
+
+
+@pytest.mark.skipif(engine.dialect.name == "sqlite", reason="SQLite does not lock rows")
+async def test_concurrent_updates_update_rollups_once(client, headers):
+    transaction_id = await _create_one(client, headers, 100, "2025-05-03T12:00:00")
+
+    responses = await asyncio.gather(
+        *(
+            client.patch(
+                f"/api/v1/transaction/{transaction_id}",
+                json={"amount": amount},
+                headers=headers,
+            )
+            for amount in (20, 30, 40, 50)
+        )
+    )
+    assert all(response.status_code == 200 for response in responses)
+    response = await client.get(f"/api/v1/transaction/{transaction_id}", headers=headers)
+    amount = response.json()["transaction"]["amount"]
+    assert await _month_expense(client, headers, 2025, 5) == (amount, 1)
+
+
+async def test_search_index_is_created_for_an_existing_database(client, headers):
+    # A database created before search existed: transactions without the search index
+    async with engine.begin() as connection:
+        if engine.dialect.name == "sqlite":
+            await connection.exec_driver_sql("DROP TABLE transactions_fts")
+            for trigger in ("insert", "delete", "update"):
+                await connection.exec_driver_sql(f"DROP TRIGGER transactions_fts_{trigger}")
+        else:
+            await connection.exec_driver_sql("DROP INDEX ix_transactions_description_search")
+    response = await client.post(
+        "/api/v1/transaction",
+        json={
+            "category_name": "Subscriptions",
+            "category_type": "expense",
+            "amount": 9.99,
+            "occurred_at": "2025-03-01T12:00:00",
+            "description": "NETFLIX.COM",
+        },
+        headers=headers,
+    )
+    assert response.status_code == 201, response.text
+
+    # Startup creates it again, twice is a no-op, existing rows are searchable
+    await init_db()
+    await init_db()
+    response = await client.get(
+        "/api/v1/transactions/search", params={"q": "netfl"}, headers=headers
+    )
+    assert response.status_code == 200, response.text
+    assert [row["description"] for row in response.json()["transactions"]] == ["NETFLIX.COM"]
+
+
+async def test_search_up_to_the_last_day_of_the_calendar(client, headers):
+    await _create(client, headers, 1)
+    response = await client.get(
+        "/api/v1/transactions/search",
+        params={"q": "transaction", "from": "0001-01-01", "to": "9999-12-31"},
+        headers=headers,
+    )
+    assert response.status_code == 200, response.text
+    assert len(response.json()["transactions"]) == 1
+
+
+async def test_export_up_to_the_last_day_of_the_calendar(client, headers):
+    await _create(client, headers, 1)
+    response = await client.get(
+        "/api/v1/transactions/export",
+        params={"format": "csv", "from": "0001-01-01", "to": "9999-12-31"},
+        headers=headers,
+    )
+    assert response.status_code == 200, response.text
+    assert "Transaction 0" in gzip.decompress(response.content).decode()
+
+
+async def test_rollups_match_the_transactions_after_updates_and_removals(client, headers):
+    ids = [
+        await _create_one(client, headers, 10 + index, f"2025-06-{1 + index:02d}T12:00:00")
+        for index in range(6)
+    ]
+    for data in (
+        {"amount": 99.5},
+        {"occurred_at": "2025-07-15T12:00:00"},
+        {"category_name": "Rent", "category_type": "expense"},
+        {"category_name": "Salary", "category_type": "income", "amount": 2000},
+    ):
+        response = await client.patch(
+            f"/api/v1/transaction/{ids.pop()}", json=data, headers=headers
+        )
+        assert response.status_code == 200, response.text
+    response = await client.delete(f"/api/v1/transaction/{ids.pop()}", headers=headers)
+    assert response.status_code == 200, response.text
+
+    profile = (await client.get("/api/v1/auth/profile", headers=headers)).json()
+    async with session_scope() as session:
+        assert await verify_rollups(session, user_id=UUID(profile["user"]["user_id"])) == []